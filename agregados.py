@@ -0,0 +1,167 @@
+import argparse
+import math
+from datetime import datetime
+
+from sqlalchemy import event, select, func, case, delete, insert, and_, or_, tuple_, inspect
+from sqlalchemy.orm import sessionmaker
+
+from crear_base_datos import Evaluacion, Materia, AgregadoAlumnoMateria, AgregadoAlumno
+
+# --- AGREGADOS DE NOTAS ---
+# Las tablas agregados_alumno_materia y agregados_alumno guardan, ya calculados,
+# cantidad, suma, suma de cuadrados, mínimo, máximo, última nota y cantidad de notas bajas.
+# Se actualizan solos con cada Evaluacion que se inserta, modifica o borra desde el ORM
+# (los eventos de abajo se registran al importar este módulo). Las escrituras masivas
+# que no pasan por el ORM tienen que llamar a recalcular() con los pares tocados.
+# Si algo queda desparejo: python agregados.py --reconstruir
+
+NOTA_BAJA = 6
+CAMPOS = ["cantidad", "suma", "suma_cuadrados", "minimo", "maximo", "bajas", "ultima_nota", "ultima_fecha", "ultima_id"]
+
+
+# --- CÁLCULO COMPLETO (para recalcular un grupo o reconstruir todo) ---
+def _select_por_materia(condicion=None):
+    e = Evaluacion.__table__.alias("e"); e2 = Evaluacion.__table__.alias("e2")
+    ultima = select(e2.c.nota, e2.c.id).where(e2.c.alumno_id == e.c.alumno_id, e2.c.materia_id == e.c.materia_id, e2.c.nota.isnot(None)) \
+        .order_by(e2.c.fecha.desc(), e2.c.id.desc()).limit(1)
+    q = select(
+        e.c.alumno_id, e.c.materia_id, func.count(e.c.nota), func.sum(e.c.nota), func.sum(e.c.nota * e.c.nota),
+        func.min(e.c.nota), func.max(e.c.nota), func.sum(case((e.c.nota < NOTA_BAJA, 1), else_=0)),
+        ultima.with_only_columns(e2.c.nota).scalar_subquery(), func.max(e.c.fecha), ultima.with_only_columns(e2.c.id).scalar_subquery(),
+    ).where(e.c.nota.isnot(None), e.c.alumno_id.isnot(None), e.c.materia_id.isnot(None)).group_by(e.c.alumno_id, e.c.materia_id)
+    return q.where(condicion(e)) if condicion is not None else q
+
+
+def _select_por_alumno(condicion=None):
+    t = AgregadoAlumnoMateria.__table__.alias("t"); t2 = AgregadoAlumnoMateria.__table__.alias("t2")
+    ultima = select(t2.c.ultima_nota, t2.c.ultima_id).where(t2.c.alumno_id == t.c.alumno_id).order_by(t2.c.ultima_fecha.desc(), t2.c.ultima_id.desc()).limit(1)
+    q = select(
+        t.c.alumno_id, func.sum(t.c.cantidad), func.sum(t.c.suma), func.sum(t.c.suma_cuadrados), func.min(t.c.minimo), func.max(t.c.maximo),
+        func.sum(t.c.bajas), ultima.with_only_columns(t2.c.ultima_nota).scalar_subquery(), func.max(t.c.ultima_fecha), ultima.with_only_columns(t2.c.ultima_id).scalar_subquery(),
+    ).group_by(t.c.alumno_id)
+    return q.where(condicion(t)) if condicion is not None else q
+
+
+def recalcular(conn, pares, tamano_bloque=500):
+    # Vuelve a calcular desde cero los grupos (alumno_id, materia_id) indicados y sus alumnos.
+    # Sirve para conn = session.connection() o la conexión que reciben los eventos.
+    pares = [p for p in set(pares) if p[0] is not None and p[1] is not None]
+    for i in range(0, len(pares), tamano_bloque):
+        bloque = pares[i:i + tamano_bloque]
+        alumnos = list({a for a, _ in bloque})
+        conn.execute(delete(AgregadoAlumnoMateria).where(tuple_(AgregadoAlumnoMateria.alumno_id, AgregadoAlumnoMateria.materia_id).in_(bloque)))
+        conn.execute(insert(AgregadoAlumnoMateria).from_select(["alumno_id", "materia_id"] + CAMPOS,
+                                                               _select_por_materia(lambda e: tuple_(e.c.alumno_id, e.c.materia_id).in_(bloque))))
+        conn.execute(delete(AgregadoAlumno).where(AgregadoAlumno.alumno_id.in_(alumnos)))
+        conn.execute(insert(AgregadoAlumno).from_select(["alumno_id"] + CAMPOS, _select_por_alumno(lambda t: t.c.alumno_id.in_(alumnos))))
+
+
+def borrar_de_alumno(conn, alumno_id):
+    conn.execute(delete(AgregadoAlumnoMateria).where(AgregadoAlumnoMateria.alumno_id == alumno_id))
+    conn.execute(delete(AgregadoAlumno).where(AgregadoAlumno.alumno_id == alumno_id))
+
+
+def reconstruir_agregados(session):
+    conn = session.connection()
+    conn.execute(delete(AgregadoAlumno)); conn.execute(delete(AgregadoAlumnoMateria))
+    conn.execute(insert(AgregadoAlumnoMateria).from_select(["alumno_id", "materia_id"] + CAMPOS, _select_por_materia()))
+    conn.execute(insert(AgregadoAlumno).from_select(["alumno_id"] + CAMPOS, _select_por_alumno()))
+    session.commit()
+
+
+def asegurar_agregados(session):
+    # Base que ya tenía notas antes de existir estas tablas: se llenan una vez
+    if session.query(AgregadoAlumno.alumno_id).first() is None and session.query(Evaluacion.id).filter(Evaluacion.nota.isnot(None)).first() is not None:
+        reconstruir_agregados(session)
+
+
+# --- ACTUALIZACIÓN INCREMENTAL (una nota nueva se suma sin leer las demás) ---
+def _sumar(conn, modelo, claves, nota, fecha, ev_id):
+    dialecto = conn.dialect.name
+    if dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+    elif dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+    else:
+        return False
+    t = modelo.__table__
+    stmt = insert_dialecto(t).values(**claves, cantidad=1, suma=nota, suma_cuadrados=nota * nota, minimo=nota, maximo=nota,
+                                     bajas=int(nota < NOTA_BAJA), ultima_nota=nota, ultima_fecha=fecha, ultima_id=ev_id)
+    nueva = stmt.excluded
+    es_ultima = or_(t.c.ultima_fecha.is_(None), nueva.ultima_fecha > t.c.ultima_fecha,
+                    and_(nueva.ultima_fecha == t.c.ultima_fecha, nueva.ultima_id > t.c.ultima_id))
+    conn.execute(stmt.on_conflict_do_update(index_elements=list(claves), set_={
+        "cantidad": t.c.cantidad + 1,
+        "suma": t.c.suma + nueva.suma,
+        "suma_cuadrados": t.c.suma_cuadrados + nueva.suma_cuadrados,
+        "minimo": case((or_(t.c.minimo.is_(None), nueva.minimo < t.c.minimo), nueva.minimo), else_=t.c.minimo),
+        "maximo": case((or_(t.c.maximo.is_(None), nueva.maximo > t.c.maximo), nueva.maximo), else_=t.c.maximo),
+        "bajas": t.c.bajas + nueva.bajas,
+        "ultima_nota": case((es_ultima, nueva.ultima_nota), else_=t.c.ultima_nota),
+        "ultima_fecha": case((es_ultima, nueva.ultima_fecha), else_=t.c.ultima_fecha),
+        "ultima_id": case((es_ultima, nueva.ultima_id), else_=t.c.ultima_id),
+    }))
+    return True
+
+
+@event.listens_for(Evaluacion, "after_insert")
+def _al_insertar(mapper, connection, ev):
+    if ev.nota is None or ev.alumno_id is None or ev.materia_id is None:
+        return
+    fecha = ev.fecha.date() if isinstance(ev.fecha, datetime) else ev.fecha
+    if not (_sumar(connection, AgregadoAlumnoMateria, {"alumno_id": ev.alumno_id, "materia_id": ev.materia_id}, ev.nota, fecha, ev.id)
+            and _sumar(connection, AgregadoAlumno, {"alumno_id": ev.alumno_id}, ev.nota, fecha, ev.id)):
+        recalcular(connection, [(ev.alumno_id, ev.materia_id)])
+
+
+@event.listens_for(Evaluacion, "after_update")
+def _al_actualizar(mapper, connection, ev):
+    # Mínimo, máximo y última nota no se pueden "restar": se recalculan los grupos viejo y nuevo
+    estado = inspect(ev)
+    if not any(estado.attrs[c].history.has_changes() for c in ("nota", "fecha", "alumno_id", "materia_id")):
+        return
+    def anterior(campo):
+        h = estado.attrs[campo].history
+        return h.deleted[0] if h.deleted else getattr(ev, campo)
+    recalcular(connection, [(anterior("alumno_id"), anterior("materia_id")), (ev.alumno_id, ev.materia_id)])
+
+
+@event.listens_for(Evaluacion, "after_delete")
+def _al_borrar(mapper, connection, ev):
+    recalcular(connection, [(ev.alumno_id, ev.materia_id)])
+
+
+# --- LECTURAS (una fila, sin importar cuántas notas haya) ---
+def promedio_y_desvio(fila):
+    if not fila or not fila.cantidad:
+        return 0.0, 0.0
+    promedio = fila.suma / fila.cantidad
+    varianza = max(fila.suma_cuadrados / fila.cantidad - promedio * promedio, 0.0)
+    return promedio, math.sqrt(varianza)
+
+
+def en_riesgo(fila):
+    return bool(fila and fila.cantidad and (fila.suma / fila.cantidad < NOTA_BAJA or (fila.ultima_nota is not None and fila.ultima_nota < NOTA_BAJA)))
+
+
+def agregado_alumno(session, alumno_id):
+    return session.get(AgregadoAlumno, alumno_id)
+
+
+def agregados_por_materia(session, alumno_id):
+    return session.query(Materia.nombre, AgregadoAlumnoMateria).join(Materia, Materia.id == AgregadoAlumnoMateria.materia_id) \
+        .filter(AgregadoAlumnoMateria.alumno_id == alumno_id).order_by(Materia.nombre).all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento de los agregados de notas")
+    parser.add_argument("--reconstruir", action="store_true", help="Borrar y recalcular todos los agregados desde evaluaciones")
+    args = parser.parse_args()
+    from config_db import crear_engine
+    Session = sessionmaker(bind=crear_engine())
+    with Session() as session:
+        if args.reconstruir:
+            reconstruir_agregados(session)
+            print(f"✅ Agregados reconstruidos: {session.query(AgregadoAlumno).count()} alumnos.")
+        else:
+            parser.print_help()
@@ -0,0 +1,119 @@
+import hashlib
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+# --- AGRUPAR RESPUESTAS ANTES DE CORREGIR ---
+# En los exportes de Google Forms muchas respuestas son iguales o casi iguales (opciones
+# de multiple choice, "no sé", en blanco, la misma frase con otra puntuación). Por cada
+# pregunta se agrupan las respuestas y la IA corrige una sola por grupo.
+#   1) Se normaliza el texto (minúsculas, sin tildes ni signos, espacios simples)
+#   2) Iguales después de normalizar -> mismo grupo
+#   3) Casi iguales: MinHash sobre trigramas de caracteres + LSH por bandas, y se
+#      confirma con la similitud de Jaccard real (>= UMBRAL_SIMILITUD). Dos respuestas
+#      con distintos números o distinta negación nunca se juntan ("1914" / "1915",
+#      "produce oxígeno" / "no produce oxígeno"): ahí la diferencia es la respuesta.
+
+UMBRAL_SIMILITUD = 0.8
+LARGO_MINIMO_SIMILAR = 12       # Respuestas más cortas solo se agrupan si son idénticas ("1990" y "1991" no)
+PERMUTACIONES = 64
+BANDAS = 16                     # 16 bandas de 4 filas: con Jaccard 0.8 casi siempre caen juntas
+SIN_RESPUESTA = ""
+NEGACIONES = {"no", "ni", "nunca", "jamas", "tampoco", "sin", "nada", "ningun", "ninguna", "ninguno"}
+VACIAS = {"", "no se", "nose", "ns", "nc", "no lo se", "no sabe", "no contesta", "sin respuesta", "nan", "none", "-", "x"}
+_PRIMO = (1 << 61) - 1
+_azar = np.random.default_rng(20240301)  # Fijo: los mismos datos dan siempre los mismos grupos
+_A = _azar.integers(1, _PRIMO, PERMUTACIONES, dtype=np.uint64)
+_B = _azar.integers(0, _PRIMO, PERMUTACIONES, dtype=np.uint64)
+
+
+def normalizar_respuesta(texto):
+    texto = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode("ascii").lower()
+    texto = " ".join(re.sub(r"[^\w\s]", " ", texto).split())
+    return SIN_RESPUESTA if texto in VACIAS else texto
+
+
+def clave_grupo(pregunta, normalizada):
+    return hashlib.sha1(f"{pregunta}\0{normalizada}".encode("utf-8")).hexdigest()
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(max(1, len(texto) - 2))}
+
+
+def _firma(trigramas):
+    valores = np.array([zlib.crc32(t.encode("utf-8")) for t in trigramas], dtype=np.uint64)
+    # (a*x + b) mod p, con x < 2^32 y a, b < 2^61: se hace en Python para no desbordar uint64
+    return [min((int(a) * int(x) + int(b)) % _PRIMO for x in valores) for a, b in zip(_A, _B)]
+
+
+def _lo_que_no_puede_cambiar(texto):
+    palabras = texto.split()
+    return tuple(p for p in palabras if p.isdigit()), sum(p in NEGACIONES for p in palabras)
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def agrupar(respuestas, umbral=UMBRAL_SIMILITUD):
+    # respuestas: lista de textos. Devuelve una lista paralela con el índice de la respuesta
+    # que representa a cada grupo (la forma más repetida del grupo).
+    normalizadas = [normalizar_respuesta(r) for r in respuestas]
+    unicas = list(dict.fromkeys(normalizadas))
+    padre = list(range(len(unicas)))
+
+    def raiz(i):
+        while padre[i] != i:
+            padre[i] = padre[padre[i]]; i = padre[i]
+        return i
+
+    largas = [i for i, t in enumerate(unicas) if len(t) >= LARGO_MINIMO_SIMILAR]
+    trigramas = {i: _trigramas(unicas[i]) for i in largas}
+    criticos = {i: _lo_que_no_puede_cambiar(unicas[i]) for i in largas}
+    cubetas = {}
+    filas_banda = PERMUTACIONES // BANDAS
+    for i in largas:
+        firma = _firma(trigramas[i])
+        for banda in range(BANDAS):
+            cubetas.setdefault((banda, tuple(firma[banda * filas_banda:(banda + 1) * filas_banda])), []).append(i)
+    for candidatos in cubetas.values():
+        for j in candidatos[1:]:
+            a, b = raiz(candidatos[0]), raiz(j)
+            if a != b and criticos[candidatos[0]] == criticos[j] and _jaccard(trigramas[candidatos[0]], trigramas[j]) >= umbral:
+                padre[b] = a
+
+    # Representante de cada grupo: la respuesta original más repetida
+    indice_unica = {t: i for i, t in enumerate(unicas)}
+    grupo_de = [raiz(indice_unica[t]) for t in normalizadas]
+    conteo = {}
+    for n, (g, t) in enumerate(zip(grupo_de, normalizadas)):
+        conteo.setdefault(g, {}).setdefault(t, []).append(n)
+    representante = {g: max(formas.values(), key=len)[0] for g, formas in conteo.items()}
+    return [representante[g] for g in grupo_de]
+
+
+def agrupar_examen(preguntas, filas):
+    # filas: [{pregunta: respuesta}] de los alumnos a corregir.
+    # Devuelve (claves, grupos, resumen):
+    #   claves: por fila, {pregunta: clave del grupo}
+    #   grupos: {clave: {"pregunta", "texto" (representante), "miembros", "vacia"}}
+    claves = [{} for _ in filas]
+    grupos = {}
+    for pregunta in preguntas:
+        textos = [f.get(pregunta, "") for f in filas]
+        representantes = agrupar(textos)
+        for n, rep in enumerate(representantes):
+            normalizada = normalizar_respuesta(textos[rep])
+            clave = clave_grupo(pregunta, normalizada)
+            claves[n][pregunta] = clave
+            grupo = grupos.setdefault(clave, {"pregunta": pregunta, "texto": textos[rep], "miembros": 0, "vacia": normalizada == SIN_RESPUESTA})
+            grupo["miembros"] += 1
+    total = len(filas) * len(preguntas)
+    a_corregir = sum(1 for g in grupos.values() if not g["vacia"])
+    resumen = {"respuestas": total, "grupos": len(grupos), "a_corregir": a_corregir,
+               "en_blanco": sum(g["miembros"] for g in grupos.values() if g["vacia"]),
+               "reduccion": round(1 - a_corregir / total, 4) if total else 0.0}
+    return claves, grupos, resumen
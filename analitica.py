@@ -0,0 +1,191 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, literal_column
+
+from crear_base_datos import Alumno, Materia, Evaluacion
+from agregados import NOTA_BAJA
+
+# --- ANALÍTICA DE COHORTES ---
+# Para un año, una materia y/o una instancia: UNA consulta trae las notas como números
+# (alumno, materia, nota, día, id) y todo lo demás se calcula con NumPy sobre columnas,
+# sin objetos del ORM ni un for por fila:
+#   - distribución de notas y percentiles
+#   - por alumno: promedio, desvío, pendiente (tendencia en puntos por mes), última nota
+#   - z-score de cada alumno contra su curso, materia por materia
+#   - ranking de riesgo (alerta temprana)
+# Leer millones de filas desde Python lleva segundos (es el driver, no el cálculo): el dashboard
+# carga las notas de toda la escuela una vez por versión de evaluaciones (notas_escuela) y después
+# cada año/materia se filtra sobre esos arrays en memoria (filtrar). La instancia sí va a la base.
+
+DIAS_POR_MES = 30.44
+MINIMO_TENDENCIA = 3   # Con menos notas la pendiente no dice nada
+# Peso de cada señal en el puntaje de riesgo (0 a 1). Cada señal ya está llevada a 0..1.
+PESOS_RIESGO = {"z": 0.4, "bajas": 0.3, "caida": 0.2, "ultima_baja": 0.1}
+Z_TOPE = 2.0       # z = -2 (o menos) cuenta como señal completa
+CAIDA_TOPE = 1.0   # Perder 1 punto por mes (o más) cuenta como señal completa
+
+
+# --- PASO 1: UNA CONSULTA, COLUMNAS NUMÉRICAS ---
+def _dias(dialecto):
+    # Fecha como número de días desde 1970, calculado en la base (más rápido que convertir fechas en Python)
+    # (-1 si no tiene fecha, así todas las columnas son números y se cargan de una)
+    if dialecto == "sqlite":
+        return literal_column("coalesce(julianday(evaluaciones.fecha) - 2440587.5, -1)")
+    if dialecto == "postgresql":
+        return literal_column("coalesce(evaluaciones.fecha - DATE '1970-01-01', -1)")
+    return None
+
+
+def cargar_notas(session, año=None, materia_id=None, instancia=None):
+    # Devuelve {"alumno", "materia", "nota", "dias", "id"} como arrays de NumPy (float64)
+    dialecto = session.get_bind().dialect.name
+    dias = _dias(dialecto)
+    q = select(Evaluacion.alumno_id, Evaluacion.materia_id, Evaluacion.nota, dias if dias is not None else Evaluacion.fecha, Evaluacion.id) \
+        .where(Evaluacion.nota.isnot(None), Evaluacion.alumno_id.isnot(None), Evaluacion.materia_id.isnot(None))
+    if año is not None:
+        q = q.join(Alumno, Alumno.id == Evaluacion.alumno_id).where(Alumno.año_escolar == año)
+    if materia_id is not None:
+        q = q.where(Evaluacion.materia_id == materia_id)
+    if instancia:
+        q = q.where(Evaluacion.instancia == instancia)
+    # Las filas se leen directo del cursor: armar un Row de SQLAlchemy por nota cuesta más que la consulta
+    resultado = session.connection().execute(q)
+    filas = resultado.cursor.fetchall(); resultado.close()
+    if dias is None:
+        fechas = pd.to_datetime(pd.Series([f[3] for f in filas], dtype=object), errors="coerce")
+        dias_py = (fechas - pd.Timestamp("1970-01-01")).dt.days.fillna(-1).astype(float)
+        filas = [(a, m, n, d, i) for (a, m, n, _, i), d in zip(filas, dias_py)]
+    # fromiter sobre las tuplas aplanadas: una sola pasada, sin DataFrame intermedio
+    cols = np.fromiter(itertools.chain.from_iterable(filas), dtype=float, count=5 * len(filas)).reshape(-1, 5)
+    dias = cols[:, 3].copy(); dias[dias < 0] = np.nan
+    return {"alumno": cols[:, 0].astype(np.int64), "materia": cols[:, 1].astype(np.int64), "nota": cols[:, 2], "dias": dias, "id": cols[:, 4]}
+
+
+def años_por_alumno(session):
+    # Array indexado por alumno_id con su año (-1 si no tiene): para filtrar por año sin otro JOIN
+    filas = session.execute(select(Alumno.id, Alumno.año_escolar)).all()
+    años = np.full(max((f[0] for f in filas), default=0) + 1, -1, dtype=np.int64)
+    for a_id, año in filas:
+        if año is not None: años[a_id] = año
+    return años
+
+
+def notas_escuela(session):
+    # Todas las notas + el año de cada alumno: se carga una vez y se filtra muchas
+    return cargar_notas(session), años_por_alumno(session)
+
+
+def filtrar(datos, años, año=None, materia_id=None):
+    mascara = np.ones(len(datos["nota"]), dtype=bool)
+    if año is not None:
+        dentro = datos["alumno"] < len(años)
+        mascara &= dentro & (años[np.where(dentro, datos["alumno"], 0)] == año)
+    if materia_id is not None:
+        mascara &= datos["materia"] == materia_id
+    return datos if mascara.all() else {k: v[mascara] for k, v in datos.items()}
+
+
+# --- PASO 2: CÁLCULOS VECTORIZADOS ---
+def _codigos(valores):
+    # Como np.unique(return_inverse=True) pero en O(n) con bincount cuando los ids son chicos (siempre, acá)
+    if valores.max() > 4 * len(valores) + 1_000_000:
+        return np.unique(valores, return_inverse=True)
+    presentes = np.bincount(valores) > 0
+    nuevo = np.cumsum(presentes) - 1
+    return np.flatnonzero(presentes), nuevo[valores]
+
+
+def _por_grupo(codigos, n_grupos, valores=None):
+    return np.bincount(codigos, weights=valores, minlength=n_grupos)
+
+
+def _dividir(a, b):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(b != 0, a / b, np.nan)
+
+
+def analizar(datos):
+    nota = datos["nota"]
+    if not len(nota):
+        return None
+    alumnos, cod_a = _codigos(datos["alumno"])
+    materias, cod_m = _codigos(datos["materia"])
+    na = len(alumnos)
+
+    # Distribución (de a un punto; el 10 entra en 9-10)
+    histograma = np.bincount(np.clip(np.floor(nota), 0, 9).astype(int), minlength=10)
+    p10, p25, p50, p75, p90 = np.percentile(nota, [10, 25, 50, 75, 90])
+    resumen = {"alumnos": na, "notas": len(nota), "promedio": float(nota.mean()), "desvio": float(nota.std()),
+               "p10": p10, "p25": p25, "mediana": p50, "p75": p75, "p90": p90, "porcentaje_bajas": float((nota < NOTA_BAJA).mean() * 100)}
+    distribucion = pd.DataFrame({"rango": [f"{i}-{i + 1}" for i in range(10)], "notas": histograma})
+
+    # Por alumno: sumas con bincount
+    n = _por_grupo(cod_a, na)
+    suma = _por_grupo(cod_a, na, nota)
+    promedio = suma / n
+    desvio = np.sqrt(np.maximum(_por_grupo(cod_a, na, nota * nota) / n - promedio ** 2, 0))
+    bajas = _por_grupo(cod_a, na, (nota < NOTA_BAJA).astype(float)) / n
+
+    # Tendencia: pendiente de la recta nota ~ mes, por mínimos cuadrados con sumas por alumno
+    dias = np.where(np.isnan(datos["dias"]), np.nanmedian(datos["dias"]) if np.isfinite(datos["dias"]).any() else 0, datos["dias"])
+    x = (dias - dias.min()) / DIAS_POR_MES
+    sx, sxx, sxy = _por_grupo(cod_a, na, x), _por_grupo(cod_a, na, x * x), _por_grupo(cod_a, na, x * nota)
+    pendiente = _dividir(n * sxy - sx * suma, n * sxx - sx * sx)
+    pendiente[n < MINIMO_TENDENCIA] = np.nan
+
+    # Última nota: la de mayor (día, id) de cada alumno, sin ordenar todo
+    clave = dias * 1e10 + datos["id"]
+    maximo = np.full(na, -np.inf); np.maximum.at(maximo, cod_a, clave)
+    es_ultima = clave == maximo[cod_a]
+    ultima = np.full(na, np.nan); ultima[cod_a[es_ultima]] = nota[es_ultima]
+
+    # z-score contra el curso, materia por materia: cada alumno pesa lo mismo en su materia
+    pares, cod_p = np.unique(cod_a * len(materias) + cod_m, return_inverse=True)
+    np_ = _por_grupo(cod_p, len(pares))
+    media_par = _por_grupo(cod_p, len(pares), nota) / np_
+    mat_par, alu_par = pares % len(materias), pares // len(materias)
+    n_mat = _por_grupo(mat_par, len(materias))
+    media_mat = _por_grupo(mat_par, len(materias), media_par) / n_mat
+    desvio_mat = np.sqrt(np.maximum(_por_grupo(mat_par, len(materias), media_par ** 2) / n_mat - media_mat ** 2, 0))
+    z_par = _dividir(media_par - media_mat[mat_par], desvio_mat[mat_par])
+    z_par = np.nan_to_num(z_par)   # Materia con un solo alumno o todos iguales: sin desvío
+    z = _por_grupo(alu_par, na, z_par) / _por_grupo(alu_par, na)
+
+    # Riesgo: cada señal a 0..1 y suma ponderada
+    senales = {
+        "z": np.clip(-z / Z_TOPE, 0, 1),
+        "bajas": bajas,
+        "caida": np.clip(-np.nan_to_num(pendiente) / CAIDA_TOPE, 0, 1),
+        "ultima_baja": (ultima < NOTA_BAJA).astype(float),
+    }
+    riesgo = sum(PESOS_RIESGO[k] * v for k, v in senales.items())
+    por_alumno = pd.DataFrame({
+        "alumno_id": alumnos, "notas": n.astype(int), "promedio": promedio, "desvio": desvio, "pendiente_mes": pendiente,
+        "z": z, "porcentaje_bajas": bajas * 100, "ultima": ultima, "riesgo": riesgo,
+        "en_riesgo": (promedio < NOTA_BAJA) | (ultima < NOTA_BAJA),
+    }).sort_values(["riesgo", "promedio"], ascending=[False, True], ignore_index=True)
+
+    n_m = _por_grupo(cod_m, len(materias))
+    suma_m = _por_grupo(cod_m, len(materias), nota)
+    por_materia = pd.DataFrame({
+        "materia_id": materias, "alumnos": n_mat.astype(int), "notas": n_m.astype(int), "promedio": suma_m / n_m,
+        "desvio": np.sqrt(np.maximum(_por_grupo(cod_m, len(materias), nota * nota) / n_m - (suma_m / n_m) ** 2, 0)),
+        "porcentaje_bajas": _por_grupo(cod_m, len(materias), (nota < NOTA_BAJA).astype(float)) / n_m * 100,
+    }).sort_values("promedio", ignore_index=True)
+    return {"resumen": resumen, "distribucion": distribucion, "alumnos": por_alumno, "materias": por_materia}
+
+
+def analitica_cohorte(session, año=None, materia_id=None, instancia=None):
+    # Sin caché: una consulta con los filtros ya aplicados en la base
+    return analizar(cargar_notas(session, año, materia_id, instancia))
+
+
+def nombres(session, modelo, ids):
+    # Solo los nombres que se van a mostrar (el ranking entero puede tener miles de alumnos)
+    ids = [int(i) for i in ids]
+    if not ids:
+        return {}
+    columna = Alumno.nombre_completo if modelo is Alumno else Materia.nombre
+    return dict(session.execute(select(modelo.id, columna).where(modelo.id.in_(ids))).all())
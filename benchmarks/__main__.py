@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import sqlalchemy
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+from config_db import crear_engine
+from crear_base_datos import Alumno, Evaluacion, asegurar_esquema
+from benchmarks.generar_datos import ESCALAS, generar
+from benchmarks.escenarios import ESCENARIOS, REPETICIONES, medir, preparar_contexto
+
+CARPETA = os.path.dirname(os.path.abspath(__file__))
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=CARPETA, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _aviso(texto):
+    print(texto, file=sys.stderr, flush=True)  # stdout queda libre para el JSON
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks de la app con datos sintéticos")
+    parser.add_argument("--escala", choices=list(ESCALAS), default="chica")
+    parser.add_argument("--alumnos", type=int); parser.add_argument("--materias", type=int)
+    parser.add_argument("--evaluaciones", type=int); parser.add_argument("--largo-programa", type=int)
+    parser.add_argument("--db", help="URL de SQLAlchemy (por defecto sqlite en benchmarks/bench_<escala>.db)")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--regenerar", action="store_true", help="Borrar la base y volver a generar los datos")
+    parser.add_argument("--solo-generar", action="store_true")
+    parser.add_argument("--escenarios", nargs="+", choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    parser.add_argument("--repeticiones", type=int, help="Igual para todos los escenarios (si no, uno por escenario)")
+    parser.add_argument("--latencia-llm", type=float, help="Segundos que tarda cada respuesta del LLM falso")
+    parser.add_argument("--filas-correccion", type=int); parser.add_argument("--filas-importacion", type=int)
+    parser.add_argument("--llm", choices=["falso", "servidor"], help="Corrección Masiva con una función falsa o por HTTP contra servidor_mock_ia")
+    parser.add_argument("--concurrencia", type=int, help="Llamadas simultáneas de la Corrección Masiva")
+    parser.add_argument("--tokens-por-segundo", type=float); parser.add_argument("--tasa-429", type=float)
+    parser.add_argument("--max-concurrencia-servidor", type=int, help="Límite de servidor_mock_ia (0 = sin límite)")
+    parser.add_argument("--rpm-cliente", type=int, help="Solicitudes por minuto de la cubeta de cliente_ia contra servidor_mock_ia (0 = sin límite)")
+    parser.add_argument("--alumnos-por-llamada", type=int, help="Corrección agrupada: alumnos por llamada (1 = de a uno; necesita --llm servidor)")
+    parser.add_argument("--agrupar-respuestas", action="store_true", default=None, help="Corregir una vez cada grupo de respuestas iguales o casi iguales")
+    parser.add_argument("--tasa-json-invalido", type=float, help="Fracción de respuestas agrupadas con JSON roto en servidor_mock_ia")
+    parser.add_argument("--salida", help="Archivo JSON de salida (además de imprimirlo)")
+    args = parser.parse_args()
+
+    escala = dict(ESCALAS[args.escala])
+    for campo in escala:
+        valor = getattr(args, campo)
+        if valor is not None: escala[campo] = valor
+
+    url = args.db or f"sqlite:///{os.path.join(CARPETA, f'bench_{args.escala}.db')}"
+    engine = crear_engine(url)  # Misma configuración (pool, WAL) que la aplicación
+    if args.regenerar:
+        if engine.dialect.name == "sqlite" and engine.url.database and os.path.exists(engine.url.database):
+            engine.dispose()
+            for sufijo in ("", "-wal", "-shm"):
+                if os.path.exists(engine.url.database + sufijo): os.remove(engine.url.database + sufijo)
+        else:
+            from crear_base_datos import Base
+            Base.metadata.drop_all(engine)
+    asegurar_esquema(engine)  # Bases generadas con una versión anterior: tablas nuevas
+    Session = sessionmaker(bind=engine)
+
+    resultado = {"fecha": datetime.now().isoformat(timespec="seconds"), "commit": _commit_actual(), "python": platform.python_version(),
+                 "sqlalchemy": sqlalchemy.__version__, "motor": engine.dialect.name, "escala": args.escala, "parametros": escala,
+                 "semilla": args.semilla, "generacion": None, "escenarios": {}}
+
+    with Session() as session:
+        vacia = not sqlalchemy.inspect(engine).has_table("alumnos") or not session.query(func.count(Alumno.id)).scalar()
+        if vacia:
+            _aviso(f"Generando datos ({escala})...")
+            t0 = time.perf_counter()
+            resultado["generacion"] = generar(engine, session, semilla=args.semilla, al_avanzar=lambda paso, n: _aviso(f"   {paso}: {n}"), **escala)
+            resultado["generacion"]["total_s"] = round(time.perf_counter() - t0, 3)
+        resultado["filas"] = {"alumnos": session.query(func.count(Alumno.id)).scalar(), "evaluaciones": session.query(func.count(Evaluacion.id)).scalar()}
+
+    if not args.solo_generar:
+        ctx = preparar_contexto(Session, args.semilla, latencia_llm_s=args.latencia_llm,
+                                filas_correccion=args.filas_correccion, filas_importacion=args.filas_importacion, llm=args.llm,
+                                concurrencia=args.concurrencia, tokens_por_segundo=args.tokens_por_segundo, tasa_429=args.tasa_429,
+                                max_concurrencia_servidor=args.max_concurrencia_servidor, alumnos_por_llamada=args.alumnos_por_llamada,
+                                tasa_json_invalido=args.tasa_json_invalido, agrupar_respuestas=args.agrupar_respuestas, rpm_cliente=args.rpm_cliente)
+        for nombre in args.escenarios:
+            _aviso(f"Escenario {nombre}...")
+            repeticion = ESCENARIOS[nombre](Session, ctx)
+            resultado["escenarios"][nombre] = medir(engine, repeticion, args.repeticiones or REPETICIONES[nombre])
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+
+
+if __name__ == "__main__":
+    main()
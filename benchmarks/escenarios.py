@@ -0,0 +1,252 @@
+import io
+import json
+import os
+import random
+import re
+import statistics
+import time
+import uuid
+
+import pandas as pd
+from sqlalchemy import event
+
+from crear_base_datos import Alumno, Materia
+
+# --- ESCENARIOS ---
+# Cada escenario recibe (Session, contexto) y devuelve una función que hace UNA repetición.
+# medir() la corre varias veces y junta tiempos y cantidad de consultas SQL.
+
+
+class ContadorConsultas:
+    def __init__(self, engine):
+        self.engine = engine; self.total = 0
+        event.listen(engine, "before_cursor_execute", self._contar)
+
+    def _contar(self, *args):
+        self.total += 1
+
+    def cerrar(self):
+        event.remove(self.engine, "before_cursor_execute", self._contar)
+
+
+def _percentil(valores, p):
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(round(p / 100 * (len(orden) - 1))))]
+
+
+def medir(engine, repeticion, repeticiones, calentamiento=1):
+    for i in range(calentamiento):
+        repeticion(-1 - i)
+    tiempos, consultas = [], []
+    contador = ContadorConsultas(engine)
+    try:
+        for i in range(repeticiones):
+            antes = contador.total
+            t0 = time.perf_counter()
+            extra = repeticion(i)
+            tiempos.append((time.perf_counter() - t0) * 1000)
+            consultas.append(contador.total - antes)
+    finally:
+        contador.cerrar()
+    resultado = {"repeticiones": repeticiones, "min_ms": round(min(tiempos), 3), "mediana_ms": round(statistics.median(tiempos), 3),
+                 "p95_ms": round(_percentil(tiempos, 95), 3), "media_ms": round(statistics.fmean(tiempos), 3),
+                 "consultas_por_repeticion": round(statistics.fmean(consultas), 2)}
+    if isinstance(extra, dict):
+        resultado.update(extra)  # Datos propios del escenario (de la última repetición)
+    return resultado
+
+
+# --- CAMINOS DE LA APP ---
+def carga_dashboard(Session, ctx):
+    # Lo que hace el modo Dashboard al elegir un alumno: el alumno y sus métricas
+    from agregados import agregado_alumno, agregados_por_materia, promedio_y_desvio
+    def repeticion(i):
+        with Session() as session:
+            alumno_id = ctx["alumnos"][i % len(ctx["alumnos"])]
+            session.get(Alumno, alumno_id)
+            promedio_y_desvio(agregado_alumno(session, alumno_id))
+            agregados_por_materia(session, alumno_id)
+    return repeticion
+
+
+def historial(Session, ctx):
+    from consultas import historial_alumno, COLUMNAS_HISTORIAL
+    def repeticion(i):
+        with Session() as session:
+            df = pd.DataFrame(historial_alumno(session, ctx["alumnos"][i % len(ctx["alumnos"])]), columns=COLUMNAS_HISTORIAL)
+        return {"filas": len(df)}
+    return repeticion
+
+
+def importacion(Session, ctx):
+    # Un CSV nuevo por repetición (nombres y DNI que no existen), así siempre se inserta
+    from importar_alumnos import importar_alumnos
+    filas = ctx["filas_importacion"]
+    def repeticion(i):
+        lote = uuid.uuid4().hex[:8]
+        csv = pd.DataFrame({"Nombre": [f"Importado {lote} {n}" for n in range(filas)], "Año": [1 + n % 6 for n in range(filas)],
+                            "DNI": [f"{lote}-{n}" for n in range(filas)]}).to_csv(index=False).encode("utf-8")
+        with Session() as session:
+            res = importar_alumnos(session, io.BytesIO(csv), "bench.csv")
+        return {"filas_csv": filas, "insertados": res["insertados"]}
+    return repeticion
+
+
+def informe_pdf(Session, ctx):
+    from consultas import alumno_con_historial
+    from reportes import crear_reporte_pdf
+    def repeticion(i):
+        with Session() as session:
+            pdf = crear_reporte_pdf(alumno_con_historial(session, ctx["alumnos"][i % len(ctx["alumnos"])]), "Resumen de prueba para el benchmark.")
+        return {"bytes_pdf": len(pdf)}
+    return repeticion
+
+
+def analitica_cohorte(Session, ctx):
+    # La vista Analítica: la carga de todas las notas se mide una vez (el dashboard la cachea por versión)
+    # y cada repetición analiza una materia o la escuela entera sobre los arrays en memoria
+    from analitica import notas_escuela, filtrar, analizar
+    t0 = time.perf_counter()
+    with Session() as session:
+        datos, años = notas_escuela(session)
+    carga_s = round(time.perf_counter() - t0, 3)
+    materias = sorted(set(datos["materia"][:10_000].tolist())) or [None]
+    def repeticion(i):
+        materia = None if i % 4 == 0 else materias[i % len(materias)]
+        res = analizar(filtrar(datos, años, materia_id=materia))
+        return {"notas_cargadas": len(datos["nota"]), "carga_inicial_s": carga_s, "alumnos_ultima": res["resumen"]["alumnos"] if res else 0}
+    return repeticion
+
+
+def _servidor_mock(ctx):
+    # Levanta (una sola vez) servidor_mock_ia en un hilo y apunta el cliente de la app ahí
+    if "servidor_mock" not in ctx:
+        os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+        import cliente_ia
+        from servidor_mock_ia import Configuracion, iniciar_en_hilo
+        config = Configuracion(latencia=f"fija:{ctx['latencia_llm_s']}", tokens_por_segundo=ctx["tokens_por_segundo"],
+                               tasa_429=ctx["tasa_429"], max_concurrencia=ctx["max_concurrencia_servidor"], semilla=ctx["semilla"],
+                               tasa_json_invalido=ctx["tasa_json_invalido"])
+        servidor, base_url = iniciar_en_hilo(config)
+        # Sin límite de tasa del lado del cliente: se mide lo que aguanta el servidor (los 429 se reintentan)
+        cliente_ia.configurar(base_url=base_url, api_key="benchmark", rpm=ctx["rpm_cliente"])
+        ctx["servidor_mock"] = config
+    return ctx["servidor_mock"]
+
+
+def correccion_masiva(Session, ctx):
+    # Corrección Masiva completa (cola + RAG + guardado). Con llm="falso" la respuesta es una
+    # función con latencia fija; con llm="servidor" pasa por el cliente HTTP real contra servidor_mock_ia.
+    os.environ.setdefault("GITHUB_TOKEN", "benchmark")  # El módulo necesita un token para importarse
+    import trabajos
+    latencia = ctx["latencia_llm_s"]
+    config = None
+    if ctx["llm"] == "servidor":
+        config = _servidor_mock(ctx)
+    else:
+        def llm_falso(nombre, historial, prompt):
+            time.sleep(latencia)
+            return f"Devolución para {nombre}: revisar el tema."
+        def llm_falso_agrupado(prompt, max_tokens=None):
+            time.sleep(latencia)
+            return json.dumps([{"alumno": int(n), "devolucion": "Revisar el tema."} for n in re.findall(r"\[ALUMNO (\d+)\]", prompt)])
+        trabajos.responder_chat_educativo = llm_falso
+        trabajos.consultar_llama = llm_falso_agrupado
+
+    with Session() as session:
+        nombres = [n for (n,) in session.query(Alumno.nombre_completo).filter(Alumno.id.in_(ctx["alumnos"][:ctx["filas_correccion"]]))]
+    # Respuestas al estilo Google Forms: opciones repetidas, variantes casi iguales, en blanco y algunas únicas
+    rnd = random.Random(ctx["semilla"])
+    frecuentes = ["La fotosíntesis produce energía", "la fotosintesis produce energia.", "No sé", "", "Las plantas fabrican su alimento con la luz del sol"]
+    respuestas = [rnd.choice(frecuentes) if rnd.random() < 0.8 else f"Respuesta propia número {n} sobre la célula" for n in range(len(nombres))]
+    df = pd.DataFrame({"Nombre": nombres, "Nota": [7] * len(nombres), "Pregunta 1": respuestas})
+
+    def repeticion(i):
+        with Session() as session:
+            materia = session.get(Materia, ctx["materia"])
+            trabajo, _ = trabajos.crear_trabajo(session, df, materia, f"Bench {uuid.uuid4().hex[:6]}", "Nombre", "Nota", ["Pregunta 1"],
+                                                huella=uuid.uuid4().hex, max_concurrencia=ctx["concurrencia"], rpm=1_000_000,
+                                                alumnos_por_llamada=ctx["alumnos_por_llamada"], agrupar_respuestas=ctx["agrupar_respuestas"])
+            t0 = time.perf_counter()
+            trabajos.procesar_trabajo(session, trabajo.id)
+            duracion = time.perf_counter() - t0
+            cuenta = trabajos.progreso(session, trabajo.id)
+        extra = {"filas": len(df), "hechas": cuenta.get("hecho", 0), "filas_por_segundo": round(len(df) / duracion, 2), "latencia_llm_s": latencia,
+                 "llm": ctx["llm"], "alumnos_por_llamada": ctx["alumnos_por_llamada"], "agrupar_respuestas": ctx["agrupar_respuestas"]}
+        if ctx["agrupar_respuestas"]:
+            extra["deduplicacion"] = json.loads(trabajo.parametros)["deduplicacion"]
+        if config:
+            extra["servidor"] = dict(config.contadores)  # Acumulado de todas las repeticiones (solicitudes, tokens)
+        return extra
+    return repeticion
+
+
+def recomendaciones_lote(Session, ctx):
+    # Pasada de recomendaciones en lote: cada repetición cambia la nota de `filas_correccion` evaluaciones
+    # (sube su versión) y la pasada tiene que rehacer exactamente esas, sin tocar las que ya estaban al día
+    os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+    import recomendaciones
+    from sqlalchemy import select, insert, update, literal
+    from crear_base_datos import Evaluacion, Recomendacion
+    latencia = ctx["latencia_llm_s"]
+    def llm_falso(materia, nota, comentario, usar_cache=True):
+        time.sleep(latencia)
+        return f"Repasar {materia}: reforzar lo marcado en la devolución."
+    recomendaciones.generar_recomendacion_ia = llm_falso
+    with Session() as session:
+        # Punto de partida: todas las evaluaciones ya tienen su recomendación al día (sin pasar por la IA)
+        E, R = Evaluacion.__table__, Recomendacion.__table__
+        sin_rec = select(E.c.id, E.c.alumno_id, E.c.materia_id, E.c.version, literal("Recomendación inicial."), literal(recomendaciones.ESTADO_LISTA), literal(0)) \
+            .outerjoin(R, R.c.evaluacion_id == E.c.id).where(R.c.id.is_(None), E.c.nota.isnot(None), E.c.materia_id.isnot(None))
+        session.execute(insert(R).from_select(["evaluacion_id", "alumno_id", "materia_id", "version", "contenido", "estado", "intentos"], sin_rec))
+        ids = [i for (i,) in session.query(Evaluacion.id).filter(Evaluacion.alumno_id.in_(ctx["alumnos"]), Evaluacion.nota.isnot(None))
+               .order_by(Evaluacion.id).limit(ctx["filas_correccion"])]
+        session.commit()
+    def repeticion(i):
+        with Session() as session:
+            session.execute(update(Evaluacion).where(Evaluacion.id.in_(ids)).values(version=Evaluacion.version + 1)); session.commit()
+            t0 = time.perf_counter()
+            cuenta = recomendaciones.generar_pendientes(session, max_concurrencia=ctx["concurrencia"], rpm=0)
+            duracion = time.perf_counter() - t0
+        return {"cambiadas": len(ids), **cuenta, "por_segundo": round(cuenta["generadas"] / duracion, 2), "latencia_llm_s": latencia}
+    return repeticion
+
+
+def chat_stream(Session, ctx):
+    # Chat del dashboard (stream, sin caché) contra servidor_mock_ia: tiempo al primer pedazo y total
+    _servidor_mock(ctx)
+    from modulo_ia_github import responder_chat_educativo_stream
+    def repeticion(i):
+        t0 = time.perf_counter(); primero = None; partes = 0
+        for parte in responder_chat_educativo_stream("Alumno de prueba", "Notas: 7, 8, 5", f"Pregunta {i}", usar_cache=False):
+            if primero is None: primero = time.perf_counter() - t0
+            partes += 1
+        return {"primer_token_ms": round((primero or 0) * 1000, 3), "pedazos": partes}
+    return repeticion
+
+
+ESCENARIOS = {
+    "carga_dashboard": carga_dashboard,
+    "historial": historial,
+    "importacion": importacion,
+    "informe_pdf": informe_pdf,
+    "correccion_masiva": correccion_masiva,
+    "chat_stream": chat_stream,
+    "analitica_cohorte": analitica_cohorte,
+    "recomendaciones_lote": recomendaciones_lote,
+}
+# Repeticiones por defecto (los escenarios pesados se repiten menos)
+REPETICIONES = {"carga_dashboard": 200, "historial": 100, "importacion": 3, "informe_pdf": 20, "correccion_masiva": 2, "chat_stream": 10, "analitica_cohorte": 20, "recomendaciones_lote": 3}
+
+
+def preparar_contexto(Session, semilla, muestra=500, **opciones):
+    rnd = random.Random(semilla)
+    with Session() as session:
+        ids = [i for (i,) in session.query(Alumno.id).order_by(Alumno.id)]
+        materia = session.query(Materia.id).order_by(Materia.id).first()
+    ctx = {"alumnos": rnd.sample(ids, min(muestra, len(ids))), "materia": materia[0] if materia else None,
+           "filas_importacion": 5_000, "filas_correccion": 100, "latencia_llm_s": 0.05, "concurrencia": 5,
+           "llm": "falso", "tokens_por_segundo": 200.0, "tasa_429": 0.0, "max_concurrencia_servidor": 0, "semilla": semilla,
+           "alumnos_por_llamada": 1, "tasa_json_invalido": 0.0, "agrupar_respuestas": False, "rpm_cliente": 0}
+    ctx.update({k: v for k, v in opciones.items() if v is not None})
+    return ctx
@@ -0,0 +1,88 @@
+import random
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import insert, func
+
+from crear_base_datos import Alumno, Materia, Evaluacion, asegurar_esquema
+
+# --- GENERADOR DE DATOS SINTÉTICOS ---
+# Todo sale de un random.Random(semilla): la misma escala y semilla dan siempre la
+# misma base. Se inserta con Core en bloques (executemany), sin pasar por el ORM.
+
+ESCALAS = {
+    "chica":   {"alumnos": 1_000,  "materias": 20,  "evaluaciones": 50_000,    "largo_programa": 5_000},
+    "mediana": {"alumnos": 10_000, "materias": 100, "evaluaciones": 1_000_000, "largo_programa": 20_000},
+    "escuela": {"alumnos": 50_000, "materias": 200, "evaluaciones": 5_000_000, "largo_programa": 50_000},
+}
+TAMANO_BLOQUE = 20_000
+FECHA_INICIO = date(2024, 3, 1)
+DIAS_CICLO = 270
+INSTANCIAS = ["Parcial 1", "Parcial 2", "TP 1", "TP 2", "Oral", "Recuperatorio", "Final"]
+
+NOMBRES = ["Ana", "Bruno", "Carla", "Diego", "Elena", "Facundo", "Gabriela", "Hernán", "Inés", "Joaquín",
+           "Lucía", "Martín", "Noelia", "Óscar", "Paula", "Ramiro", "Sofía", "Tomás", "Valentina", "Zoe"]
+APELLIDOS = ["García", "Fernández", "González", "Rodríguez", "López", "Martínez", "Pérez", "Gómez", "Díaz", "Sánchez",
+             "Romero", "Sosa", "Álvarez", "Torres", "Ruiz", "Ramírez", "Flores", "Acosta", "Benítez", "Medina"]
+TEMAS = ["fotosíntesis", "revolución", "ecuación", "célula", "energía", "democracia", "literatura", "geometría",
+         "átomo", "clima", "economía", "imperio", "función", "ecosistema", "gramática", "fuerza", "independencia",
+         "fracción", "molécula", "constitución", "narrativa", "probabilidad", "continente", "sistema"]
+CONECTORES = ["se relaciona con", "depende de", "explica", "se opone a", "permite entender", "surge de"]
+COMENTARIOS = ["Buen trabajo.", "Confunde conceptos básicos.", "Muy buena participación.", "Le falta estudiar.",
+               "Entrega incompleta.", "Excelente desarrollo.", "Debe justificar mejor.", "Mejoró respecto al anterior.", None]
+
+
+def _texto_programa(rnd, largo):
+    partes, total = [], 0
+    while total < largo:
+        frase = f"El tema {rnd.choice(TEMAS)} {rnd.choice(CONECTORES)} la {rnd.choice(TEMAS)} y la {rnd.choice(TEMAS)}. "
+        partes.append(frase); total += len(frase)
+    return "".join(partes)[:largo]
+
+
+def _en_bloques(session, modelo, filas):
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) >= TAMANO_BLOQUE:
+            session.execute(insert(modelo), bloque); session.commit(); bloque = []
+    if bloque:
+        session.execute(insert(modelo), bloque); session.commit()
+
+
+def generar(engine, session, alumnos, materias, evaluaciones, largo_programa, semilla=42, al_avanzar=None):
+    # Devuelve los segundos de cada paso. Las tablas tienen que estar vacías.
+    rnd = random.Random(semilla)
+    tiempos = {}
+    asegurar_esquema(engine)
+    if session.query(func.count(Alumno.id)).scalar():
+        raise ValueError("La base ya tiene alumnos: usá una base nueva o --regenerar.")
+
+    t0 = time.perf_counter()
+    _en_bloques(session, Alumno, ({"nombre_completo": f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {i:06d}", "dni": f"{40_000_000 + i}",
+                                   "año_escolar": rnd.randint(1, 6), "email": f"alumno{i}@escuela.test"} for i in range(alumnos)))
+    _en_bloques(session, Materia, ({"nombre": f"Materia {i:03d}", "profesor_titular": f"Prof. {rnd.choice(APELLIDOS)}",
+                                    "programa": _texto_programa(rnd, largo_programa)} for i in range(materias)))
+    tiempos["alumnos_y_materias_s"] = round(time.perf_counter() - t0, 3)
+    if al_avanzar: al_avanzar("alumnos y materias", alumnos + materias)
+
+    # Los ids se leen de la base (en Postgres no tienen por qué empezar en 1)
+    ids_alumnos = [i for (i,) in session.query(Alumno.id).order_by(Alumno.id)]
+    ids_materias = [i for (i,) in session.query(Materia.id).order_by(Materia.id)]
+    t0 = time.perf_counter()
+
+    def filas_evaluaciones():
+        for n in range(evaluaciones):
+            yield {"alumno_id": rnd.choice(ids_alumnos), "materia_id": rnd.choice(ids_materias), "instancia": rnd.choice(INSTANCIAS),
+                   "nota": float(min(10, max(1, round(rnd.gauss(6.8, 1.9))))), "comentario": rnd.choice(COMENTARIOS),
+                   "fecha": FECHA_INICIO + timedelta(days=rnd.randrange(DIAS_CICLO))}
+            if al_avanzar and n and n % 500_000 == 0: al_avanzar("evaluaciones", n)
+    _en_bloques(session, Evaluacion, filas_evaluaciones())
+    tiempos["evaluaciones_s"] = round(time.perf_counter() - t0, 3)
+
+    # Los inserts de Core no disparan los eventos del ORM: los agregados se arman de una vez
+    from agregados import reconstruir_agregados
+    t0 = time.perf_counter()
+    reconstruir_agregados(session)
+    tiempos["agregados_s"] = round(time.perf_counter() - t0, 3)
+    return tiempos
@@ -0,0 +1,135 @@
+import weakref
+
+from sqlalchemy import event, inspect, select, text, bindparam, update, func, case, table, column, literal, and_, or_
+from sqlalchemy.exc import DBAPIError
+
+from crear_base_datos import Alumno, normalizar_nombre
+
+# --- BÚSQUEDA DE ALUMNOS ---
+# Busca por nombre sin importar tildes ni mayúsculas y trae de a una página, así el
+# selector no carga la lista entera de alumnos. Sobre la columna alumnos.nombre_busqueda
+# (el nombre normalizado) se arma un índice según el motor:
+#   SQLite:   tabla virtual FTS5 "alumnos_fts" con tokenizer trigram (contenido externo + triggers)
+#   Postgres: índice GIN con pg_trgm sobre nombre_busqueda (LIKE '%...%' y similarity())
+# Si el motor no tiene ninguno de los dos, se busca con LIKE (funciona igual, pero recorre la tabla).
+
+TAMANO_PAGINA = 20
+MINIMO_TRIGRAMA = 3   # Palabras más cortas no tienen trigramas: se filtran aparte
+TAMANO_BLOQUE = 1000
+
+_modos = weakref.WeakKeyDictionary()  # engine -> "fts5" | "trigram" | "like"
+
+SQL_FTS = [
+    "CREATE VIRTUAL TABLE alumnos_fts USING fts5(nombre_busqueda, content='alumnos', content_rowid='id', tokenize='trigram')",
+    """CREATE TRIGGER IF NOT EXISTS alumnos_fts_ai AFTER INSERT ON alumnos BEGIN
+        INSERT INTO alumnos_fts(rowid, nombre_busqueda) VALUES (new.id, new.nombre_busqueda);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS alumnos_fts_ad AFTER DELETE ON alumnos BEGIN
+        INSERT INTO alumnos_fts(alumnos_fts, rowid, nombre_busqueda) VALUES ('delete', old.id, old.nombre_busqueda);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS alumnos_fts_au AFTER UPDATE OF nombre_busqueda ON alumnos BEGIN
+        INSERT INTO alumnos_fts(alumnos_fts, rowid, nombre_busqueda) VALUES ('delete', old.id, old.nombre_busqueda);
+        INSERT INTO alumnos_fts(rowid, nombre_busqueda) VALUES (new.id, new.nombre_busqueda);
+    END""",
+]
+
+
+# --- PASO 1: PREPARAR EL ÍNDICE (una vez, desde asegurar_esquema) ---
+def _completar_nombres(engine):
+    # Filas de antes de que existiera la columna (o cargadas con SQL a mano)
+    with engine.begin() as conn:
+        pendientes = conn.execute(select(Alumno.id, Alumno.nombre_completo).where(Alumno.nombre_busqueda.is_(None))).all()
+        stmt = update(Alumno.__table__).where(Alumno.__table__.c.id == bindparam("_id")).values(nombre_busqueda=bindparam("_nombre"))
+        for i in range(0, len(pendientes), TAMANO_BLOQUE):
+            conn.execute(stmt, [{"_id": a_id, "_nombre": normalizar_nombre(nombre)} for a_id, nombre in pendientes[i:i + TAMANO_BLOQUE]])
+
+
+def _preparar_sqlite(engine):
+    with engine.begin() as conn:
+        existia = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'alumnos_fts'")).first() is not None
+        if not existia:
+            conn.execute(text(SQL_FTS[0]))
+        for sql in SQL_FTS[1:]:
+            conn.execute(text(sql))
+        if not existia:
+            # Índice nuevo sobre una tabla con datos: se llena de una vez desde alumnos
+            conn.execute(text("INSERT INTO alumnos_fts(alumnos_fts) VALUES ('rebuild')"))
+    return "fts5"
+
+
+def _preparar_postgres(engine):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_alumnos_nombre_trgm ON alumnos USING gin (nombre_busqueda gin_trgm_ops)"))
+    return "trigram"
+
+
+def asegurar_indice_busqueda(engine):
+    _completar_nombres(engine)
+    preparar = {"sqlite": _preparar_sqlite, "postgresql": _preparar_postgres}.get(engine.dialect.name)
+    try:
+        _modos[engine] = preparar(engine) if preparar else "like"
+    except DBAPIError:
+        # SQLite sin FTS5/trigram (anterior a 3.34) o Postgres sin permiso para crear la extensión
+        _modos[engine] = "like"
+    return _modos[engine]
+
+
+def _modo(engine):
+    if engine not in _modos:
+        if engine.dialect.name == "sqlite":
+            with engine.connect() as conn:
+                hay = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'alumnos_fts'")).first() is not None
+            _modos[engine] = "fts5" if hay else "like"
+        elif engine.dialect.name == "postgresql":
+            with engine.connect() as conn:
+                hay = conn.execute(text("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_alumnos_nombre_trgm'")).first() is not None
+            _modos[engine] = "trigram" if hay else "like"
+        else:
+            _modos[engine] = "like"
+    return _modos[engine]
+
+
+# Renombrar un alumno desde el ORM actualiza el nombre normalizado (y, por el trigger, el índice FTS)
+@event.listens_for(Alumno, "before_update")
+def _al_renombrar(mapper, connection, alumno):
+    if inspect(alumno).attrs.nombre_completo.history.has_changes():
+        alumno.nombre_busqueda = normalizar_nombre(alumno.nombre_completo)
+
+
+# --- PASO 2: BUSCAR ---
+def _consulta_fts(q, largas):
+    fts = table("alumnos_fts", column("rowid"), column("rank"))
+    consulta = " ".join('"' + p.replace('"', '""') + '"' for p in largas)  # Cada palabra como frase: todas tienen que estar
+    return q.join(fts, fts.c.rowid == Alumno.id).where(text("alumnos_fts MATCH :consulta").bindparams(consulta=consulta)), [fts.c.rank]
+
+
+def buscar_alumnos(session, texto, limite=TAMANO_PAGINA, desde=0):
+    # Devuelve ([(id, nombre_completo, dni, año_escolar), ...], hay_mas).
+    # Sin texto: la lista en orden alfabético, de a una página (recorre el índice de nombre_busqueda).
+    buscado = normalizar_nombre(texto)
+    q = select(Alumno.id, Alumno.nombre_completo, Alumno.dni, Alumno.año_escolar)
+    orden = []
+    if buscado:
+        palabras = buscado.split()
+        largas = [p for p in palabras if len(p) >= MINIMO_TRIGRAMA]
+        modo = _modo(session.get_bind())
+        if len(palabras) == 1 and not largas:
+            # Una o dos letras: nombres que empiezan así (rango sobre el índice) o con alguna palabra que
+            # empiece así, para apellidos cortos ("li" -> "Ana Li"); los primeros salen antes (ver `empieza`)
+            q = q.where(or_(and_(Alumno.nombre_busqueda >= buscado, Alumno.nombre_busqueda < buscado + "\uffff"),
+                            Alumno.nombre_busqueda.contains(" " + buscado, autoescape=True)))
+        else:
+            filtrar = palabras
+            if modo == "fts5" and largas:
+                q, orden = _consulta_fts(q, largas)
+                filtrar = [p for p in palabras if len(p) < MINIMO_TRIGRAMA]
+            for p in filtrar:
+                q = q.where(Alumno.nombre_busqueda.contains(p, autoescape=True))
+            if modo == "trigram":
+                orden = [func.similarity(Alumno.nombre_busqueda, buscado).desc()]
+        # Primero los que empiezan con lo buscado (lo que el usuario suele tipear), después por relevancia
+        empieza = case((func.substr(Alumno.nombre_busqueda, 1, len(buscado)) == literal(buscado), 0), else_=1)
+        orden = [empieza] + orden
+    filas = session.execute(q.order_by(*orden, Alumno.nombre_busqueda, Alumno.id).offset(desde).limit(limite + 1)).all()
+    return [tuple(f) for f in filas[:limite]], len(filas) > limite
@@ -0,0 +1,180 @@
+import re
+import weakref
+
+from sqlalchemy import select, text, table, column, literal_column, func, and_
+from sqlalchemy.exc import DBAPIError
+
+from crear_base_datos import Alumno, Materia, Evaluacion, normalizar_nombre
+
+# --- BÚSQUEDA EN COMENTARIOS ---
+# Índice de texto completo sobre evaluaciones.comentario (notas del profesor y los
+# "[IA FEEDBACK]" de la corrección masiva), para preguntas como "¿quiénes confunden
+# las causas de la Revolución Industrial?" sin recorrer todo en Python.
+#   SQLite:   tabla virtual FTS5 "evaluaciones_fts" (contenido externo, sin tildes) + triggers
+#   Postgres: columna generada comentario_tsv (tsvector en español) con índice GIN
+# Sin ninguno de los dos se busca con LIKE. Los filtros (materia, instancia, fechas, notas)
+# se aplican sobre evaluaciones ya unida por id, así que solo se miran las filas que coinciden.
+
+TAMANO_PAGINA = 20
+PALABRAS_FRAGMENTO = 16
+MARCA_INICIO, MARCA_FIN = "**", "**"   # El dashboard muestra el fragmento como markdown
+
+_modos = weakref.WeakKeyDictionary()  # engine -> "fts5" | "tsvector" | "like"
+
+SQL_FTS = [
+    "CREATE VIRTUAL TABLE evaluaciones_fts USING fts5(comentario, content='evaluaciones', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    """CREATE TRIGGER IF NOT EXISTS evaluaciones_fts_ai AFTER INSERT ON evaluaciones BEGIN
+        INSERT INTO evaluaciones_fts(rowid, comentario) VALUES (new.id, new.comentario);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS evaluaciones_fts_ad AFTER DELETE ON evaluaciones BEGIN
+        INSERT INTO evaluaciones_fts(evaluaciones_fts, rowid, comentario) VALUES ('delete', old.id, old.comentario);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS evaluaciones_fts_au AFTER UPDATE OF comentario ON evaluaciones BEGIN
+        INSERT INTO evaluaciones_fts(evaluaciones_fts, rowid, comentario) VALUES ('delete', old.id, old.comentario);
+        INSERT INTO evaluaciones_fts(rowid, comentario) VALUES (new.id, new.comentario);
+    END""",
+]
+
+
+# --- PASO 1: PREPARAR EL ÍNDICE (una vez, desde asegurar_esquema) ---
+def _preparar_sqlite(engine):
+    with engine.begin() as conn:
+        existia = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'evaluaciones_fts'")).first() is not None
+        if not existia:
+            conn.execute(text(SQL_FTS[0]))
+        for sql in SQL_FTS[1:]:
+            conn.execute(text(sql))
+        if not existia:
+            conn.execute(text("INSERT INTO evaluaciones_fts(evaluaciones_fts) VALUES ('rebuild')"))
+    return "fts5"
+
+
+def _preparar_postgres(engine):
+    with engine.begin() as conn:
+        hay = conn.execute(text("SELECT 1 FROM information_schema.columns WHERE table_name = 'evaluaciones' AND column_name = 'comentario_tsv'")).first()
+        if not hay:
+            conn.execute(text("ALTER TABLE evaluaciones ADD COLUMN comentario_tsv tsvector "
+                              "GENERATED ALWAYS AS (to_tsvector('spanish', coalesce(comentario, ''))) STORED"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_evaluaciones_comentario_tsv ON evaluaciones USING gin (comentario_tsv)"))
+    return "tsvector"
+
+
+def asegurar_indice_comentarios(engine):
+    preparar = {"sqlite": _preparar_sqlite, "postgresql": _preparar_postgres}.get(engine.dialect.name)
+    try:
+        _modos[engine] = preparar(engine) if preparar else "like"
+    except DBAPIError:
+        _modos[engine] = "like"   # SQLite compilado sin FTS5, Postgres anterior a 12 (sin columnas generadas)
+    return _modos[engine]
+
+
+def _modo(engine):
+    if engine not in _modos:
+        if engine.dialect.name == "sqlite":
+            with engine.connect() as conn:
+                hay = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'evaluaciones_fts'")).first() is not None
+            _modos[engine] = "fts5" if hay else "like"
+        elif engine.dialect.name == "postgresql":
+            with engine.connect() as conn:
+                hay = conn.execute(text("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_evaluaciones_comentario_tsv'")).first() is not None
+            _modos[engine] = "tsvector" if hay else "like"
+        else:
+            _modos[engine] = "like"
+    return _modos[engine]
+
+
+# --- PASO 2: ARMAR LA CONSULTA ---
+def terminos(texto, sin_tildes=True):
+    # "causas revolución" -> frases ["causas", "revolucion"]; lo que va entre comillas queda como una sola frase.
+    # sin_tildes=False: solo minúsculas (para tsvector y LIKE, que comparan contra el comentario con tildes)
+    frases = []
+    for entre_comillas, suelta in re.findall(r'"([^"]*)"|(\S+)', texto or ""):
+        frase = entre_comillas or suelta
+        palabras = re.findall(r"\w+", normalizar_nombre(frase) if sin_tildes else frase.lower())
+        if palabras:
+            frases.append(" ".join(palabras))
+    return frases
+
+
+def _consulta_fts5(frases):
+    # Cada frase entre comillas (nada del usuario se interpreta como operador) y las palabras sueltas
+    # como prefijo: "confund" encuentra "confunde" y "confundió"
+    return " ".join(f'"{f}"' if " " in f else f'"{f}"*' for f in frases)
+
+
+def _fragmento(comentario, frases, palabras=PALABRAS_FRAGMENTO):
+    # Ventana alrededor de la primera coincidencia, con las coincidencias marcadas
+    partes = (comentario or "").split()
+    normalizadas = [normalizar_nombre(p) for p in partes]
+    buscadas = [w for f in frases for w in f.split()]
+    primera = next((i for i, p in enumerate(normalizadas) if any(w in p for w in buscadas)), 0)
+    inicio = max(0, primera - palabras // 3)
+    ventana = [f"{MARCA_INICIO}{p}{MARCA_FIN}" if any(w in n for w in buscadas) else p
+               for p, n in zip(partes[inicio:inicio + palabras], normalizadas[inicio:inicio + palabras])]
+    return ("… " if inicio else "") + " ".join(ventana) + (" …" if inicio + palabras < len(partes) else "")
+
+
+def _pagina_fts5(session, frases, filtros, orden, limite, desde):
+    # Dos pasos: primero solo los ids de la página (ordenar cientos de miles de coincidencias por
+    # rank o rowid es barato si no se arrastra nada más) y después nombres y fragmento de esos 20 por id.
+    # El fragmento se arma en Python: snippet() con "rowid IN (...)" vuelve a recorrer todas las coincidencias.
+    E = Evaluacion.__table__
+    fts = table("evaluaciones_fts", column("rowid"), column("rank"))
+    coincide = text("evaluaciones_fts MATCH :consulta").bindparams(consulta=_consulta_fts5(frases))
+    q = select(fts.c.rowid).where(coincide)
+    if filtros:
+        q = q.join(E, E.c.id == fts.c.rowid).where(and_(*filtros))
+    # "recientes" = rowid descendente: FTS5 lo recorre en ese orden y corta en el LIMIT
+    q = q.order_by(fts.c.rank, fts.c.rowid.desc()) if orden == "relevancia" else q.order_by(fts.c.rowid.desc())
+    ids = [i for (i,) in session.execute(q.offset(desde).limit(limite + 1))]
+    pagina = ids[:limite]
+    if not pagina:
+        return [], False
+    detalle = select(E.c.id, E.c.alumno_id, Alumno.nombre_completo, Materia.nombre, E.c.instancia, E.c.nota, E.c.fecha, E.c.comentario) \
+        .select_from(E).outerjoin(Alumno, Alumno.id == E.c.alumno_id).outerjoin(Materia, Materia.id == E.c.materia_id).where(E.c.id.in_(pagina))
+    por_id = {f[0]: tuple(f[:-1]) + (_fragmento(f[-1], frases),) for f in session.execute(detalle)}
+    return [por_id[i] for i in pagina if i in por_id], len(ids) > limite
+
+
+def buscar_comentarios(session, texto, materia_id=None, instancia=None, fecha_desde=None, fecha_hasta=None,
+                       nota_min=None, nota_max=None, orden="relevancia", limite=TAMANO_PAGINA, desde=0):
+    # Devuelve ([(evaluacion_id, alumno_id, alumno, materia, instancia, nota, fecha, fragmento), ...], hay_mas).
+    # orden: "relevancia" (bm25 / ts_rank) o "recientes" (las últimas cargadas primero).
+    frases = terminos(texto)
+    modo = _modo(session.get_bind()) if frases else None
+    E = Evaluacion.__table__
+    filtros = [c for c in (
+        E.c.materia_id == materia_id if materia_id else None,
+        E.c.instancia == instancia if instancia else None,
+        E.c.fecha >= fecha_desde if fecha_desde else None,
+        E.c.fecha <= fecha_hasta if fecha_hasta else None,
+        E.c.nota >= nota_min if nota_min is not None else None,
+        E.c.nota <= nota_max if nota_max is not None else None,
+    ) if c is not None]
+    if modo == "fts5":
+        return _pagina_fts5(session, frases, filtros, orden, limite, desde)
+
+    columnas = [E.c.id, E.c.alumno_id, Alumno.nombre_completo, Materia.nombre, E.c.instancia, E.c.nota, E.c.fecha]
+    relevancia = None
+    # El tsvector y lower(comentario) conservan las tildes: la consulta va con las palabras tal como se escribieron
+    originales = terminos(texto, sin_tildes=False)
+    if modo == "tsvector":
+        consulta = func.websearch_to_tsquery("spanish", " ".join(f'"{f}"' if " " in f else f for f in originales))
+        fragmento = func.ts_headline("spanish", E.c.comentario, consulta,
+                                     f"StartSel={MARCA_INICIO}, StopSel={MARCA_FIN}, MaxWords={PALABRAS_FRAGMENTO}, MinWords=6")
+        q = select(*columnas, fragmento).select_from(E).where(literal_column("evaluaciones.comentario_tsv").op("@@")(consulta))
+        relevancia = func.ts_rank(literal_column("evaluaciones.comentario_tsv"), consulta).desc()
+    else:
+        q = select(*columnas, E.c.comentario).select_from(E).where(E.c.comentario.isnot(None))
+        for f in originales:  # Acá las tildes sí cuentan ("revolucion" no encuentra "revolución")
+            q = q.where(func.lower(E.c.comentario).contains(f, autoescape=True))
+
+    q = q.outerjoin(Alumno, Alumno.id == E.c.alumno_id).outerjoin(Materia, Materia.id == E.c.materia_id)
+    if filtros:
+        q = q.where(and_(*filtros))
+    q = q.order_by(relevancia, E.c.id.desc()) if orden == "relevancia" and relevancia is not None else q.order_by(E.c.id.desc())
+    filas = session.execute(q.offset(desde).limit(limite + 1)).all()
+    if modo != "tsvector":
+        # LIKE (o sin texto): el fragmento se arma acá
+        filas = [tuple(f[:-1]) + (_fragmento(f[-1], frases),) for f in filas]
+    return [tuple(f) for f in filas[:limite]], len(filas) > limite
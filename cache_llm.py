@@ -0,0 +1,155 @@
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text, update
+from sqlalchemy.orm import sessionmaker
+
+from config_db import crear_engine
+from crear_base_datos import RespuestaCacheada
+
+# --- CONFIGURACIÓN ---
+TTL_HORAS = 24 * 7                 # Una respuesta vale una semana
+MAX_BYTES = 20 * 1024 * 1024       # Tamaño total máximo de las respuestas guardadas
+ESPERA_ESCRITURA_MS = 500          # Con la base ocupada la caché espera esto como mucho y sigue sin guardar (no los 5 s de la app)
+ACTUALIZAR_USO_CADA = timedelta(minutes=10)  # Un acierto escribe ultimo_uso como mucho una vez en este lapso (LRU aproximado)
+REVISAR_TAMANO_CADA = 50           # Escrituras entre dos revisiones del tamaño total (se puede pasar un poco de max_bytes)
+
+# La caché queda apagada hasta que alguien llame a configurar_cache(engine)
+_config = {"Session": None, "ttl": timedelta(hours=TTL_HORAS), "max_bytes": MAX_BYTES}
+_contadores = {"aciertos": 0, "fallos": 0, "vencidas": 0, "desalojadas": 0, "errores": 0, "escrituras": 0}
+_usos_pendientes = {}              # clave -> aciertos que todavía no se sumaron a "usos" en la base
+_lock = threading.Lock()
+
+
+def configurar_cache(engine, ttl_horas=TTL_HORAS, max_bytes=MAX_BYTES):
+    _config["Session"] = sessionmaker(bind=_engine_cache(engine))
+    _config["ttl"] = timedelta(hours=ttl_horas)
+    _config["max_bytes"] = max_bytes
+
+
+def _engine_cache(engine):
+    # En SQLite la caché usa conexiones propias con busy_timeout corto: mientras otro guarda (ej: una
+    # tanda de la corrección masiva, ~0,1 s) la llamada a la IA no queda esperando los 5 s de la app
+    url = engine.url
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:") or url.query.get("mode") == "memory":
+        return engine
+    return crear_engine(url.render_as_string(hide_password=False), secretos={"SQLITE_BUSY_TIMEOUT_MS": ESPERA_ESCRITURA_MS})
+
+
+def _espera_corta(session):
+    # En Postgres, el mismo tope para los bloqueos de fila que espere una escritura de la caché
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text(f"SET LOCAL lock_timeout = {ESPERA_ESCRITURA_MS}"))
+
+
+def cache_activa():
+    return _config["Session"] is not None
+
+
+def _contar(nombre, n=1):
+    with _lock:
+        _contadores[nombre] += n
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_contadores)
+    consultas = datos["aciertos"] + datos["fallos"]
+    datos["tasa_aciertos"] = datos["aciertos"] / consultas if consultas else 0.0
+    return datos
+
+
+def clave_cache(modelo, temperatura, mensajes, **extras):
+    # Clave por contenido: cualquier cambio en el prompt (o en las notas que lleva adentro) cambia la clave
+    datos = json.dumps({"modelo": modelo, "temperatura": temperatura, "mensajes": mensajes, **extras}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(datos.encode("utf-8")).hexdigest()
+
+
+# --- LECTURA ---
+def leer(clave):
+    if not cache_activa():
+        return None
+    try:
+        with _config["Session"]() as session:
+            fila = session.get(RespuestaCacheada, clave)
+            if fila is None:
+                _contar("fallos")
+                return None
+            ahora = datetime.now()
+            if fila.creado and ahora - fila.creado > _config["ttl"]:
+                _contar("vencidas"); _contar("fallos")
+                _espera_corta(session); session.delete(fila); session.commit()
+                return None
+            respuesta = fila.respuesta
+            _contar("aciertos")
+            with _lock:
+                _usos_pendientes[clave] = _usos_pendientes.get(clave, 0) + 1
+            if fila.ultimo_uso is None or ahora - fila.ultimo_uso > ACTUALIZAR_USO_CADA:
+                _marcar_uso(session, clave, ahora)
+            return respuesta
+    except Exception:
+        # Si la caché falla (ej: base bloqueada), se sigue como si no existiera
+        _contar("errores")
+        return None
+
+
+def _marcar_uso(session, clave, ahora):
+    # Una escritura cada ACTUALIZAR_USO_CADA por respuesta, con los aciertos juntados hasta acá.
+    # Si la base está ocupada no pasa nada: los aciertos quedan para la próxima vez.
+    with _lock:
+        usos = _usos_pendientes.pop(clave, 0)
+    try:
+        _espera_corta(session)
+        session.execute(update(RespuestaCacheada).where(RespuestaCacheada.clave == clave)
+                        .values(ultimo_uso=ahora, usos=func.coalesce(RespuestaCacheada.usos, 0) + usos))
+        session.commit()
+    except Exception:
+        session.rollback()
+        with _lock:
+            _usos_pendientes[clave] = _usos_pendientes.get(clave, 0) + usos
+
+
+# --- ESCRITURA + DESALOJO (LRU por tamaño) ---
+def guardar(clave, modelo, temperatura, respuesta):
+    if not cache_activa():
+        return
+    with _lock:
+        _contadores["escrituras"] += 1
+        revisar = (_contadores["escrituras"] - 1) % REVISAR_TAMANO_CADA == 0  # La primera escritura del proceso también revisa
+    try:
+        with _config["Session"]() as session:
+            ahora = datetime.now()
+            _espera_corta(session)
+            session.merge(RespuestaCacheada(clave=clave, modelo=modelo, temperatura=temperatura, respuesta=respuesta,
+                                            tamano=len(respuesta.encode("utf-8")), creado=ahora, ultimo_uso=ahora, usos=0))
+            session.flush()
+            if revisar:
+                _desalojar(session)
+            session.commit()
+    except Exception:
+        _contar("errores")
+
+
+def _desalojar(session):
+    total = session.query(func.coalesce(func.sum(RespuestaCacheada.tamano), 0)).scalar()
+    exceso = total - _config["max_bytes"]
+    if exceso <= 0:
+        return
+    # Se borran las menos usadas recientemente hasta volver a entrar en el límite
+    borrar = []
+    for clave, tamano in session.query(RespuestaCacheada.clave, RespuestaCacheada.tamano).order_by(RespuestaCacheada.ultimo_uso).yield_per(500):
+        borrar.append(clave); exceso -= tamano or 0
+        if exceso <= 0:
+            break
+    session.query(RespuestaCacheada).filter(RespuestaCacheada.clave.in_(borrar)).delete(synchronize_session=False)
+    _contar("desalojadas", len(borrar))
+
+
+def vaciar_cache():
+    if cache_activa():
+        with _config["Session"]() as session:
+            session.query(RespuestaCacheada).delete(); session.commit()
+        with _lock:
+            _usos_pendientes.clear()
@@ -1,16 +1,15 @@
-import os
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
 # Importamos las tablas que diseñamos en el archivo anterior
 # NOTA: Asegúrate de que el archivo anterior se llame 'crear_base_datos.py'
 from crear_base_datos import Alumno, Materia, Evaluacion, Base
+import agregados  # noqa: F401 - registra los eventos que mantienen los agregados de notas
+from config_db import crear_engine
 
-# --- CONFIGURACIÓN DE LA RUTA ESPECÍFICA ---
-# Usamos 'r' antes de las comillas para indicar una "raw string" y evitar problemas con las barras invertidas de Windows
-ruta_db = r'C:\Users\Silicon40\Documents\ProyectosPython\seguimiento_alumnos\sistema_escolar.db'
-engine = create_engine(f'sqlite:///{ruta_db}')
+# --- CONFIGURACIÓN ---
+# La misma base que el dashboard: DATABASE_URL o sistema_escolar.db junto a los scripts (ver config_db.py)
+engine = crear_engine()
 
 # Creamos la Sesión (es como abrir una transacción en el banco)
 Session = sessionmaker(bind=engine)
@@ -67,4 +66,4 @@ session.add(evaluacion_2)
 session.commit()
 
 print("✅ ¡Datos guardados exitosamente en la base de datos!")
-print(f"📂 Ubicación verificada: {ruta_db}")
\ No newline at end of file
+print(f"📂 Ubicación verificada: {engine.url.render_as_string(hide_password=True)}")
\ No newline at end of file
@@ -0,0 +1,371 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+
+import instrumentacion
+from motor_correccion import MAX_CONCURRENCIA, SOLICITUDES_POR_MINUTO
+
+# --- CLIENTE DE IA (uno por proceso, con reintentos) ---
+# Todas las llamadas al modelo pasan por acá (modulo_ia_github arma los prompts y la caché):
+#   - un solo cliente HTTP por proceso (conexiones keep-alive reutilizadas), sync y async
+#   - cubeta de fichas por proceso: como máximo IA_RPM solicitudes por minuto entre todos los hilos
+#     (el chat, la Corrección Masiva y las recomendaciones comparten la cuota)
+#   - un 429 frena a TODO el proceso lo que diga Retry-After, no solo al hilo que lo recibió
+#   - reintentos con espera exponencial con jitter para 5xx, timeouts y cortes de conexión
+#   - disyuntor: después de varias fallas seguidas se deja de llamar un rato (falla rápido)
+#   - presupuesto de tiempo por llamada: esperas + reintentos nunca pasan de IA_PRESUPUESTO segundos
+# Si aun así no se puede, se lanza un ErrorIA (nunca se devuelve un texto de error como si fuera
+# la respuesta): quien llama decide si reintenta más tarde (ver trabajos.py y recomendaciones.py).
+
+TIMEOUT_SOLICITUD = 60.0    # Segundos por intento
+PRESUPUESTO = 120.0         # Segundos por llamada, contando esperas y reintentos
+MAX_REINTENTOS = 4
+ESPERA_BASE = 1.0           # Primer reintento: hasta 1 s, después 2, 4, 8... (con jitter)
+ESPERA_TOPE = 30.0
+FALLOS_PARA_ABRIR = 5       # Fallas seguidas (5xx, timeouts) que abren el disyuntor
+ENFRIAMIENTO = 30.0         # Segundos con el disyuntor abierto antes de probar de nuevo
+
+
+def _ajuste(nombre, por_defecto):
+    # st.secrets (dashboard) o variable de entorno (worker, benchmarks)
+    try:
+        import streamlit as st
+        return st.secrets[nombre]
+    except Exception:
+        return os.environ.get(nombre, por_defecto)
+
+
+# --- ERRORES ---
+class ErrorIA(Exception):
+    # reintentable: vale la pena volver a pedirlo más tarde. espera: segundos sugeridos (o None)
+    reintentable = True
+
+    def __init__(self, mensaje, espera=None, estado=None):
+        super().__init__(mensaje)
+        self.espera = espera
+        self.estado = estado
+
+
+class LimiteAlcanzado(ErrorIA):
+    pass   # 429, o la cubeta del proceso no da una ficha dentro del presupuesto: la API no llegó a procesar nada
+
+
+class CircuitoAbierto(ErrorIA):
+    pass   # Muchas fallas seguidas: no se llama hasta que pase el enfriamiento
+
+
+class ErrorTemporal(ErrorIA):
+    pass   # 5xx, timeout o corte de conexión, después de agotar los reintentos
+
+
+class ErrorPermanente(ErrorIA):
+    reintentable = False   # 400, 401, 403, 404...: repetir no cambia nada
+
+
+def sin_gastar_intento(error):
+    # La solicitud no llegó a procesarse (límite o disyuntor): la fila espera y vuelve sin contar como intento
+    return isinstance(error, (LimiteAlcanzado, CircuitoAbierto))
+
+
+def _retry_after(respuesta):
+    # Segundos que pide el servidor: retry-after-ms, retry-after en segundos o como fecha HTTP
+    encabezados = getattr(respuesta, "headers", None) or {}
+    try:
+        if encabezados.get("retry-after-ms"):
+            return float(encabezados["retry-after-ms"]) / 1000
+        valor = encabezados.get("retry-after")
+        if valor:
+            try:
+                return float(valor)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except Exception:
+        pass
+    return None
+
+
+def _traducir(e):
+    if isinstance(e, ErrorIA):
+        return e
+    import openai
+    if isinstance(e, openai.APITimeoutError):
+        return ErrorTemporal(f"Tiempo agotado: {e}")
+    if isinstance(e, openai.APIConnectionError):
+        return ErrorTemporal(f"Sin conexión: {e}")
+    if isinstance(e, openai.APIStatusError):
+        estado = e.status_code
+        if estado == 429:
+            return LimiteAlcanzado(f"Límite de solicitudes (429): {e}", _retry_after(e.response), estado)
+        if estado in (408, 409) or estado >= 500:
+            return ErrorTemporal(f"Error del servidor ({estado}): {e}", _retry_after(e.response), estado)
+        return ErrorPermanente(f"Solicitud rechazada ({estado}): {e}", estado=estado)
+    return ErrorTemporal(f"{type(e).__name__}: {e}")
+
+
+# --- CUBETA DE FICHAS (límite de tasa del proceso) ---
+class Cubeta:
+    # `rpm` fichas por minuto, hasta `rafaga` acumuladas. Se reserva la ficha bajo el lock y la espera
+    # se hace afuera (time.sleep o asyncio.sleep), así sirve igual para hilos y para corrutinas.
+    def __init__(self, rpm, rafaga):
+        self.tasa = rpm / 60.0 if rpm else 0.0
+        self.rafaga = max(1.0, float(rafaga))
+        self.fichas = self.rafaga
+        self.ultima = time.monotonic()
+        self.pausado_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def reservar(self, maximo):
+        # Segundos a esperar por la ficha (ya descontada), o None si haría falta esperar más que `maximo`
+        with self._lock:
+            ahora = time.monotonic()
+            pausa = max(0.0, self.pausado_hasta - ahora)
+            if not self.tasa:
+                return pausa if pausa <= maximo else None
+            self.fichas = min(self.rafaga, self.fichas + (ahora - self.ultima) * self.tasa)
+            self.ultima = ahora
+            espera = max(pausa, (1 - self.fichas) / self.tasa if self.fichas < 1 else 0.0)
+            if espera > maximo:
+                return None
+            self.fichas -= 1
+            return espera
+
+    def pausar(self, segundos):
+        # Retry-After: nadie en el proceso llama antes de que pase
+        with self._lock:
+            self.pausado_hasta = max(self.pausado_hasta, time.monotonic() + segundos)
+            self.fichas = min(self.fichas, 0.0)
+
+    def espera_pausa(self):
+        return max(0.0, self.pausado_hasta - time.monotonic())
+
+
+# --- DISYUNTOR ---
+class Disyuntor:
+    # cerrado -> (FALLOS_PARA_ABRIR fallas seguidas) -> abierto -> (ENFRIAMIENTO) -> medio abierto:
+    # pasa una sola llamada de prueba; si anda se cierra, si falla se vuelve a abrir
+    def __init__(self, fallos=FALLOS_PARA_ABRIR, enfriamiento=ENFRIAMIENTO):
+        self.fallos_para_abrir = fallos
+        self.enfriamiento = enfriamiento
+        self.fallos = 0
+        self.abierto_hasta = None
+        self.probando = False
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if self.abierto_hasta is None:
+                return
+            restante = self.abierto_hasta - time.monotonic()
+            if restante > 0 or self.probando:
+                instrumentacion.contar("llm_rechazadas_total", {"motivo": "disyuntor"})
+                raise CircuitoAbierto(f"La IA falló {self.fallos} veces seguidas; se reintenta en {max(restante, 1):.0f} s",
+                                      espera=max(restante, 1.0))
+            self.probando = True
+
+    def exito(self):
+        with self._lock:
+            self.fallos = 0; self.abierto_hasta = None; self.probando = False
+
+    def abandonar(self):
+        # La llamada terminó sin respuesta ni error de la API (GeneratorExit, KeyboardInterrupt, un rerun
+        # de Streamlit...): si era la de prueba, se libera para que la próxima pruebe de nuevo.
+        # Mientras hay una prueba el resto se rechaza en permitir(), así que quien llega acá es la prueba.
+        with self._lock:
+            self.probando = False
+
+    def fallo(self):
+        with self._lock:
+            self.fallos += 1
+            if self.probando or self.fallos >= self.fallos_para_abrir:
+                if self.abierto_hasta is None or self.probando:
+                    instrumentacion.contar("llm_disyuntor_aperturas_total")
+                self.abierto_hasta = time.monotonic() + self.enfriamiento
+                self.probando = False
+
+    def estado(self):
+        with self._lock:
+            if self.abierto_hasta is None:
+                return "cerrado"
+            return "medio_abierto" if self.probando or time.monotonic() >= self.abierto_hasta else "abierto"
+
+
+# --- CONFIGURACIÓN Y CLIENTES (se crean recién en la primera llamada) ---
+_config = {}
+_estado = {"cliente": None, "cubeta": None, "disyuntor": Disyuntor()}
+_clientes_async = weakref.WeakKeyDictionary()   # event loop -> AsyncOpenAI (sus conexiones no se comparten entre loops)
+_lock = threading.Lock()
+
+
+def configurar(base_url=None, api_key=None, rpm=None, rafaga=None, timeout=None, presupuesto=None, reintentos=None):
+    # Sin argumentos toma secrets / variables de entorno. Los benchmarks lo usan para apuntar al servidor falso.
+    with _lock:
+        _config.update({
+            "base_url": base_url or _ajuste("IA_BASE_URL", "https://models.inference.ai.azure.com"),
+            "api_key": api_key or _ajuste("GITHUB_TOKEN", ""),
+            "timeout": float(timeout or _ajuste("IA_TIMEOUT", TIMEOUT_SOLICITUD)),
+            "presupuesto": float(presupuesto or _ajuste("IA_PRESUPUESTO", PRESUPUESTO)),
+            "reintentos": int(reintentos if reintentos is not None else _ajuste("IA_REINTENTOS", MAX_REINTENTOS)),
+        })
+        rpm = int(rpm if rpm is not None else _ajuste("IA_RPM", SOLICITUDES_POR_MINUTO))
+        _estado["cubeta"] = Cubeta(rpm, rafaga or int(_ajuste("IA_MAX_CONCURRENCIA", MAX_CONCURRENCIA)))
+        _estado["cliente"] = None
+        _clientes_async.clear()
+
+
+def _ajustes():
+    if not _config:
+        configurar()
+    return _config
+
+
+def cliente():
+    # max_retries=0: los reintentos los maneja este módulo (con la cubeta y el disyuntor compartidos)
+    if _estado["cliente"] is None:
+        import openai   # Acá y no arriba: importar openai (y httpx) cuesta ~0,4 s y el dashboard arranca sin usarlo
+        c = _ajustes()
+        with _lock:
+            if _estado["cliente"] is None:
+                _estado["cliente"] = openai.OpenAI(base_url=c["base_url"], api_key=c["api_key"], max_retries=0, timeout=c["timeout"])
+    return _estado["cliente"]
+
+
+def cliente_async():
+    loop = asyncio.get_running_loop()
+    if loop not in _clientes_async:
+        import openai
+        c = _ajustes()
+        _clientes_async[loop] = openai.AsyncOpenAI(base_url=c["base_url"], api_key=c["api_key"], max_retries=0, timeout=c["timeout"])
+    return _clientes_async[loop]
+
+
+def estado():
+    # Disyuntor y pausa por Retry-After
+    _ajustes()
+    return {"disyuntor": _estado["disyuntor"].estado(), "pausa_segundos": round(_estado["cubeta"].espera_pausa(), 1)}
+
+
+def metricas():
+    # Gauges para Prometheus (ver instrumentacion.texto_prometheus)
+    e = estado()
+    return {"ia_disyuntor_abierto": int(e["disyuntor"] != "cerrado"), "ia_pausa_segundos": e["pausa_segundos"]}
+
+
+# --- LLAMADAS ---
+def _espera_reintento(intento, error):
+    # Retry-After si vino; si no, exponencial con jitter completo (los hilos no se sincronizan)
+    if error.espera is not None:
+        return error.espera
+    return random.uniform(0, min(ESPERA_TOPE, ESPERA_BASE * 2 ** intento))
+
+
+def _turno(limite):
+    # Reserva una ficha y chequea el disyuntor: devuelve los segundos a esperar antes de llamar
+    _ajustes()
+    cubeta = _estado["cubeta"]
+    espera = cubeta.reservar(max(0.0, limite - time.monotonic()))
+    if espera is None:
+        instrumentacion.contar("llm_rechazadas_total", {"motivo": "limite"})
+        raise LimiteAlcanzado("Límite de solicitudes por minuto: no hay turno dentro del presupuesto de tiempo",
+                              espera=max(cubeta.espera_pausa(), 1 / cubeta.tasa if cubeta.tasa else 1.0))
+    _estado["disyuntor"].permitir()
+    return espera
+
+
+def _registrar_fallo(error):
+    if isinstance(error, ErrorTemporal):
+        _estado["disyuntor"].fallo()
+        return
+    if isinstance(error, LimiteAlcanzado):
+        _estado["cubeta"].pausar(error.espera if error.espera is not None else ESPERA_BASE)
+    _estado["disyuntor"].exito()   # Un 429 o un 400 son respuestas: el servicio anda (el 429 lo maneja la cubeta)
+
+
+def _decidir(intento, error, limite):
+    # Devuelve cuánto esperar antes del próximo intento, o lanza el error si no hay que reintentar
+    _registrar_fallo(error)
+    if not error.reintentable or intento >= _ajustes()["reintentos"]:
+        raise error
+    espera = _espera_reintento(intento, error)
+    if time.monotonic() + espera >= limite:
+        raise error
+    instrumentacion.contar("llm_reintentos_total", {"motivo": type(error).__name__})
+    return espera
+
+
+def _pedido(kwargs, limite):
+    # Cada intento usa lo que quede del presupuesto como timeout
+    return dict(kwargs, timeout=max(1.0, min(_ajustes()["timeout"], limite - time.monotonic())))
+
+
+def completar(presupuesto=None, **kwargs):
+    # chat.completions.create(**kwargs) con límite, reintentos y disyuntor. Lanza ErrorIA si no se pudo.
+    limite = time.monotonic() + (presupuesto or _ajustes()["presupuesto"])
+    intento = 0
+    while True:
+        time.sleep(_turno(limite))
+        try:
+            respuesta = cliente().chat.completions.create(**_pedido(kwargs, limite))
+            _estado["disyuntor"].exito()
+            return respuesta
+        except Exception as e:
+            error = _traducir(e)
+            time.sleep(_decidir(intento, error, limite))
+            intento += 1
+        except BaseException:
+            _estado["disyuntor"].abandonar()
+            raise
+
+
+async def completar_async(presupuesto=None, **kwargs):
+    limite = time.monotonic() + (presupuesto or _ajustes()["presupuesto"])
+    intento = 0
+    while True:
+        await asyncio.sleep(_turno(limite))
+        try:
+            respuesta = await cliente_async().chat.completions.create(**_pedido(kwargs, limite))
+            _estado["disyuntor"].exito()
+            return respuesta
+        except Exception as e:
+            error = _traducir(e)
+            await asyncio.sleep(_decidir(intento, error, limite))
+            intento += 1
+        except BaseException:   # Incluye la cancelación de la tarea (asyncio.CancelledError)
+            _estado["disyuntor"].abandonar()
+            raise
+
+
+def completar_stream(presupuesto=None, **kwargs):
+    # Generador de pedazos (chunks). Solo se reintenta hasta que llega el primero:
+    # con texto ya entregado a la pantalla no se puede volver a empezar.
+    limite = time.monotonic() + (presupuesto or _ajustes()["presupuesto"])
+    intento = 0
+    while True:
+        time.sleep(_turno(limite))
+        try:
+            stream = cliente().chat.completions.create(stream=True, **_pedido(kwargs, limite))
+            iterador = iter(stream)
+            primero = next(iterador, None)
+            # El servicio respondió: el disyuntor se resuelve acá y no al final, así un stream que se corta
+            # a mitad (el usuario hace otro clic y llega GeneratorExit) no deja la prueba colgada
+            _estado["disyuntor"].exito()
+            break
+        except Exception as e:
+            error = _traducir(e)
+            time.sleep(_decidir(intento, error, limite))
+            intento += 1
+        except BaseException:
+            _estado["disyuntor"].abandonar()
+            raise
+    try:
+        if primero is not None:
+            yield primero
+        for chunk in iterador:
+            yield chunk
+    except Exception as e:
+        error = _traducir(e)
+        _registrar_fallo(error)
+        raise error from e
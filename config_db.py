@@ -0,0 +1,102 @@
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+# --- CONFIGURACIÓN ÚNICA DE LA BASE DE DATOS ---
+# Todos los scripts (dashboard, worker, carga de datos, benchmarks) sacan el engine de acá.
+# Los valores se leen de st.secrets (si se pasan) y si no de variables de entorno:
+#   DATABASE_URL          postgresql://... (si no está, SQLite en sistema_escolar.db junto a este archivo)
+#   DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT   (solo Postgres)
+#   DB_SSLMODE            require por defecto en Postgres remoto
+#   DB_QUERY_CACHE_SIZE   sentencias compiladas que SQLAlchemy guarda por engine
+#   SQLITE_MMAP_MB, SQLITE_BUSY_TIMEOUT_MS
+#   DB_ECHO               1 para ver el SQL en consola (solo para depurar)
+
+RUTA_SQLITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sistema_escolar.db")
+POR_DEFECTO = {
+    "DB_POOL_SIZE": 5,
+    "DB_MAX_OVERFLOW": 10,
+    "DB_POOL_RECYCLE": 1800,     # Segundos: Postgres gestionados cortan conexiones viejas
+    "DB_POOL_TIMEOUT": 30,
+    "DB_QUERY_CACHE_SIZE": 1200,
+    "SQLITE_MMAP_MB": 256,
+    "SQLITE_BUSY_TIMEOUT_MS": 5000,
+}
+
+
+def _valor(nombre, secretos, por_defecto=None):
+    if secretos is not None:
+        try:
+            if nombre in secretos:
+                return secretos[nombre]
+        except Exception:
+            pass  # st.secrets sin archivo de secretos
+    return os.environ.get(nombre, por_defecto)
+
+
+def es_verdadero(valor):
+    # Secretos y variables de entorno pueden venir como bool, número o texto ("false", "0", "no")
+    if isinstance(valor, str):
+        return valor.strip().lower() in ("1", "true", "si", "sí", "yes", "on")
+    return bool(valor)
+
+
+def url_base_datos(secretos=None):
+    url = _valor("DATABASE_URL", secretos)
+    if not url:
+        return f"sqlite:///{RUTA_SQLITE}"
+    return url.replace("postgres://", "postgresql://", 1) if url.startswith("postgres://") else url
+
+
+def _pragmas_sqlite(mmap_bytes, busy_ms):
+    def al_conectar(conexion_dbapi, registro):
+        # WAL: los lectores (pestañas de Streamlit) no se bloquean mientras el worker escribe
+        cursor = conexion_dbapi.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")   # Seguro con WAL y mucho más rápido que FULL
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_ms)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+    return al_conectar
+
+
+def crear_engine(url=None, secretos=None, **extras):
+    # url explícita (benchmarks, CLI) o la de la configuración. extras pisa cualquier opción de create_engine.
+    url = url or url_base_datos(secretos)
+    numero = lambda nombre: int(_valor(nombre, secretos, POR_DEFECTO.get(nombre)))
+    opciones = {"query_cache_size": numero("DB_QUERY_CACHE_SIZE"), "echo": es_verdadero(_valor("DB_ECHO", secretos, "0"))}
+    destino = make_url(url)
+
+    if destino.get_backend_name() == "sqlite":
+        opciones["connect_args"] = {"check_same_thread": False, "timeout": numero("SQLITE_BUSY_TIMEOUT_MS") / 1000}
+        opciones.update(extras)
+        engine = create_engine(url, **opciones)
+        if destino.database and destino.database != ":memory:":
+            event.listen(engine, "connect", _pragmas_sqlite(numero("SQLITE_MMAP_MB") * 1024 * 1024, numero("SQLITE_BUSY_TIMEOUT_MS")))
+        return engine
+
+    opciones.update(pool_size=numero("DB_POOL_SIZE"), max_overflow=numero("DB_MAX_OVERFLOW"), pool_recycle=numero("DB_POOL_RECYCLE"),
+                    pool_timeout=numero("DB_POOL_TIMEOUT"), pool_pre_ping=True)
+    if destino.get_backend_name() == "postgresql":
+        local = destino.host in (None, "", "localhost", "127.0.0.1")
+        sslmode = _valor("DB_SSLMODE", secretos, None if local else "require")
+        if sslmode:
+            opciones["connect_args"] = {"sslmode": sslmode}
+    opciones.update(extras)
+    return create_engine(url, **opciones)
+
+
+@contextmanager
+def sesion(Session):
+    # Una sesión por pedido (rerun, trabajo del worker, script): se cierra siempre y hace rollback si algo falla
+    s = Session()
+    try:
+        yield s
+    except Exception:
+        s.rollback()
+        raise
+    finally:
+        s.close()
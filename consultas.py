@@ -0,0 +1,37 @@
+from sqlalchemy.orm import selectinload, load_only
+
+from crear_base_datos import Alumno, Materia, Evaluacion
+
+# --- CAPA DE LECTURA ---
+# Consultas armadas de antemano para las pantallas. Cada una hace una cantidad fija
+# de SELECT sin importar cuántas notas tenga el alumno (nada de alumno.evaluaciones
+# + ev.materia en un for, que dispara una consulta por fila), y nunca trae
+# Materia.programa salvo que se pida.
+
+COLUMNAS_HISTORIAL = ["Fecha", "Materia", "Instancia", "Nota", "Comentario"]
+
+
+def historial_alumno(session, alumno_id):
+    # Una sola consulta con JOIN, solo las columnas que se muestran
+    return session.query(Evaluacion.fecha, Materia.nombre, Evaluacion.instancia, Evaluacion.nota, Evaluacion.comentario) \
+        .join(Materia, Materia.id == Evaluacion.materia_id) \
+        .filter(Evaluacion.alumno_id == alumno_id) \
+        .order_by(Evaluacion.fecha, Evaluacion.id).all()
+
+
+def notas_alumno(session, alumno_id):
+    return [n for (n,) in session.query(Evaluacion.nota).filter_by(alumno_id=alumno_id).order_by(Evaluacion.fecha, Evaluacion.id)]
+
+
+def alumno_con_historial(session, alumno_id):
+    # Alumno + evaluaciones + nombre de la materia en 2 consultas (para el PDF)
+    return session.query(Alumno).options(
+        selectinload(Alumno.evaluaciones).joinedload(Evaluacion.materia).load_only(Materia.id, Materia.nombre)
+    ).filter(Alumno.id == alumno_id).first()
+
+
+def materias_de_alumno(session, alumno_id):
+    # Materias en las que el alumno tiene notas, sin el programa (para el chat RAG)
+    return session.query(Materia).options(load_only(Materia.id, Materia.nombre)) \
+        .filter(Materia.id.in_(session.query(Evaluacion.materia_id).filter_by(alumno_id=alumno_id))) \
+        .order_by(Materia.nombre).all()
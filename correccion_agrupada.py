@@ -0,0 +1,96 @@
+import json
+import re
+
+from indice_rag import TAMANO_FRAGMENTO, SOLAPE
+
+# --- CORRECCIÓN AGRUPADA (varios alumnos por llamada) ---
+# En vez de mandar el mismo contexto bibliográfico una vez por alumno, se arma un solo
+# prompt con el contexto y las respuestas de K alumnos, y se pide un arreglo JSON con
+# una devolución por alumno. K se elige según cuántos tokens entran en la llamada.
+# Si la respuesta no se puede leer, los alumnos que falten se corrigen de a uno.
+
+PRESUPUESTO_ENTRADA = 6000      # Tokens de entrada (llama-3.1-8b en GitHub Models acepta 8000)
+MAX_SALIDA = 4000               # Tokens de salida máximos por llamada
+SALIDA_POR_ALUMNO = 150         # Un párrafo de devolución
+MAX_ALUMNOS_POR_LLAMADA = 8
+FRAGMENTOS_CONTEXTO = 4
+# Tope del contexto: se reserva antes de saber qué fragmentos van a salir
+TOKENS_CONTEXTO = FRAGMENTOS_CONTEXTO * (TAMANO_FRAGMENTO + SOLAPE) // 3
+
+INSTRUCCIONES = """
+    TAREA:
+    Para CADA alumno, por separado, identifica errores conceptuales basándote en la bibliografía.
+    Si está bien, felicita brevemente.
+    Si está mal, explica por qué citando el tema.
+    Sé directo y constructivo. Máximo 1 párrafo por alumno.
+
+    Responde SOLO con un arreglo JSON, sin texto antes ni después, con un objeto por alumno:
+    [{"alumno": 1, "devolucion": "..."}, {"alumno": 2, "devolucion": "..."}]
+    """
+
+
+def estimar_tokens(texto):
+    # Sin tokenizador a mano: en español un token son ~3-4 caracteres (se estima de más)
+    return len(texto) // 3 + 1
+
+
+def texto_examen(respuestas):
+    return "".join(f"\n- PREGUNTA: {preg}\n  RESPUESTA ALUMNO: {resp}\n" for preg, resp in respuestas.items())
+
+
+def armar_grupos(filas, max_por_grupo=MAX_ALUMNOS_POR_LLAMADA, presupuesto=PRESUPUESTO_ENTRADA):
+    # filas: [(item, datos)] en orden. Junta alumnos mientras entren en el presupuesto de entrada y de salida.
+    tope = max(1, min(max_por_grupo, MAX_SALIDA // SALIDA_POR_ALUMNO))
+    base = TOKENS_CONTEXTO + estimar_tokens(INSTRUCCIONES) + 100
+    grupos, actual, usados = [], [], base
+    for item, datos in filas:
+        tokens = estimar_tokens(texto_examen(datos["respuestas"])) + 20
+        if actual and (len(actual) >= tope or usados + tokens > presupuesto):
+            grupos.append(actual); actual, usados = [], base
+        actual.append((item, datos)); usados += tokens
+    if actual:
+        grupos.append(actual)
+    return grupos
+
+
+def prompt_grupo(contexto_rag, grupo):
+    alumnos = "".join(f"\n    [ALUMNO {n}] {datos['nombre']}{texto_examen(datos['respuestas'])}" for n, (_, datos) in enumerate(grupo, 1))
+    return f"""
+    Actúa como profesor experto. Tienes este contexto bibliográfico de la materia:
+    {contexto_rag}
+
+    Evalúa las respuestas de estos {len(grupo)} alumnos:
+    {alumnos}
+    {INSTRUCCIONES}"""
+
+
+def max_tokens_grupo(grupo):
+    return min(MAX_SALIDA, SALIDA_POR_ALUMNO * len(grupo) + 50)
+
+
+def leer_devoluciones(texto, cantidad):
+    # Devuelve {n: devolución} solo con las entradas válidas (n de 1 a cantidad, texto no vacío)
+    if not texto:
+        return {}
+    texto = re.sub(r"^```(?:json)?|```$", "", texto.strip(), flags=re.MULTILINE)
+    inicio, fin = texto.find("["), texto.rfind("]")
+    if inicio < 0 or fin <= inicio:
+        return {}
+    try:
+        datos = json.loads(texto[inicio:fin + 1])
+    except ValueError:
+        return {}
+    if not isinstance(datos, list):
+        return {}
+    devoluciones = {}
+    for entrada in datos:
+        if not isinstance(entrada, dict):
+            continue
+        try:
+            n = int(entrada.get("alumno"))
+        except (TypeError, ValueError):
+            continue
+        devolucion = entrada.get("devolucion")
+        if 1 <= n <= cantidad and n not in devoluciones and isinstance(devolucion, str) and devolucion.strip():
+            devoluciones[n] = devolucion.strip()
+    return devoluciones
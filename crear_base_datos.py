@@ -1,33 +1,34 @@
-import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Text, Date
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+import re
+import unicodedata
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text, Date, DateTime, Index, UniqueConstraint
+from sqlalchemy.orm import declarative_base, relationship, deferred
 from datetime import datetime
 
-# --- CORRECCIÓN: USAR LA RUTA ABSOLUTA ---
-ruta_db = r'C:\Users\Silicon40\Documents\ProyectosPython\seguimiento_alumnos\sistema_escolar.db'
-
-# Fíjate que usamos la variable ruta_db aquí dentro
-engine = create_engine(f'sqlite:///{ruta_db}', echo=True)
-
-Base = declarative_base()
-
 # --- PASO 1: CONFIGURACIÓN ---
-# Aquí definimos que usaremos SQLite.
-# El archivo se llamará "sistema_escolar.db" y se creará en la misma carpeta.
-# echo=True hará que veas en la consola el SQL que se escribe automáticamente (ideal para aprender).
-engine = create_engine('sqlite:///sistema_escolar.db', echo=True)
+# Este archivo solo define las tablas: el engine (SQLite o Postgres, pool, WAL) sale de config_db.py.
+# Por defecto el archivo se llama "sistema_escolar.db" y queda en la misma carpeta.
+# DB_ECHO=1 hace que veas en la consola el SQL que se escribe automáticamente (ideal para aprender).
 
 # Esta es la "plantilla base" de la que heredarán todas nuestras tablas.
 Base = declarative_base()
 
 # --- PASO 2: DEFINICIÓN DE TABLAS (MODELOS) ---
 
+def normalizar_nombre(texto):
+    # Minúsculas, sin tildes y con un solo espacio: "José  Pérez" y "jose perez" se buscan igual
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    return re.sub(r"\s+", " ", "".join(c for c in texto if not unicodedata.combining(c))).strip()
+
+def _nombre_busqueda(contexto):
+    # Default de columna: se calcula también en los insert masivos de Core (importación, benchmarks)
+    return normalizar_nombre(contexto.get_current_parameters().get("nombre_completo"))
+
 class Alumno(Base):
     __tablename__ = 'alumnos'
     
     id = Column(Integer, primary_key=True)
-    nombre_completo = Column(String, nullable=False)
-    año_escolar = Column(Integer)
+    nombre_completo = Column(String, nullable=False, index=True)  # index: para buscar duplicados al importar
+    nombre_busqueda = Column(String, default=_nombre_busqueda, index=True)  # Nombre normalizado (ver busqueda_alumnos.py)
     dni = Column(String, unique=True) # DNI único
     email = Column(String)            # Opcional
     telefono = Column(String)         # Opcional
@@ -45,12 +46,17 @@ class Materia(Base):
     profesor_titular = Column(String)
     
     # --- NUEVO CAMPO DE CONOCIMIENTO ---
-    programa = Column(Text) # Aquí guardaremos bibliografía y temas
+    # deferred: el texto puede ser enorme, así que solo se trae de la base cuando alguien lo usa
+    programa = deferred(Column(Text)) # Aquí guardaremos bibliografía y temas
     
     evaluaciones = relationship("Evaluacion", back_populates="materia")
 
 class Evaluacion(Base):
     __tablename__ = 'evaluaciones' # Nuestra Tabla de Hechos
+    __table_args__ = (
+        Index('ix_evaluaciones_alumno_fecha', 'alumno_id', 'fecha'),  # Historial de un alumno, ya ordenado
+        Index('ix_evaluaciones_materia', 'materia_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     # Claves Foráneas (Foreign Keys) - Los enlaces a las otras tablas
@@ -61,33 +67,198 @@ class Evaluacion(Base):
     nota = Column(Float)       # La calificación numérica
     comentario = Column(Text)  # El texto que leerá la IA (Ej: "Falla en...")
     fecha = Column(Date, default=datetime.now)
+    version = Column(Integer, default=1, server_default="1")  # Sube al cambiar nota o comentario (ver recomendaciones.py)
     
     # Relaciones para navegar
     alumno = relationship("Alumno", back_populates="evaluaciones")
     materia = relationship("Materia", back_populates="evaluaciones")
 
 class Recomendacion(Base):
-    __tablename__ = 'recomendaciones' # La tabla de salida de la IA
+    __tablename__ = 'recomendaciones' # La tabla de salida de la IA (se llena en lote, ver recomendaciones.py)
+    __table_args__ = (
+        Index('ux_recomendaciones_evaluacion', 'evaluacion_id', unique=True),  # Una por evaluación (y el upsert se apoya acá)
+        Index('ix_recomendaciones_alumno', 'alumno_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     alumno_id = Column(Integer, ForeignKey('alumnos.id'))
     materia_id = Column(Integer, ForeignKey('materias.id'))
+    evaluacion_id = Column(Integer, ForeignKey('evaluaciones.id'))
+    version = Column(Integer)  # evaluaciones.version con la que se generó el contenido: si la evaluación cambió, se rehace
+    version_intento = Column(Integer)  # evaluaciones.version del último intento (si falló, version queda como estaba)
     
     contenido = Column(Text)   # El consejo generado por la IA
-    estado = Column(String, default="Pendiente") # Ej: Pendiente, Completada
+    estado = Column(String, default="Pendiente") # Ej: Pendiente, Completada, Error (la IA falló)
+    intentos = Column(Integer, default=0)        # Errores seguidos con la misma version_intento; pasado MAX_INTENTOS no se reintenta sola
+    error = Column(Text)
     fecha_generacion = Column(Date, default=datetime.now)
     
     alumno = relationship("Alumno", back_populates="recomendaciones")
 
+# --- AGREGADOS DE NOTAS (se mantienen solos, ver agregados.py) ---
+# Con cantidad, suma y suma de cuadrados se sacan promedio y desvío sin leer todas las notas.
+class AgregadoAlumnoMateria(Base):
+    __tablename__ = 'agregados_alumno_materia'
+    
+    alumno_id = Column(Integer, ForeignKey('alumnos.id'), primary_key=True)
+    materia_id = Column(Integer, ForeignKey('materias.id'), primary_key=True, index=True)
+    cantidad = Column(Integer, default=0)
+    suma = Column(Float, default=0)
+    suma_cuadrados = Column(Float, default=0)
+    minimo = Column(Float)
+    maximo = Column(Float)
+    bajas = Column(Integer, default=0)   # Notas por debajo de NOTA_BAJA
+    ultima_nota = Column(Float)
+    ultima_fecha = Column(Date)
+    ultima_id = Column(Integer)          # Desempate cuando hay dos notas el mismo día
+
+class AgregadoAlumno(Base):
+    __tablename__ = 'agregados_alumno'
+    
+    alumno_id = Column(Integer, ForeignKey('alumnos.id'), primary_key=True)
+    cantidad = Column(Integer, default=0)
+    suma = Column(Float, default=0)
+    suma_cuadrados = Column(Float, default=0)
+    minimo = Column(Float)
+    maximo = Column(Float)
+    bajas = Column(Integer, default=0)
+    ultima_nota = Column(Float)
+    ultima_fecha = Column(Date)
+    ultima_id = Column(Integer)
+
+# --- DOCUMENTOS DE LA MATERIA (PDFs de bibliografía) ---
+# Un registro por PDF subido, identificado por el hash del contenido.
+class DocumentoMateria(Base):
+    __tablename__ = 'documentos_materia'
+    __table_args__ = (UniqueConstraint('materia_id', 'huella'),)  # El mismo PDF no se guarda dos veces
+    
+    id = Column(Integer, primary_key=True)
+    materia_id = Column(Integer, ForeignKey('materias.id'), index=True)
+    nombre = Column(String)
+    huella = Column(String(64))   # sha256 del archivo
+    paginas = Column(Integer)
+    tamano = Column(Integer)      # Bytes del PDF original
+    texto = deferred(Column(Text))
+    fecha = Column(DateTime, default=datetime.now)
+
+# --- ÍNDICE DE BÚSQUEDA SOBRE EL PROGRAMA (RAG) ---
+# El programa de cada materia se parte en fragmentos y se guarda un índice invertido
+# (término -> fragmentos donde aparece) para mandarle a la IA solo lo relevante.
+
+class FragmentoPrograma(Base):
+    __tablename__ = 'fragmentos_programa'
+    
+    id = Column(Integer, primary_key=True)
+    materia_id = Column(Integer, ForeignKey('materias.id'), index=True)
+    orden = Column(Integer)      # Posición del fragmento dentro del programa
+    texto = Column(Text)
+    longitud = Column(Integer)   # Cantidad de términos (para BM25)
+
+class TerminoIndice(Base):
+    __tablename__ = 'indice_terminos'
+    __table_args__ = (Index('ix_indice_terminos_materia_termino', 'materia_id', 'termino'),)
+    
+    id = Column(Integer, primary_key=True)
+    materia_id = Column(Integer, ForeignKey('materias.id'))
+    termino = Column(String, nullable=False)
+    fragmento_id = Column(Integer, ForeignKey('fragmentos_programa.id'))
+    frecuencia = Column(Integer)  # Veces que aparece el término en el fragmento
+
+# --- CACHÉ DE RESPUESTAS DE LA IA ---
+# Misma pregunta (modelo + temperatura + mensajes) => misma respuesta, sin volver a gastar cuota.
+class RespuestaCacheada(Base):
+    __tablename__ = 'cache_llm'
+    
+    clave = Column(String(64), primary_key=True)  # sha256 de modelo, temperatura y mensajes
+    modelo = Column(String)
+    temperatura = Column(Float)
+    respuesta = Column(Text)
+    tamano = Column(Integer)        # Bytes de la respuesta (para el límite de tamaño)
+    creado = Column(DateTime, default=datetime.now)
+    ultimo_uso = Column(DateTime, default=datetime.now, index=True)  # Para desalojar lo menos usado (LRU)
+    usos = Column(Integer, default=0)
+
+# --- VERSIÓN DEL ESQUEMA (una fila por migración aplicada, ver migraciones.py) ---
+class VersionEsquema(Base):
+    __tablename__ = 'schema_version'
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    descripcion = Column(String)
+    aplicada = Column(DateTime, default=datetime.now)
+    segundos = Column(Float)
+
+# --- COLA DE TRABAJOS (Corrección Masiva en segundo plano) ---
+# Cada archivo de Google Forms es un Trabajo y cada fila un ItemTrabajo.
+# Se guarda el avance fila por fila para poder retomar si algo se corta.
+class Trabajo(Base):
+    __tablename__ = 'trabajos'
+    
+    id = Column(Integer, primary_key=True)
+    tipo = Column(String, default="correccion")
+    estado = Column(String, default="pendiente")  # pendiente, en_proceso, terminado, con_errores
+    huella = Column(String(64), unique=True)      # Hash del archivo + materia + instancia: el mismo archivo retoma el mismo trabajo
+    materia_id = Column(Integer, ForeignKey('materias.id'))
+    instancia = Column(String)
+    parametros = Column(Text)  # JSON con columnas de preguntas, concurrencia, etc.
+    total = Column(Integer, default=0)
+    creado = Column(DateTime, default=datetime.now)
+    actualizado = Column(DateTime, default=datetime.now)
+    
+    items = relationship("ItemTrabajo", back_populates="trabajo")
+
+class ItemTrabajo(Base):
+    __tablename__ = 'trabajo_items'
+    __table_args__ = (
+        UniqueConstraint('trabajo_id', 'fila'),
+        Index('ix_trabajo_items_trabajo_estado', 'trabajo_id', 'estado'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    trabajo_id = Column(Integer, ForeignKey('trabajos.id'))
+    fila = Column(Integer)               # Número de fila en el archivo original
+    alumno_id = Column(Integer, ForeignKey('alumnos.id'))
+    datos = Column(Text)                 # JSON: nombre, respuestas y nota de la fila
+    estado = Column(String, default="pendiente")  # pendiente, en_proceso, hecho, error, omitido
+    intentos = Column(Integer, default=0)
+    error = Column(Text)
+    worker = Column(String)              # Quién la tomó
+    bloqueado_hasta = Column(DateTime)   # Si el worker muere, pasado este momento otro la puede retomar
+    evaluacion_id = Column(Integer, ForeignKey('evaluaciones.id'))
+    
+    trabajo = relationship("Trabajo", back_populates="items")
+
+class RespuestaAgrupada(Base):
+    # Una respuesta por grupo de respuestas iguales o casi iguales a la misma pregunta (ver agrupar_respuestas.py):
+    # la IA la corrige una vez y la devolución se copia a todos los alumnos del grupo
+    __tablename__ = 'respuestas_agrupadas'
+    __table_args__ = (UniqueConstraint('trabajo_id', 'clave'),)
+
+    id = Column(Integer, primary_key=True)
+    trabajo_id = Column(Integer, ForeignKey('trabajos.id'))
+    clave = Column(String(40))           # sha1 de pregunta + respuesta normalizada
+    pregunta = Column(Text)
+    texto = Column(Text)                 # Respuesta representante del grupo
+    miembros = Column(Integer)
+    devolucion = Column(Text)            # NULL hasta que la IA la corrige
+
 # --- PASO 3: CONSTRUCCIÓN ---
+def asegurar_esquema(engine):
+    # Tablas, columnas, índices de búsqueda y agregados: son las migraciones versionadas de
+    # migraciones.py, así que lo ya aplicado no se repite (si está todo, es una consulta).
+    # Acá adentro: migraciones importa los modelos de este
+    from migraciones import migrar
+    return migrar(engine)
+
 # Esta línea es la que realmente "toca" el disco duro y crea las tablas
 if __name__ == "__main__":
     print("🏗️  Comenzando la construcción de la base de datos...")
     
     # Si el archivo ya existe, esto no borra los datos, solo verifica la estructura.
-    Base.metadata.create_all(engine)
+    from config_db import crear_engine
+    engine = crear_engine()
+    asegurar_esquema(engine)
     
-    print("✅ ¡Base de datos 'sistema_escolar.db' creada con éxito!")
+    print(f"✅ ¡Base de datos '{engine.url.render_as_string(hide_password=True)}' creada con éxito!")
 
     print("   Se han creado las tablas: Alumnos, Materias, Evaluaciones, Recomendaciones.")
 
@@ -1,37 +1,47 @@
+import time
+_inicio_importaciones = time.perf_counter()
+import json
 import streamlit as st
 import pandas as pd
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime
-from fpdf import FPDF
-# Importamos PyPDF
-try:
-    from pypdf import PdfReader
-except ImportError:
-    st.error("⚠️ Falta librería 'pypdf' en requirements.txt"); st.stop()
+from types import SimpleNamespace
 
-from crear_base_datos import Base, Alumno, Materia, Evaluacion
-from modulo_ia_github import generar_recomendacion_ia, responder_chat_educativo
+from config_db import es_verdadero
+from crear_base_datos import Alumno, Materia, Evaluacion, Trabajo, ItemTrabajo, DocumentoMateria, Recomendacion
+from modulo_ia_github import responder_chat_educativo_stream, ErrorIA
+from cache_llm import estadisticas as estadisticas_cache
+from consultas import alumno_con_historial, materias_de_alumno
+from datos_cacheados import obtener_engine, obtener_sessionmaker, sesion_del_rerun, invalidar, alumnos as lista_alumnos, buscar as buscar_alumnos, comentarios as buscar_comentarios, analitica as analitica_cacheada, recomendaciones as recomendaciones_cacheadas, pendientes_recomendaciones, materias as lista_materias, historial as historial_cacheado, agregados as agregados_cacheados, metricas_extra
+from documentos import guardar_documentos, documentos_de_materia, contar_paginas, leer_pagina, TAMANO_PAGINA_VISTA
+from importar_alumnos import importar_alumnos
+from indice_rag import indexar_materia, contexto_relevante
+from motor_correccion import MAX_CONCURRENCIA
+from agregados import promedio_y_desvio, en_riesgo, borrar_de_alumno
+import instrumentacion
+from instrumentacion import seccion
+from correccion_agrupada import MAX_ALUMNOS_POR_LLAMADA
+from busqueda_alumnos import TAMANO_PAGINA as TAMANO_PAGINA_ALUMNOS
+from busqueda_comentarios import TAMANO_PAGINA as TAMANO_PAGINA_COMENTARIOS
+from notas_masivas import planilla as planilla_notas, guardar_planilla
+from analitica import nombres as nombres_por_id
+from trabajos import huella_trabajo, crear_trabajo, procesar_trabajo, progreso, reintentar_errores, trabajos_abiertos
+from recomendaciones import generar_pendientes
+# reportes (fpdf) se importa donde se usa, igual que pypdf (documentos.py) y openai (cliente_ia.py):
+# son lo más pesado y la mayoría de los reruns no los necesita
 
 # --- CONFIGURACIÓN ---
 st.set_page_config(page_title="Sistema Escolar AI", layout="wide", page_icon="🧠")
+instrumentacion.iniciar_rerun()  # Cuenta SQL y tiempo de este rerun (se cierra al final del script)
+instrumentacion.registrar_arranque("importaciones", time.perf_counter() - _inicio_importaciones)  # Solo cuenta el primer rerun del proceso
 
 # --- CONEXIÓN DB ---
+# El engine (y la creación de tablas) se hace una sola vez por proceso, no en cada clic
 try:
-    if "DATABASE_URL" in st.secrets:
-        database_url = st.secrets["DATABASE_URL"]
-        if database_url.startswith("postgres://"):
-            database_url = database_url.replace("postgres://", "postgresql://", 1)
-        engine = create_engine(database_url, pool_pre_ping=True, connect_args={"sslmode": "require"})
-    else:
-        ruta_db = 'sistema_escolar.db'
-        engine = create_engine(f'sqlite:///{ruta_db}')
+    engine = obtener_engine()
 except Exception as e:
     st.error(f"Error DB: {e}"); st.stop()
 
-Session = sessionmaker(bind=engine)
-try: Base.metadata.create_all(engine)
-except: pass
+Session = obtener_sessionmaker()
 
 def get_session(): return Session()
 
@@ -52,296 +62,546 @@ def password_entered():
         del st.session_state["password_input"]
     else: st.error("❌ Incorrecta")
 
-if not check_password(): st.stop()
-
-# --- PDF GENERATOR ---
-def crear_reporte_pdf(alumno, recomendaciones_ia_texto):
-    class PDF(FPDF):
-        def header(self):
-            try: self.add_font("MiFuente", "", "fuente.ttf"); self.set_font("MiFuente", "", 18)
-            except: self.set_font("Helvetica", "B", 15)
-            self.cell(0, 10, "Informe Académico", new_x="LMARGIN", new_y="NEXT", align='C'); self.ln(10)
-        def footer(self):
-            self.set_y(-15); self.set_font("Helvetica", "I", 8); self.cell(0, 10, f'Pag {self.page_no()}', align='C')
-    pdf = PDF(); pdf.add_page()
-    try: pdf.add_font("MiFuente", "", "fuente.ttf"); pdf.set_font("MiFuente", "", 12)
-    except: pdf.set_font("Helvetica", "", 12)
-    pdf.set_font(size=14, style=""); pdf.cell(0, 10, f"Alumno: {alumno.nombre_completo}", new_x="LMARGIN", new_y="NEXT")
-    pdf.set_font(size=12); pdf.cell(0, 10, f"Año: {alumno.año_escolar}º", new_x="LMARGIN", new_y="NEXT"); pdf.ln(5)
-    pdf.cell(0, 10, "Historial:", new_x="LMARGIN", new_y="NEXT")
-    pdf.set_fill_color(240, 240, 240); pdf.set_font(size=10)
-    pdf.cell(40, 10, "Materia", 1, 0, 'C', 1); pdf.cell(40, 10, "Instancia", 1, 0, 'C', 1); pdf.cell(20, 10, "Nota", 1, 0, 'C', 1); pdf.cell(90, 10, "Comentario", 1, 1, 'C', 1)
-    if alumno.evaluaciones:
-        for ev in alumno.evaluaciones:
-            pdf.cell(40, 10, str(ev.materia.nombre)[:20], 1); pdf.cell(40, 10, str(ev.instancia)[:20], 1)
-            pdf.cell(20, 10, str(ev.nota), 1, 0, 'C'); pdf.cell(90, 10, ev.comentario.replace("\n"," ")[:50], 1, 1)
-    else: pdf.cell(0, 10, "Sin datos.", 1, 1)
-    pdf.ln(10); pdf.set_font(size=12); pdf.cell(0, 10, "Análisis IA:", new_x="LMARGIN", new_y="NEXT")
-    pdf.set_font(size=11); pdf.multi_cell(0, 8, recomendaciones_ia_texto)
-    return bytes(pdf.output())
-
-# --- NAVEGACIÓN ---
-session = get_session()
-st.sidebar.title("🏫 Menú Escolar")
-modo = st.sidebar.radio("Ir a:", ["📊 Dashboard & Chat IA", "⚙️ Administración"])
-
-# ==============================================================================
-# MODO ADMINISTRACIÓN
-# ==============================================================================
-if "Administración" in modo:
-    st.title("⚙️ Panel de Control")
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📚 Materias", "👤 Alumnos", "📝 Notas Manuales", "📂 Importar Listas", "🧪 Corrección Masiva"])
-
-    # TAB 1: MATERIAS (RAG)
-    with tab1:
-        st.subheader("Gestión de Materias y Documentos")
-        c1, c2 = st.columns(2)
-        materias = session.query(Materia).all()
-        opciones = ["➕ Nueva Materia..."] + [m.nombre for m in materias]
-        seleccion = c1.selectbox("Acción:", opciones)
+# Todo el script va dentro del try: el rerun se mide también cuando corta con st.stop(),
+# st.rerun() o una excepción (si no, rerun_segundos solo vería los que llegan al final)
+pantalla = "login"
+try:
+    if not check_password(): st.stop()
+
+    # --- SELECTOR DE ALUMNOS ---
+    # Busca mientras se escribe (sin tildes ni mayúsculas) y muestra de a una página: no carga la lista entera.
+    # Devuelve (id, nombre, dni, año) del elegido o None.
+    def selector_alumno(etiqueta, clave, contenedor=st):
+        texto = contenedor.text_input(f"🔎 {etiqueta}", key=f"{clave}_q", placeholder="Nombre o apellido")
+        if st.session_state.get(f"{clave}_q_prev") != texto:
+            st.session_state[f"{clave}_q_prev"] = texto; st.session_state[f"{clave}_pag"] = 0
+        pag = st.session_state.get(f"{clave}_pag", 0)
+        filas, hay_mas = buscar_alumnos(texto, pag * TAMANO_PAGINA_ALUMNOS)
+        if not filas:
+            contenedor.caption("Sin resultados." if texto else "Sin alumnos."); return None
+        ops = {f[0]: f for f in filas}
+        sel = contenedor.selectbox(etiqueta, list(ops), key=f"{clave}_sel", label_visibility="collapsed",
+                                   format_func=lambda i: f"{ops[i][1]} · DNI {ops[i][2]}" if ops[i][2] else ops[i][1])
+        if pag or hay_mas:
+            c_ant, c_sig = contenedor.columns(2)
+            c_ant.button("◀", key=f"{clave}_ant", disabled=not pag, on_click=lambda: st.session_state.update({f"{clave}_pag": pag - 1}))
+            c_sig.button("▶", key=f"{clave}_sig", disabled=not hay_mas, on_click=lambda: st.session_state.update({f"{clave}_pag": pag + 1}))
+        return ops[sel]
+
+    # --- NAVEGACIÓN ---
+    session = sesion_del_rerun()
+    st.sidebar.title("🏫 Menú Escolar")
+    modo = st.sidebar.radio("Ir a:", ["📊 Dashboard & Chat IA", "📈 Analítica", "⚙️ Administración"])
+    pantalla = "administracion" if "Administración" in modo else "analitica" if "Analítica" in modo else "dashboard"
+
+    # ==============================================================================
+    # MODO ADMINISTRACIÓN
+    # ==============================================================================
+    if "Administración" in modo:
+        st.title("⚙️ Panel de Control")
+        ec = estadisticas_cache()
+        st.sidebar.caption(f"🗄️ Caché IA: {ec['aciertos']} aciertos / {ec['fallos']} fallos ({ec['tasa_aciertos']:.0%})")
+        tab1, tab2, tab3, tab4, tab5, tab6, tab8, tab7 = st.tabs(["📚 Materias", "👤 Alumnos", "📝 Notas Manuales", "📂 Importar Listas", "🧪 Corrección Masiva", "🖨️ Informes", "🔍 Comentarios", "📈 Rendimiento"])
+
+        # TAB 1: MATERIAS (RAG)
+        with tab1, seccion("materias"):
+            st.subheader("Gestión de Materias y Documentos")
+            c1, c2 = st.columns(2)
+            materias = lista_materias()
+            opciones = ["➕ Nueva Materia..."] + [m[1] for m in materias]
+            seleccion = c1.selectbox("Acción:", opciones)
         
-        nombre_ini, prof_ini, prog_ini = "", "", ""
-        obj_m = None
-        if seleccion != "➕ Nueva Materia...":
-            obj_m = session.query(Materia).filter_by(nombre=seleccion).first()
-            if obj_m:
-                nombre_ini = obj_m.nombre; prof_ini = obj_m.profesor_titular
-                prog_ini = obj_m.programa if obj_m.programa else ""
-
-        with st.form("frm_materia"):
-            nom = st.text_input("Nombre", value=nombre_ini)
-            prof = st.text_input("Profesor", value=prof_ini)
-            st.divider()
-            st.markdown("📚 **Base de Conocimiento (RAG)**")
-            pdfs = st.file_uploader("Subir PDFs", type=["pdf"], accept_multiple_files=True)
-            texto_nuevo = ""
-            if pdfs:
-                for p in pdfs:
-                    try:
-                        reader = PdfReader(p); t = ""
-                        for page in reader.pages: t += page.extract_text() + "\n"
-                        texto_nuevo += f"\n--- DOC: {p.name} ---\n{t}\n"
-                        st.success(f"✅ Leído: {p.name}")
-                    except: st.error(f"Error en {p.name}")
-
-            contenido = st.text_area("Contenido IA (Editable):", value=prog_ini + texto_nuevo, height=200)
-            
-            if st.form_submit_button("💾 Guardar"):
-                if seleccion == "➕ Nueva Materia...":
-                    if not session.query(Materia).filter_by(nombre=nom).first():
-                        session.add(Materia(nombre=nom, profesor_titular=prof, programa=contenido))
-                        session.commit(); st.success("Creada!"); st.rerun()
-                    else: st.error("Ya existe.")
-                else:
-                    if obj_m:
-                        obj_m.nombre = nom; obj_m.profesor_titular = prof; obj_m.programa = contenido
-                        session.commit(); st.success("Actualizada!"); st.rerun()
-
-    # TAB 2: ALUMNOS
-    with tab2:
-        st.subheader("Alumnos")
-        todos = session.query(Alumno).all()
-        if todos:
-            df = pd.DataFrame([{"Nombre":a.nombre_completo, "DNI":a.dni} for a in todos])
-            st.download_button("⬇️ CSV", df.to_csv(index=False).encode('utf-8'), "alumnos.csv")
+            if "msg_materia" in st.session_state: st.success(st.session_state.pop("msg_materia"))
         
-        with st.form("frm_alu"):
-            c1, c2 = st.columns(2)
-            n = c1.text_input("Nombre *"); d = c2.text_input("DNI *")
-            c3, c4, c5 = st.columns(3)
-            a = c3.number_input("Año", 1, 6); m = c4.text_input("Email"); t = c5.text_input("Tel")
-            if st.form_submit_button("Guardar"):
-                if n and d:
-                    try:
-                        if not session.query(Alumno).filter_by(dni=d).first():
-                            session.add(Alumno(nombre_completo=n, dni=d, año_escolar=a, email=m, telefono=t))
-                            session.commit(); st.success("Listo!"); st.rerun()
-                        else: st.error("DNI duplicado")
-                    except Exception as e: st.error(str(e))
-
-        with st.expander("🗑️ Borrar"):
+            nombre_ini, prof_ini, prog_ini = "", "", ""
+            obj_m = None
+            pag_prog, n_pags = 1, 1
+            if seleccion != "➕ Nueva Materia...":
+                obj_m = session.get(Materia, next(m[0] for m in materias if m[1] == seleccion))
+                if obj_m:
+                    nombre_ini = obj_m.nombre; prof_ini = obj_m.profesor_titular
+                    # El contenido se muestra por páginas: al navegador viaja solo la página elegida
+                    n_pags = contar_paginas(session, Materia.programa, Materia.id == obj_m.id)
+                    pag_prog = c2.number_input(f"Página del contenido (de {n_pags})", 1, n_pags, 1, key=f"pag_prog_{obj_m.id}")
+                    prog_ini = leer_pagina(session, Materia.programa, Materia.id == obj_m.id, pag_prog)
+
+            with st.form("frm_materia"):
+                nom = st.text_input("Nombre", value=nombre_ini)
+                prof = st.text_input("Profesor", value=prof_ini)
+                st.divider()
+                st.markdown("📚 **Base de Conocimiento (RAG)**")
+                # Los PDFs se leen recién al guardar y quedan en el almacén de documentos (no se pegan en el texto)
+                pdfs = st.file_uploader("Subir PDFs", type=["pdf"], accept_multiple_files=True)
+
+                contenido = st.text_area(f"Contenido IA (Editable) — página {pag_prog} de {n_pags}:", value=prog_ini, height=200)
+            
+                if st.form_submit_button("💾 Guardar"):
+                    archivos = [(p.name, p.getvalue()) for p in pdfs or []]
+                    if seleccion == "➕ Nueva Materia...":
+                        if not session.query(Materia).filter_by(nombre=nom).first():
+                            nueva_m = Materia(nombre=nom, profesor_titular=prof, programa=contenido)
+                            session.add(nueva_m); session.flush()
+                            with st.spinner("Leyendo PDFs..."):
+                                nuevos, repetidos, errores = guardar_documentos(session, nueva_m.id, archivos)
+                            indexar_materia(session, nueva_m)
+                            session.commit(); invalidar("materias")
+                            st.session_state.msg_materia = f"Creada! PDFs nuevos: {len(nuevos)} · ya cargados: {len(repetidos)} · con error: {', '.join(errores) or '0'}"
+                            st.rerun()
+                        else: st.error("Ya existe.")
+                    else:
+                        if obj_m:
+                            # Se reemplaza solo la página editada dentro del programa completo
+                            completo = obj_m.programa or ""
+                            ini = (pag_prog - 1) * TAMANO_PAGINA_VISTA
+                            obj_m.nombre = nom; obj_m.profesor_titular = prof
+                            obj_m.programa = completo[:ini] + contenido + completo[ini + TAMANO_PAGINA_VISTA:]
+                            with st.spinner("Leyendo PDFs..."):
+                                nuevos, repetidos, errores = guardar_documentos(session, obj_m.id, archivos)
+                            indexar_materia(session, obj_m)
+                            session.commit(); invalidar("materias", "evaluaciones")
+                            st.session_state.msg_materia = f"Actualizada! PDFs nuevos: {len(nuevos)} · ya cargados: {len(repetidos)} · con error: {', '.join(errores) or '0'}"
+                            st.rerun()
+
+            if obj_m:
+                docs = documentos_de_materia(session, obj_m.id)
+                with st.expander(f"📄 Documentos cargados ({len(docs)})"):
+                    if docs:
+                        st.dataframe(pd.DataFrame([{"Documento": d.nombre, "Páginas": d.paginas, "KB": round((d.tamano or 0) / 1024)} for d in docs]), use_container_width=True)
+                        nom_docs = {d.id: d.nombre for d in docs}
+                        c_doc, c_pag = st.columns([3, 1])
+                        doc_id = c_doc.selectbox("Vista previa de:", list(nom_docs), format_func=nom_docs.get)
+                        n_pags_doc = contar_paginas(session, DocumentoMateria.texto, DocumentoMateria.id == doc_id)
+                        pag_doc = c_pag.number_input(f"Página (de {n_pags_doc})", 1, n_pags_doc, 1, key=f"pag_doc_{doc_id}")
+                        st.text(leer_pagina(session, DocumentoMateria.texto, DocumentoMateria.id == doc_id, pag_doc))
+                        if st.button("🗑️ Quitar este documento"):
+                            session.query(DocumentoMateria).filter_by(id=doc_id).delete(synchronize_session=False)
+                            indexar_materia(session, obj_m); session.commit(); st.rerun()
+                    else: st.caption("Todavía no hay PDFs para esta materia.")
+
+        # TAB 2: ALUMNOS
+        with tab2, seccion("alumnos"):
+            st.subheader("Alumnos")
+            todos = lista_alumnos()
             if todos:
-                del_a = st.selectbox("Borrar a:", [x.nombre_completo for x in todos])
-                if st.button("Confirmar Borrado"):
-                    obj = session.query(Alumno).filter_by(nombre_completo=del_a).first()
-                    for e in obj.evaluaciones: session.delete(e)
-                    session.delete(obj); session.commit(); st.success("Borrado"); st.rerun()
-
-    # TAB 3: NOTAS MANUALES
-    with tab3:
-        ls_a = session.query(Alumno).all(); ls_m = session.query(Materia).all()
-        if ls_a and ls_m:
-            c1, c2 = st.columns(2)
-            sa = c1.selectbox("Alumno", [x.nombre_completo for x in ls_a])
-            sm = c2.selectbox("Materia", [x.nombre for x in ls_m])
-            st.divider()
-            with st.form("frm_nota", clear_on_submit=True):
-                st.write(f"Nota: **{sa}** - **{sm}**")
-                ins = st.text_input("Instancia (ej: Oral)")
-                nt = st.number_input("Nota", 0.0, 10.0, step=0.5)
-                cm = st.text_area("Comentario")
+                df = pd.DataFrame([{"Nombre":a[1], "DNI":a[2]} for a in todos])
+                st.download_button("⬇️ CSV", df.to_csv(index=False).encode('utf-8'), "alumnos.csv")
+        
+            with st.form("frm_alu"):
+                c1, c2 = st.columns(2)
+                n = c1.text_input("Nombre *"); d = c2.text_input("DNI *")
+                c3, c4, c5 = st.columns(3)
+                a = c3.number_input("Año", 1, 6); m = c4.text_input("Email"); t = c5.text_input("Tel")
                 if st.form_submit_button("Guardar"):
-                    oa = session.query(Alumno).filter_by(nombre_completo=sa).first()
-                    om = session.query(Materia).filter_by(nombre=sm).first()
-                    session.add(Evaluacion(alumno_id=oa.id, materia_id=om.id, instancia=ins, nota=nt, comentario=cm, fecha=datetime.now()))
-                    session.commit(); st.toast("Guardado!")
-        else: st.warning("Faltan alumnos o materias.")
-
-    # TAB 4: IMPORTAR ALUMNOS
-    with tab4:
-        f = st.file_uploader("Lista Alumnos (Excel/CSV)", type=["xlsx", "csv"])
-        if f and st.button("Importar Lista"):
-            try:
-                df = pd.read_excel(f) if f.name.endswith('xlsx') else pd.read_csv(f)
-                c=0
-                for _,r in df.iterrows():
-                    if not session.query(Alumno).filter_by(nombre_completo=r['Nombre']).first():
-                        session.add(Alumno(nombre_completo=r['Nombre'], año_escolar=int(r['Año'])))
-                        c+=1
-                session.commit(); st.success(f"Importados: {c}")
-            except Exception as e: st.error(str(e))
-
-    # --- TAB 5: CORRECCIÓN MASIVA (IA + GOOGLE FORMS) ---
-    with tab5:
-        st.subheader("🧪 Procesador de Evaluaciones (Google Forms)")
-        st.info("Sube el Excel/CSV de Google Forms. La IA corregirá usando la bibliografía de la materia.")
+                    if n and d:
+                        try:
+                            if not session.query(Alumno).filter_by(dni=d).first():
+                                session.add(Alumno(nombre_completo=n, dni=d, año_escolar=a, email=m, telefono=t))
+                                session.commit(); invalidar("alumnos"); st.success("Listo!"); st.rerun()
+                            else: st.error("DNI duplicado")
+                        except Exception as e: st.error(str(e))
+
+            with st.expander("🗑️ Borrar"):
+                fila_del = selector_alumno("Borrar a:", "alu_borrar")
+                if fila_del:
+                    if st.button("Confirmar Borrado"):
+                        obj = session.get(Alumno, fila_del[0])
+                        session.query(ItemTrabajo).filter_by(alumno_id=obj.id).update({"alumno_id": None, "evaluacion_id": None}, synchronize_session=False)
+                        session.query(Recomendacion).filter_by(alumno_id=obj.id).delete(synchronize_session=False)
+                        session.query(Evaluacion).filter_by(alumno_id=obj.id).delete(synchronize_session=False)
+                        borrar_de_alumno(session.connection(), obj.id)  # El delete masivo no dispara los eventos de agregados
+                        session.delete(obj); session.commit(); invalidar("alumnos", "evaluaciones", "recomendaciones"); st.success("Borrado"); st.rerun()
+
+        # TAB 3: NOTAS MANUALES
+        with tab3, seccion("notas_manuales"):
+            ls_m = lista_materias()
+            modo_notas = st.radio("Carga", ["📋 Planilla del curso", "✏️ De a una"], horizontal=True, key="modo_notas")
+            if "Planilla" in modo_notas:
+                # Todo el curso de una vez: la planilla está dentro de un form, así editar no dispara reruns
+                # y "Guardar" escribe las altas y cambios en una sola transacción (ver notas_masivas.py)
+                años_p = sorted({a[3] for a in lista_alumnos() if a[3] is not None})
+                nom_m = {x[0]: x[1] for x in ls_m}
+                c1, c2, c3, c4 = st.columns(4)
+                mat_p = c1.selectbox("Materia", list(nom_m), format_func=nom_m.get, key="plan_mat")
+                año_p = c2.selectbox("Año", años_p, key="plan_año")
+                ins_p = c3.text_input("Instancia", placeholder="ej: Oral 1", key="plan_ins").strip()
+                fecha_p = c4.date_input("Fecha", key="plan_fecha")
+                if not (ls_m and años_p): st.warning("Faltan alumnos o materias.")
+                elif not ins_p: st.info("Escribí la instancia para armar la planilla.")
+                else:
+                    original_p = planilla_notas(session, mat_p, ins_p, año_p)
+                    if original_p.empty: st.info("No hay alumnos en ese año.")
+                    else:
+                        clave_p = f"plan_{mat_p}_{año_p}_{ins_p}_{st.session_state.get('plan_guardados', 0)}"
+                        with st.form("frm_planilla"):
+                            editada_p = st.data_editor(original_p, key=clave_p, hide_index=True, use_container_width=True, num_rows="fixed",
+                                                       column_order=["Alumno", "Nota", "Comentario"], disabled=["Alumno"],
+                                                       column_config={"Nota": st.column_config.NumberColumn(min_value=0.0, max_value=10.0, step=0.5),
+                                                                      "Comentario": st.column_config.TextColumn(width="large")})
+                            guardar_p = st.form_submit_button("💾 Guardar planilla")
+                        st.caption(f"{len(original_p)} alumnos · {int(original_p['evaluacion_id'].notna().sum())} ya tienen nota en «{ins_p}». Borrar una nota no borra la evaluación.")
+                        if guardar_p:
+                            try:
+                                res_p = guardar_planilla(session, mat_p, ins_p, original_p, editada_p, fecha_p)
+                                if res_p["nuevas"] or res_p["modificadas"]:
+                                    invalidar("evaluaciones"); st.session_state["plan_guardados"] = st.session_state.get("plan_guardados", 0) + 1
+                                    st.toast(f"Guardado: {res_p['nuevas']} nuevas, {res_p['modificadas']} modificadas"); st.rerun()
+                                else: st.info("No hubo cambios.")
+                            except Exception as e: st.error(f"No se guardó nada: {e}")
+            else:
+                c1, c2 = st.columns(2)
+                fila_a = selector_alumno("Alumno", "alu_nota", c1)
+                if fila_a and ls_m:
+                    sa = fila_a[0]
+                    nom_m = {x[0]: x[1] for x in ls_m}
+                    sm = c2.selectbox("Materia", list(nom_m), format_func=nom_m.get)
+                    st.divider()
+                    with st.form("frm_nota", clear_on_submit=True):
+                        st.write(f"Nota: **{fila_a[1]}** - **{nom_m[sm]}**")
+                        ins = st.text_input("Instancia (ej: Oral)")
+                        nt = st.number_input("Nota", 0.0, 10.0, step=0.5)
+                        cm = st.text_area("Comentario")
+                        if st.form_submit_button("Guardar"):
+                            session.add(Evaluacion(alumno_id=sa, materia_id=sm, instancia=ins, nota=nt, comentario=cm, fecha=datetime.now()))
+                            session.commit(); invalidar("evaluaciones"); st.toast("Guardado!")
+                else: st.warning("Faltan alumnos o materias.")
+
+        # TAB 4: IMPORTAR ALUMNOS
+        with tab4, seccion("importar"):
+            f = st.file_uploader("Lista Alumnos (Excel/CSV)", type=["xlsx", "csv"])
+            st.caption("Columnas: **Nombre** y **Año** (obligatorias); DNI, Email y Tel (opcionales). Se omiten nombres o DNI ya cargados.")
+            if f and st.button("Importar Lista"):
+                try:
+                    estado = st.empty()
+                    res = importar_alumnos(session, f, f.name, al_avanzar=lambda r: estado.caption(f"Procesando... {r['insertados']} nuevos hasta ahora"))
+                    invalidar("alumnos")
+                    st.success(f"Importados: {res['insertados']} · Omitidos (ya existían): {res['omitidos']} · Inválidos: {res['invalidos']}")
+                except Exception as e: st.error(str(e))
+
+        # --- TAB 5: CORRECCIÓN MASIVA (IA + GOOGLE FORMS) ---
+        with tab5, seccion("correccion_masiva"):
+            st.subheader("🧪 Procesador de Evaluaciones (Google Forms)")
+            st.info("Sube el Excel/CSV de Google Forms. La IA corregirá usando la bibliografía de la materia.")
         
-        # 1. Elegir Materia (Contexto RAG)
-        mats = session.query(Materia).all()
-        if not mats: st.warning("Carga materias primero."); st.stop()
+            # 1. Elegir Materia (Contexto RAG)
+            mats = lista_materias()
+            # Sin st.stop(): cortaría el script y no se dibujarían las pestañas que siguen. Sin materias el
+            # selector queda vacío y no se puede iniciar la corrección (materia_sel es None)
+            if not mats: st.warning("Carga materias primero.")
         
-        materia_sel = st.selectbox("1. Seleccionar Materia del Examen:", [m.nombre for m in mats])
-        instancia_txt = st.text_input("2. Nombre de la Evaluación (Ej: Parcial 1)")
+            nom_mats = {m[0]: m[1] for m in mats}
+            materia_sel = st.selectbox("1. Seleccionar Materia del Examen:", list(nom_mats), format_func=nom_mats.get)
+            instancia_txt = st.text_input("2. Nombre de la Evaluación (Ej: Parcial 1)")
         
-        # 2. Subir Archivo
-        archivo_eval = st.file_uploader("3. Subir Resultados (CSV/Excel)", type=["csv", "xlsx"])
+            # 2. Subir Archivo
+            archivo_eval = st.file_uploader("3. Subir Resultados (CSV/Excel)", type=["csv", "xlsx"])
         
-        if archivo_eval and materia_sel and instancia_txt:
-            try:
-                # Leer archivo
-                df_notas = pd.read_csv(archivo_eval) if archivo_eval.name.endswith('csv') else pd.read_excel(archivo_eval)
-                st.write("Vista previa de datos:", df_notas.head(3))
+            if archivo_eval and materia_sel and instancia_txt:
+                try:
+                    # Leer archivo
+                    df_notas = pd.read_csv(archivo_eval) if archivo_eval.name.endswith('csv') else pd.read_excel(archivo_eval)
+                    st.write("Vista previa de datos:", df_notas.head(3))
                 
-                # 3. Mapeo de Columnas
-                cols = df_notas.columns.tolist()
-                c_nom, c_nota = st.columns(2)
-                col_nombre = c_nom.selectbox("¿Qué columna tiene el NOMBRE del alumno?", cols)
-                col_nota = c_nota.selectbox("¿Qué columna tiene la NOTA FINAL? (Opcional)", ["(Sin Nota)"] + cols)
+                    # 3. Mapeo de Columnas
+                    cols = df_notas.columns.tolist()
+                    c_nom, c_nota = st.columns(2)
+                    col_nombre = c_nom.selectbox("¿Qué columna tiene el NOMBRE del alumno?", cols)
+                    col_nota = c_nota.selectbox("¿Qué columna tiene la NOTA FINAL? (Opcional)", ["(Sin Nota)"] + cols)
                 
-                cols_preguntas = st.multiselect("Selecciona las columnas de PREGUNTAS a evaluar por IA:", [c for c in cols if c not in [col_nombre, col_nota]])
+                    cols_preguntas = st.multiselect("Selecciona las columnas de PREGUNTAS a evaluar por IA:", [c for c in cols if c not in [col_nombre, col_nota]])
                 
-                if st.button("🚀 Iniciar Corrección con IA"):
-                    obj_mat = session.query(Materia).filter_by(nombre=materia_sel).first()
-                    contexto_rag = obj_mat.programa if obj_mat.programa else "Sin bibliografía."
+                    with st.expander("⚙️ Velocidad de corrección"):
+                        c_con, c_rpm, c_agr = st.columns(3)
+                        max_conc = c_con.number_input("Llamadas IA en paralelo", 1, 20, int(st.secrets.get("IA_MAX_CONCURRENCIA", MAX_CONCURRENCIA)))
+                        # El límite general (IA_RPM) lo pone cliente_ia para todo el proceso; este es un tope extra para este trabajo
+                        rpm = c_rpm.number_input("Tope extra por minuto (0 = solo el límite general)", 0, 600, 0)
+                        # Varios alumnos en una sola llamada: la bibliografía se manda una vez por grupo
+                        por_llamada = c_agr.number_input("Alumnos por llamada (1 = de a uno)", 1, 20, int(st.secrets.get("IA_ALUMNOS_POR_LLAMADA", MAX_ALUMNOS_POR_LLAMADA)))
+                        # Respuestas iguales o casi iguales a la misma pregunta se corrigen una sola vez
+                        agrupar_resp = st.checkbox("Agrupar respuestas repetidas (devolución por pregunta)", value=es_verdadero(st.secrets.get("IA_AGRUPAR_RESPUESTAS", True)))
+
+                    procesar_aqui = st.checkbox("Procesar en esta pestaña (si no hay un worker corriendo)", value=not es_verdadero(st.secrets.get("WORKER_CORRECCION", False)))
+
+                    if st.button("🚀 Iniciar Corrección con IA"):
+                        obj_mat = session.get(Materia, materia_sel)
                     
-                    bar = st.progress(0)
-                    total = len(df_notas)
+                        # El archivo se guarda como un trabajo en la cola: si se corta, se retoma desde donde quedó
+                        huella = huella_trabajo(archivo_eval.getvalue(), obj_mat.id, instancia_txt, col_nombre, col_nota, cols_preguntas, por_llamada, agrupar_resp)
+                        trabajo, nuevo = crear_trabajo(session, df_notas, obj_mat, instancia_txt, col_nombre, col_nota, cols_preguntas, huella, max_conc, rpm, por_llamada, agrupar_resp)
+                        cuenta = progreso(session, trabajo.id)
+                        if not nuevo: st.info(f"Este archivo ya estaba cargado (trabajo #{trabajo.id}): se retoma sin repetir las filas ya corregidas.")
+                        if cuenta.get("omitido"): st.warning(f"Saltando {cuenta['omitido']} filas (alumnos no registrados en sistema).")
+                        dedup = json.loads(trabajo.parametros or "{}").get("deduplicacion")
+                        if dedup: st.info(f"🧩 {dedup['respuestas']} respuestas → {dedup['a_corregir']} para corregir con IA ({dedup['en_blanco']} en blanco): {dedup['reduccion']:.0%} menos llamadas.")
                     
-                    for i, row in df_notas.iterrows():
-                        nombre_alu = row[col_nombre]
+                        if procesar_aqui:
+                            bar = st.progress(0)
+                            total = max(trabajo.total, 1)
+                            hechos = [total - cuenta.get("pendiente", 0) - cuenta.get("en_proceso", 0)]
+                            def avanzar(item):
+                                # Actualizar barra
+                                hechos[0] += 1
+                                bar.progress(min(hechos[0] / total, 1.0))
+                            procesar_trabajo(session, trabajo.id, al_avanzar=avanzar)
+                            invalidar("evaluaciones")
                         
-                        # Buscar si el alumno existe
-                        alumno_bd = session.query(Alumno).filter_by(nombre_completo=nombre_alu).first()
-                        if not alumno_bd:
-                            st.warning(f"Saltando a {nombre_alu} (No registrado en sistema).")
-                            continue
-                            
-                        # Construir Prompt para este alumno
-                        texto_examen = ""
-                        for preg in cols_preguntas:
-                            resp = str(row[preg])
-                            texto_examen += f"\n- PREGUNTA: {preg}\n  RESPUESTA ALUMNO: {resp}\n"
-                        
-                        prompt_ia = f"""
-                        Actúa como profesor experto. Tienes este contexto bibliográfico de la materia:
-                        {contexto_rag[:4000]}
-                        
-                        Evalúa las respuestas de este alumno:
-                        {texto_examen}
-                        
-                        TAREA:
-                        Identifica errores conceptuales basándote en la bibliografía.
-                        Si está bien, felicita brevemente.
-                        Si está mal, explica por qué citando el tema.
-                        Sé directo y constructivo. Máximo 1 párrafo.
-                        """
-                        
-                        # Llamada IA
-                        try:
-                            devolucion = responder_chat_educativo(nombre_alu, "Examen", prompt_ia)
-                        except: devolucion = "Error conectando con IA."
-                        
-                        # Guardar en BD
-                        nota_final = float(row[col_nota]) if col_nota != "(Sin Nota)" and pd.to_numeric(row[col_nota], errors='coerce') else 0.0
-                        
-                        nueva_ev = Evaluacion(
-                            alumno_id=alumno_bd.id,
-                            materia_id=obj_mat.id,
-                            instancia=instancia_txt,
-                            nota=nota_final,
-                            comentario=f"[IA FEEDBACK]: {devolucion}",
-                            fecha=datetime.now()
-                        )
-                        session.add(nueva_ev)
-                        session.commit()
-                        
-                        # Actualizar barra
-                        bar.progress((i + 1) / total)
-                    
-                    st.success("✅ ¡Corrección Masiva Finalizada! Las devoluciones están en el historial de cada alumno.")
+                            estado_trabajo = session.get(Trabajo, trabajo.id).estado
+                            if estado_trabajo == "con_errores":
+                                st.warning("⚠️ Corrección terminada, pero algunas filas fallaron. Podés reintentarlas desde la lista de trabajos.")
+                            elif estado_trabajo == "en_proceso":
+                                st.info("⏳ La IA pidió esperar (límite de solicitudes): las filas que faltan siguen en la cola y las retoma el worker o un nuevo procesamiento.")
+                            else:
+                                st.success("✅ ¡Corrección Masiva Finalizada! Las devoluciones están en el historial de cada alumno.")
+                        else:
+                            st.success(f"📥 Trabajo #{trabajo.id} en cola. El worker lo va a procesar (podés cerrar esta pestaña).")
                     
-            except Exception as e:
-                st.error(f"Error procesando archivo: {e}")
-
-# ==============================================================================
-# MODO DASHBOARD
-# ==============================================================================
-elif "Dashboard" in modo:
-    try:
-        st.title("🎓 Dashboard Inteligente")
-        als = session.query(Alumno).all()
-        if not als: st.warning("Sin alumnos.")
-        else:
-            sel = st.sidebar.selectbox("Alumno:", [a.nombre_completo for a in als])
-            alu = session.query(Alumno).filter_by(nombre_completo=sel).first()
-            if alu:
-                nts = [e.nota for e in alu.evaluaciones]
-                p = sum(nts)/len(nts) if nts else 0
-                c1,c2,c3 = st.columns(3)
-                c1.metric("Alumno", alu.nombre_completo); c2.metric("Promedio", f"{p:.2f}"); c3.metric("Notas", len(nts))
-                st.divider()
+                except Exception as e:
+                    st.error(f"Error procesando archivo: {e}")
+
+            # Avance de los trabajos: se refresca cada 5 s solo mientras haya alguno abierto
+            hay_abiertos = bool(trabajos_abiertos(session))
+            @st.fragment(run_every=5 if hay_abiertos else None)
+            def panel_trabajos():
+                with get_session() as s_panel:
+                    recientes = s_panel.query(Trabajo).order_by(Trabajo.creado.desc()).limit(5).all()
+                    if recientes: st.markdown("**📋 Últimos trabajos**")
+                    for t in recientes:
+                        c = progreso(s_panel, t.id)
+                        listos = t.total - c.get("pendiente", 0) - c.get("en_proceso", 0)
+                        st.progress(min(listos / max(t.total, 1), 1.0), text=f"#{t.id} {t.instancia} — {t.estado} ({listos}/{t.total}, errores: {c.get('error', 0)})")
+                        if c.get("error") and t.estado == "con_errores":
+                            if st.button("🔁 Reintentar filas con error", key=f"reint_{t.id}"): reintentar_errores(s_panel, t.id); st.rerun()
+                    if hay_abiertos and not trabajos_abiertos(s_panel): st.rerun()  # Terminaron: rerun completo para dejar de refrescar
+            panel_trabajos()
+
+        # --- TAB 6: INFORMES EN LOTE (un PDF por alumno, todo en un ZIP) ---
+        with tab6, seccion("informes"):
+            st.subheader("🖨️ Informes de todo un curso o materia")
+            c1, c2 = st.columns(2)
+            años = sorted({a[3] for a in lista_alumnos() if a[3] is not None})
+            año_inf = c1.selectbox("Año", ["(Todos)"] + años)
+            nom_mats_inf = {m[0]: m[1] for m in lista_materias()}
+            mat_inf = c2.selectbox("Materia", ["(Todas)"] + list(nom_mats_inf), format_func=lambda x: nom_mats_inf.get(x, x))
+            # Los informes llevan las recomendaciones ya guardadas; las que faltan se generan acá (o las genera el worker)
+            with st.expander(f"💡 Recomendaciones pendientes: {pendientes_recomendaciones()}"):
+                c_lim, c_con, c_rpm = st.columns(3)
+                limite_rec = c_lim.number_input("Cuántas generar", 1, 100_000, 200)
+                conc_rec = c_con.number_input("Llamadas IA en paralelo", 1, 20, int(st.secrets.get("IA_MAX_CONCURRENCIA", MAX_CONCURRENCIA)), key="rec_conc")
+                rpm_rec = c_rpm.number_input("Tope extra por minuto (0 = solo el límite general)", 0, 600, 0, key="rec_rpm")
+                if st.button("✨ Generar recomendaciones"):
+                    bar = st.progress(0); hechas = [0]
+                    def avanzar_rec(tarea, error):
+                        hechas[0] += 1; bar.progress(min(hechas[0] / limite_rec, 1.0))
+                    cuenta = generar_pendientes(session, limite_rec, max_concurrencia=conc_rec, rpm=rpm_rec, al_avanzar=avanzar_rec)
+                    invalidar("recomendaciones")
+                    st.success(f"✅ {cuenta['generadas']} generadas" + (f", {cuenta['errores']} con error (se reintentan en la próxima pasada)" if cuenta["errores"] else "")
+                               + (f", {cuenta['postergadas']} postergadas por el límite de la API" if cuenta["postergadas"] else "") + ".")
+            if st.button("🖨️ Generar informes"):
+                from reportes import datos_para_informes, generar_informes_zip
+                datos = datos_para_informes(session, None if año_inf == "(Todos)" else año_inf, None if mat_inf == "(Todas)" else mat_inf)
+                if not datos: st.warning("No hay alumnos para ese filtro.")
+                else:
+                    bar = st.progress(0, text="Armando informes...")
+                    zip_informes = generar_informes_zip(datos, al_avanzar=lambda hechos, total: bar.progress(hechos / total, text=f"{hechos}/{total} informes"))
+                    st.download_button("⬇️ Descargar ZIP", zip_informes, "informes.zip", "application/zip")
+
+        # --- TAB 8: BUSCAR EN COMENTARIOS (índice de texto completo, ver busqueda_comentarios.py) ---
+        with tab8, seccion("comentarios"):
+            st.subheader("🔍 Buscar en comentarios y devoluciones de la IA")
+            txt_c = st.text_input("Buscar", placeholder='ej: confunde causas "revolución industrial"', key="com_q")
+            c1, c2, c3, c4 = st.columns(4)
+            nom_mats_c = {m[0]: m[1] for m in lista_materias()}
+            mat_c = c1.selectbox("Materia", [None] + list(nom_mats_c), format_func=lambda x: "(Todas)" if x is None else nom_mats_c[x], key="com_mat")
+            inst_c = c2.text_input("Instancia", key="com_inst").strip() or None
+            fechas_c = c3.date_input("Fechas", value=(), key="com_fechas")
+            notas_c = c4.slider("Notas", 0.0, 10.0, (0.0, 10.0), 0.5, key="com_notas")
+            # "recientes" corta apenas junta una página; "relevancia" tiene que puntuar todas las coincidencias
+            orden_c = st.radio("Ordenar por", ["recientes", "relevancia"], horizontal=True, key="com_orden")
+            filtros_c = {"texto": txt_c, "materia_id": mat_c, "instancia": inst_c, "orden": orden_c,
+                         "fecha_desde": fechas_c[0] if len(fechas_c) > 0 else None, "fecha_hasta": fechas_c[1] if len(fechas_c) > 1 else None,
+                         "nota_min": notas_c[0] if notas_c[0] > 0 else None, "nota_max": notas_c[1] if notas_c[1] < 10 else None}
+            if st.session_state.get("com_prev") != filtros_c:
+                st.session_state["com_prev"] = filtros_c; st.session_state["com_pag"] = 0
+            pag_c = st.session_state.get("com_pag", 0)
+            res_c, mas_c = buscar_comentarios(pag_c * TAMANO_PAGINA_COMENTARIOS, **filtros_c)
+            if not res_c: st.info("Sin resultados.")
+            for _, _, alumno_c, materia_c, instancia_c, nota_c, fecha_c, fragmento_c in res_c:
+                st.markdown(f"**{alumno_c or '(sin alumno)'}** · {materia_c or '-'} · {instancia_c or '-'} · nota {nota_c if nota_c is not None else '-'} · {fecha_c or ''}  \n{fragmento_c}")
+            if pag_c or mas_c:
+                c_ant, c_pag, c_sig = st.columns([1, 2, 1])
+                c_ant.button("◀ Anteriores", disabled=not pag_c, on_click=lambda: st.session_state.update(com_pag=pag_c - 1))
+                c_pag.caption(f"Página {pag_c + 1}")
+                c_sig.button("Siguientes ▶", disabled=not mas_c, on_click=lambda: st.session_state.update(com_pag=pag_c + 1))
+
+        # --- TAB 7: RENDIMIENTO (lo que mide instrumentacion.py en este proceso) ---
+        with tab7:
+            st.subheader("📈 Rendimiento de este servidor")
+            st.caption("En memoria desde que arrancó el proceso; el rerun actual todavía no está sumado. Tiempos en milisegundos.")
+            def tabla_tiempos(nombre, etiqueta=None, escala=1000):
+                filas = instrumentacion.resumen_tiempos(nombre)
+                if not filas: return None
+                df = pd.DataFrame(filas)
+                for col in ["media", "p50", "p95", "max"]: df[col] = (df[col] * escala).round(1)
+                return df.sort_values("p95", ascending=False) if etiqueta is None else df.rename(columns={"cantidad": etiqueta})
+
+            arranque = {f["etapa"]: f["media"] for f in instrumentacion.resumen_tiempos("arranque_segundos")}
+            if arranque: st.caption("🚀 Arranque del proceso: " + " · ".join(f"{etapa} {arranque[etapa]:.2f} s" for etapa in ["importaciones", "conexion", "primer_rerun"] if etapa in arranque))
+
+            st.markdown("**🔁 Reruns**")
+            reruns = tabla_tiempos("rerun_segundos", "reruns")
+            if reruns is not None:
+                sql = tabla_tiempos("rerun_consultas_sql", escala=1)[["pantalla", "media", "p95", "max"]].rename(columns={"media": "SQL media", "p95": "SQL p95", "max": "SQL max"})
+                st.dataframe(reruns.merge(sql, on="pantalla"), use_container_width=True, hide_index=True)
+            else: st.info("Todavía no hay reruns medidos.")
+
+            c_sec, c_ia = st.columns(2)
+            with c_sec:
+                st.markdown("**🧩 Secciones**")
+                sec = tabla_tiempos("seccion_segundos")
+                if sec is not None: st.dataframe(sec, use_container_width=True, hide_index=True)
+            with c_ia:
+                st.markdown("**🤖 IA**")
+                llm = tabla_tiempos("llm_segundos")
+                if llm is not None: st.dataframe(llm, use_container_width=True, hide_index=True)
+                ttft = tabla_tiempos("llm_primer_token_segundos")
+                if ttft is not None: st.caption(f"Primer token (stream): p50 {ttft['p50'].iloc[0]} ms · p95 {ttft['p95'].iloc[0]} ms")
+                for nombre in ["llm_solicitudes_total", "llm_tokens_total"]:
+                    cont = instrumentacion.resumen_contadores(nombre)
+                    if cont: st.dataframe(pd.DataFrame(cont), use_container_width=True, hide_index=True)
+
+            st.markdown("**🧪 Corrección Masiva (por fila)**")
+            filas_cm = [df.assign(paso=paso) for paso, df in [("IA (de a uno)", tabla_tiempos("correccion_fila_segundos")), ("IA (grupo)", tabla_tiempos("correccion_grupo_segundos")),
+                                                              ("prompt + RAG", tabla_tiempos("correccion_prompt_segundos"))] if df is not None]
+            if filas_cm: st.dataframe(pd.concat(filas_cm), use_container_width=True, hide_index=True)
+            for nombre, titulo in [("correccion_respuestas_total", "Respuestas"), ("correccion_filas_total", "Filas"), ("correccion_llamadas_total", "Llamadas"), ("correccion_json_total", "JSON agrupado")]:
+                cont = instrumentacion.resumen_contadores(nombre)
+                if cont: st.caption(f"{titulo}: " + " · ".join(f"{list(c.values())[0]}: {c['valor']}" for c in cont))
+
+            st.markdown("**🐢 Sentencias SQL que más tiempo suman**")
+            lentas = instrumentacion.sentencias_lentas(10)
+            if lentas: st.dataframe(pd.DataFrame(lentas).round(3), use_container_width=True, hide_index=True)
+
+            c_exp, c_rei = st.columns(2)
+            c_exp.download_button("⬇️ Métricas (Prometheus)", instrumentacion.texto_prometheus(metricas_extra()), "metricas.prom", "text/plain")
+            if c_rei.button("🧹 Reiniciar contadores"): instrumentacion.reiniciar(); st.rerun()
+
+    # ==============================================================================
+    # MODO DASHBOARD
+    # ==============================================================================
+    elif "Dashboard" in modo:
+        try:
+            st.title("🎓 Dashboard Inteligente")
+            fila_sel = selector_alumno("Alumno:", "alu_dash", st.sidebar)
+            if not fila_sel: st.warning("Sin alumnos." if not st.session_state.get("alu_dash_q") else "Ningún alumno coincide con la búsqueda.")
+            else:
+                alu = session.get(Alumno, fila_sel[0])
+                if alu:
+                    # Métricas desde los agregados ya calculados (no se leen todas las notas)
+                    total, por_materia = agregados_cacheados(alu.id)
+                    total = SimpleNamespace(**total) if total else None
+                    p, _ = promedio_y_desvio(total)
+                    cant = total.cantidad if total else 0
+                    c1,c2,c3,c4 = st.columns(4)
+                    c1.metric("Alumno", alu.nombre_completo); c2.metric("Promedio", f"{p:.2f}"); c3.metric("Notas", cant)
+                    c4.metric("Estado", "⚠️ En riesgo" if en_riesgo(total) else "✅ OK")
+                    if por_materia:
+                        resumen = []
+                        for nombre, fila in por_materia:
+                            prom, desv = promedio_y_desvio(SimpleNamespace(**fila))
+                            resumen.append({"Materia": nombre, "Notas": fila["cantidad"], "Promedio": round(prom, 2), "Desvío": round(desv, 2),
+                                            "Mín": fila["minimo"], "Máx": fila["maximo"], "Última": fila["ultima_nota"], "Bajo 6": fila["bajas"]})
+                        st.dataframe(pd.DataFrame(resumen), use_container_width=True, hide_index=True)
+                    st.divider()
                 
-                if st.button("📄 PDF"):
-                    with st.spinner("Creando..."):
-                        res = responder_chat_educativo(alu.nombre_completo, str(nts), "Resumen.")
-                        st.download_button("⬇️ PDF", crear_reporte_pdf(alu, res), f"R_{alu.nombre_completo}.pdf", "application/pdf")
-
-                c_izq, c_der = st.columns([2, 1])
-                with c_izq:
-                    st.subheader("Historial")
-                    if alu.evaluaciones:
-                        df_n = pd.DataFrame([{"Fecha":e.fecha, "Materia":e.materia.nombre, "Instancia":e.instancia, "Nota":e.nota, "Comentario":e.comentario} for e in alu.evaluaciones])
-                        st.dataframe(df_n, use_container_width=True)
-                    else: st.info("Sin notas.")
-
-                with c_der:
-                    st.subheader("💬 Chat RAG")
-                    if "messages" not in st.session_state: st.session_state.messages = []
-                    q = st.chat_input("Pregunta...")
-                    if q:
-                        with st.chat_message("user"): st.write(q)
-                        ctx_docs = ""
-                        vistos = set()
-                        for e in alu.evaluaciones:
-                            if e.materia.nombre not in vistos:
-                                prog = e.materia.programa if e.materia.programa else ""
-                                ctx_docs += f"\n📚 {e.materia.nombre}:\n{prog[:3000]}\n---"
-                                vistos.add(e.materia.nombre)
+                    # Recomendaciones ya generadas (una por evaluación, ver recomendaciones.py): se leen de la tabla
+                    recs, faltan = recomendaciones_cacheadas(alu.id)
+                    with st.expander(f"💡 Recomendaciones ({len(recs)})", expanded=bool(recs)):
+                        if recs:
+                            st.dataframe(pd.DataFrame([{"Materia": m, "Instancia": i, "Nota": n, "Recomendación": r, "Estado": e, "Generada": f, "Al día": "✅" if d else "🔄"}
+                                                       for m, i, n, r, e, f, d in recs]), use_container_width=True, hide_index=True)
+                        if faltan:
+                            st.caption(f"{faltan} evaluaciones sin recomendación (o con nota/comentario cambiados). El worker las genera solas.")
+                            if st.button(f"✨ Generar ahora ({faltan})"):
+                                with st.spinner("Generando..."):
+                                    cuenta = generar_pendientes(session, alumno_id=alu.id, max_concurrencia=int(st.secrets.get("IA_MAX_CONCURRENCIA", MAX_CONCURRENCIA)))
+                                invalidar("recomendaciones")
+                                if cuenta["errores"]: st.warning(f"{cuenta['errores']} fallaron; se reintentan en la próxima pasada.")
+                                st.rerun()
+                        elif not recs: st.caption("Sin evaluaciones con nota.")
+
+                    if st.button("📄 PDF"):
+                        # Sin llamadas a la IA: resumen con las notas + las recomendaciones guardadas que siguen al día
+                        from reportes import crear_reporte_pdf
+                        with st.spinner("Creando..."):
+                            st.download_button("⬇️ PDF", crear_reporte_pdf(alumno_con_historial(session, alu.id), recomendaciones=[(m, i, r) for m, i, _, r, _, _, al_dia in recs if al_dia]),
+                                               f"R_{alu.nombre_completo}.pdf", "application/pdf")
+
+                    c_izq, c_der = st.columns([2, 1])
+                    with c_izq, seccion("historial"):
+                        st.subheader("Historial")
+                        if cant:
+                            df_n = historial_cacheado(alu.id)
+                            st.dataframe(df_n, use_container_width=True)
+                        else: st.info("Sin notas.")
+
+                    with c_der, seccion("chat"):
+                        st.subheader("💬 Chat RAG")
+                        if "messages" not in st.session_state: st.session_state.messages = []
+                        q = st.chat_input("Pregunta...")
+                        if q:
+                            with st.chat_message("user"): st.write(q)
+                            ctx_docs = ""
+                            for mat in materias_de_alumno(session, alu.id):
+                                ctx_docs += f"\n📚 {mat.nombre}:\n{contexto_relevante(session, mat, q, k=3)}\n---"
                         
-                        with st.chat_message("assistant"):
-                            with st.spinner("Analizando..."):
-                                st.write(responder_chat_educativo(alu.nombre_completo, f"DOCS:\n{ctx_docs}", q))
+                            with st.chat_message("assistant"):
+                                try: st.write_stream(responder_chat_educativo_stream(alu.nombre_completo, f"DOCS:\n{ctx_docs}", q))
+                                except ErrorIA as e: st.warning(f"La IA no respondió, probá de nuevo en un rato ({e})")
+
+        except Exception as e: st.error(f"Error Dash: {e}")
 
-    except Exception as e: st.error(f"Error Dash: {e}")
+    # ==============================================================================
+    # MODO ANALÍTICA (cohortes, ver analitica.py)
+    # ==============================================================================
+    elif "Analítica" in modo:
+        with seccion("analitica"):
+            st.title("📈 Analítica de cohortes")
+            c1, c2, c3 = st.columns(3)
+            años_an = sorted({a[3] for a in lista_alumnos() if a[3] is not None})
+            año_an = c1.selectbox("Año", [None] + años_an, format_func=lambda x: "(Todos)" if x is None else f"{x}°")
+            nom_mats_an = {m[0]: m[1] for m in lista_materias()}
+            mat_an = c2.selectbox("Materia", [None] + list(nom_mats_an), format_func=lambda x: "(Todas)" if x is None else nom_mats_an[x])
+            ins_an = c3.text_input("Instancia (opcional)").strip()
+            with st.spinner("Calculando..."):
+                res_an = analitica_cacheada(año_an, mat_an, ins_an)
+            if res_an is None: st.info("No hay notas para ese filtro.")
+            else:
+                r = res_an["resumen"]; por_alu = res_an["alumnos"]
+                m1, m2, m3, m4, m5 = st.columns(5)
+                m1.metric("Alumnos", r["alumnos"]); m2.metric("Notas", r["notas"]); m3.metric("Promedio", f"{r['promedio']:.2f}")
+                m4.metric("Mediana", f"{r['mediana']:.1f}"); m5.metric("Notas bajas", f"{r['porcentaje_bajas']:.1f}%")
+                st.caption(f"Desvío {r['desvio']:.2f} · p10 {r['p10']:.1f} · p25 {r['p25']:.1f} · p75 {r['p75']:.1f} · p90 {r['p90']:.1f} · "
+                           f"{int(por_alu['en_riesgo'].sum())} alumnos en riesgo (promedio o última nota < 6)")
+                c_dist, c_mat = st.columns(2)
+                with c_dist:
+                    st.markdown("**Distribución de notas**")
+                    st.bar_chart(res_an["distribucion"], x="rango", y="notas")
+                with c_mat:
+                    st.markdown("**Por materia**")
+                    df_mat = res_an["materias"].assign(materia=lambda d: d["materia_id"].map(nom_mats_an)).drop(columns="materia_id")
+                    st.dataframe(df_mat[["materia", "alumnos", "notas", "promedio", "desvio", "porcentaje_bajas"]].round(2), use_container_width=True, hide_index=True)
 
-session.close()
+                st.markdown("**🚨 Alerta temprana: ranking de riesgo**")
+                st.caption("Riesgo 0-1: z-score contra el curso en cada materia, porcentaje de notas bajas, tendencia (puntos por mes) y última nota.")
+                cuantos = st.slider("Mostrar", 10, 200, 50, 10)
+                top = por_alu.head(cuantos).copy()
+                # Nombres solo de los que se muestran (una consulta por id)
+                top.insert(0, "alumno", top["alumno_id"].map(nombres_por_id(session, Alumno, top["alumno_id"])))
+                st.dataframe(top.drop(columns="alumno_id").round(2), use_container_width=True, hide_index=True)
+                st.download_button("⬇️ Ranking completo (CSV)", por_alu.round(3).to_csv(index=False).encode("utf-8"), "ranking_riesgo.csv")
+    session.close()
+finally:
+    instrumentacion.terminar_rerun(pantalla)
+    if st.secrets.get("METRICAS_ARCHIVO"):
+        # Para el textfile collector de Prometheus (node_exporter)
+        try: instrumentacion.escribir_archivo(st.secrets["METRICAS_ARCHIVO"], metricas_extra())
+        except OSError: pass
@@ -0,0 +1,216 @@
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+
+from config_db import crear_engine
+from crear_base_datos import Alumno, Materia
+from migraciones import esquema_al_dia, migrar
+from cache_llm import configurar_cache, estadisticas as estadisticas_cache
+from cliente_ia import metricas as metricas_ia
+from instrumentacion import instrumentar_engine, iniciar_servidor_metricas, registrar_arranque
+from consultas import historial_alumno, notas_alumno, COLUMNAS_HISTORIAL
+from busqueda_alumnos import buscar_alumnos, TAMANO_PAGINA
+from busqueda_comentarios import buscar_comentarios
+from analitica import notas_escuela, filtrar, analizar, analitica_cohorte
+from recomendaciones import recomendaciones_de_alumno, contar_pendientes  # Registra el evento que sube evaluaciones.version
+from agregados import agregado_alumno, agregados_por_materia, CAMPOS  # Registra los eventos que mantienen los agregados
+
+# --- CACHÉ DE STREAMLIT ---
+# Streamlit vuelve a correr todo el script en cada clic. Lo que no cambia entre clics
+# (el engine, las listas de alumnos y materias, el historial) se guarda acá y se
+# invalida por "versión": cada vez que alguien escribe en la base se sube la versión
+# del área tocada y las lecturas cacheadas con la versión vieja dejan de usarse.
+
+TTL_HISTORIAL = 60  # segundos; el worker de corrección escribe desde otro proceso y no sube versiones
+TTL_ANALITICA = 600  # segundos; la carga de todas las notas es lo caro, no vale rehacerla cada minuto
+
+
+# --- CONEXIÓN (una sola vez por proceso) ---
+@st.cache_resource(show_spinner=False)
+def obtener_engine():
+    # Pool, sslmode y pragmas de SQLite (WAL) se configuran en config_db.py desde secrets o variables de entorno
+    t0 = time.perf_counter()
+    engine = crear_engine(secretos=st.secrets)
+    # Las migraciones se corren en el deploy (python migraciones.py): acá es una consulta a schema_version
+    # y solo se migra si la base quedó atrás. Si la migración falla no se sigue con un esquema a medias:
+    # el error llega a dashboard.py (st.error + st.stop) y el engine no queda cacheado, se reintenta en el próximo rerun
+    try:
+        if not esquema_al_dia(engine): migrar(engine)
+    except SQLAlchemyError as e:
+        raise RuntimeError(f"No se pudo migrar la base de datos (ver python migraciones.py --estado): {e}") from e
+    configurar_cache(engine, ttl_horas=int(st.secrets.get("IA_CACHE_TTL_HORAS", 24 * 7)))
+    instrumentar_engine(engine)
+    if st.secrets.get("METRICAS_PUERTO"):
+        # /metrics para Prometheus, un solo servidor por proceso
+        try: iniciar_servidor_metricas(int(st.secrets["METRICAS_PUERTO"]), extras=metricas_extra)
+        except OSError: pass
+    registrar_arranque("conexion", time.perf_counter() - t0)
+    return engine
+
+
+def metricas_extra():
+    # Gauges que no lleva instrumentacion (estadísticas de la caché de IA, disyuntor y pausa del cliente)
+    ec = estadisticas_cache()
+    return {**{f"cache_ia_{k}": v for k, v in ec.items()}, **metricas_ia()}
+
+
+@st.cache_resource(show_spinner=False)
+def obtener_sessionmaker():
+    return sessionmaker(bind=obtener_engine())
+
+
+def sesion_del_rerun():
+    # Una sesión por rerun: la del rerun anterior se cierra acá aunque aquel haya cortado con
+    # st.stop(), st.rerun() o una excepción, así no quedan conexiones del pool tomadas
+    anterior = st.session_state.pop("_sesion_db", None)
+    if anterior is not None:
+        try: anterior.close()
+        except Exception: pass
+    st.session_state["_sesion_db"] = obtener_sessionmaker()()
+    return st.session_state["_sesion_db"]
+
+
+# --- VERSIONES (compartidas entre todas las pestañas abiertas) ---
+@st.cache_resource(show_spinner=False)
+def _versiones():
+    return {"alumnos": 0, "materias": 0, "evaluaciones": 0, "recomendaciones": 0, "lock": threading.Lock()}
+
+
+def version(area):
+    return _versiones()[area]
+
+
+def invalidar(*areas):
+    # Llamar después de cada commit que cambie alumnos, materias o evaluaciones
+    v = _versiones()
+    with v["lock"]:
+        for area in areas:
+            v[area] += 1
+
+
+# --- LECTURAS CACHEADAS ---
+# Devuelven datos simples (tuplas, DataFrames), nunca objetos del ORM atados a una sesión.
+
+@st.cache_data(show_spinner=False)
+def _listar_alumnos(version_alumnos):
+    with obtener_sessionmaker()() as session:
+        return [tuple(r) for r in session.query(Alumno.id, Alumno.nombre_completo, Alumno.dni, Alumno.año_escolar).order_by(Alumno.nombre_completo)]
+
+
+@st.cache_data(show_spinner=False, max_entries=500)
+def _buscar_alumnos(texto, desde, limite, version_alumnos):
+    with obtener_sessionmaker()() as session:
+        return buscar_alumnos(session, texto, limite, desde)
+
+
+@st.cache_data(show_spinner=False, max_entries=200, ttl=TTL_HISTORIAL)
+def _buscar_comentarios(filtros, desde, version_evaluaciones):
+    with obtener_sessionmaker()() as session:
+        return buscar_comentarios(session, desde=desde, **dict(filtros))
+
+
+@st.cache_resource(show_spinner=False, max_entries=1, ttl=TTL_ANALITICA)
+def _notas_escuela(version_evaluaciones, version_alumnos):
+    # Arrays de NumPy de todas las notas, compartidos (solo lectura) por todas las pestañas
+    with obtener_sessionmaker()() as session:
+        return notas_escuela(session)
+
+
+@st.cache_data(show_spinner=False, max_entries=50, ttl=TTL_ANALITICA)
+def _analitica(año, materia_id, instancia, version_evaluaciones, version_alumnos):
+    if instancia:
+        with obtener_sessionmaker()() as session:
+            return analitica_cohorte(session, año, materia_id, instancia)
+    datos, años = _notas_escuela(version_evaluaciones, version_alumnos)
+    return analizar(filtrar(datos, años, año, materia_id))
+
+
+@st.cache_data(show_spinner=False)
+def _listar_materias(version_materias):
+    with obtener_sessionmaker()() as session:
+        return [tuple(r) for r in session.query(Materia.id, Materia.nombre, Materia.profesor_titular).order_by(Materia.nombre)]
+
+
+@st.cache_data(show_spinner=False, ttl=TTL_HISTORIAL)
+def _historial(alumno_id, version_evaluaciones):
+    with obtener_sessionmaker()() as session:
+        return pd.DataFrame(historial_alumno(session, alumno_id), columns=COLUMNAS_HISTORIAL)
+
+
+@st.cache_data(show_spinner=False, ttl=TTL_HISTORIAL)
+def _notas(alumno_id, version_evaluaciones):
+    with obtener_sessionmaker()() as session:
+        return notas_alumno(session, alumno_id)
+
+
+@st.cache_data(show_spinner=False, ttl=TTL_HISTORIAL)
+def _agregados(alumno_id, version_evaluaciones):
+    # (total del alumno o None, [(materia, {campo: valor}), ...]): dos lecturas por PK, sin recorrer las notas
+    with obtener_sessionmaker()() as session:
+        total = agregado_alumno(session, alumno_id)
+        por_materia = [(nombre, {c: getattr(fila, c) for c in CAMPOS}) for nombre, fila in agregados_por_materia(session, alumno_id)]
+        return ({c: getattr(total, c) for c in CAMPOS} if total else None), por_materia
+
+
+@st.cache_data(show_spinner=False, ttl=TTL_HISTORIAL)
+def _recomendaciones(alumno_id, version_evaluaciones, version_recomendaciones):
+    # (recomendaciones guardadas, cuántas evaluaciones del alumno esperan la suya)
+    with obtener_sessionmaker()() as session:
+        return recomendaciones_de_alumno(session, alumno_id), contar_pendientes(session, alumno_id)
+
+
+@st.cache_data(show_spinner=False, ttl=TTL_HISTORIAL)
+def _pendientes_recomendaciones(version_evaluaciones, version_recomendaciones):
+    with obtener_sessionmaker()() as session:
+        return contar_pendientes(session)
+
+
+def alumnos():
+    # [(id, nombre_completo, dni, año_escolar), ...]
+    return _listar_alumnos(version("alumnos"))
+
+
+def buscar(texto, desde=0, limite=TAMANO_PAGINA):
+    # Una página de [(id, nombre_completo, dni, año_escolar), ...] y si hay más (ver busqueda_alumnos.py)
+    return _buscar_alumnos(texto or "", desde, limite, version("alumnos"))
+
+
+def comentarios(desde=0, **filtros):
+    # Página de resultados de busqueda_comentarios.buscar_comentarios (texto, materia_id, instancia, fechas, notas, orden)
+    return _buscar_comentarios(tuple(sorted(filtros.items())), desde, version("evaluaciones"))
+
+
+def analitica(año=None, materia_id=None, instancia=None):
+    # Ver analitica.analizar: resumen, distribución, ranking por alumno y resumen por materia (o None si no hay notas)
+    return _analitica(año, materia_id, instancia or None, version("evaluaciones"), version("alumnos"))
+
+
+def materias():
+    # [(id, nombre, profesor_titular), ...]
+    return _listar_materias(version("materias"))
+
+
+def historial(alumno_id):
+    return _historial(alumno_id, version("evaluaciones"))
+
+
+def notas(alumno_id):
+    return _notas(alumno_id, version("evaluaciones"))
+
+
+def agregados(alumno_id):
+    return _agregados(alumno_id, version("evaluaciones"))
+
+
+def recomendaciones(alumno_id):
+    # Ver recomendaciones.recomendaciones_de_alumno; se leen de la tabla, nunca llaman a la IA
+    return _recomendaciones(alumno_id, version("evaluaciones"), version("recomendaciones"))
+
+
+def pendientes_recomendaciones():
+    # Evaluaciones de toda la escuela que esperan su recomendación (nueva o rehecha)
+    return _pendientes_recomendaciones(version("evaluaciones"), version("recomendaciones"))
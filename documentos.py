@@ -0,0 +1,98 @@
+import hashlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import func
+
+from crear_base_datos import DocumentoMateria
+
+# --- ALMACÉN DE DOCUMENTOS (PDFs de bibliografía) ---
+# Cada PDF se guarda una sola vez por materia (identificado por su hash), así volver a
+# subirlo no vuelve a extraer nada. Los PDFs grandes se leen en varios procesos a la vez.
+
+PAGINAS_POR_TAREA = 20       # Páginas que lee cada proceso por tarea
+MIN_PAGINAS_PARALELO = 40    # Con menos páginas no vale la pena levantar procesos
+TAMANO_PAGINA_VISTA = 5000   # Caracteres por página en la vista previa
+
+
+def huella_pdf(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+
+_pdf_del_proceso = {"reader": None}   # En cada proceso del pool: el PDF ya abierto
+
+
+def _abrir_pdf(contenido):
+    # initializer del pool: los bytes del PDF viajan una vez por proceso, no una vez por tarea
+    from pypdf import PdfReader
+    _pdf_del_proceso["reader"] = PdfReader(io.BytesIO(contenido))
+
+
+def _paginas(reader, inicio, fin):
+    return [reader.pages[i].extract_text() or "" for i in range(inicio, fin)]
+
+
+def _extraer_rango(rango):
+    # Corre dentro de un proceso del pool: páginas [inicio, fin) del PDF que abrió _abrir_pdf
+    return _paginas(_pdf_del_proceso["reader"], *rango)
+
+
+def extraer_texto_pdf(contenido, procesos=None):
+    from pypdf import PdfReader
+    reader = PdfReader(io.BytesIO(contenido))
+    total = len(reader.pages)
+    rangos = [(i, min(i + PAGINAS_POR_TAREA, total)) for i in range(0, total, PAGINAS_POR_TAREA)]
+    if total < MIN_PAGINAS_PARALELO:
+        partes = [_paginas(reader, *r) for r in rangos]
+    else:
+        # spawn: procesos limpios (fork dentro del servidor de Streamlit, que tiene hilos, se puede colgar)
+        with ProcessPoolExecutor(max_workers=procesos or min(len(rangos), os.cpu_count() or 2), mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_abrir_pdf, initargs=(contenido,)) as pool:
+            partes = list(pool.map(_extraer_rango, rangos))  # map conserva el orden de las páginas
+    # join al final (sumar strings página por página copia todo el texto cada vez)
+    return "\n".join(texto for parte in partes for texto in parte), total
+
+
+def guardar_documentos(session, materia_id, archivos):
+    # archivos: [(nombre, bytes)]. No hace commit; devuelve (nuevos, repetidos, errores)
+    nuevos, repetidos, errores = [], [], []
+    huellas = [(huella_pdf(contenido), nombre, contenido) for nombre, contenido in archivos]
+    ya_guardadas = {h for (h,) in session.query(DocumentoMateria.huella).filter(
+        DocumentoMateria.materia_id == materia_id, DocumentoMateria.huella.in_([h for h, _, _ in huellas]))}
+    for huella, nombre, contenido in huellas:
+        if huella in ya_guardadas:
+            repetidos.append(nombre)
+            continue
+        ya_guardadas.add(huella)  # El mismo PDF dos veces en la misma subida
+        try:
+            texto, paginas = extraer_texto_pdf(contenido)
+        except Exception:
+            errores.append(nombre)
+            continue
+        session.add(DocumentoMateria(materia_id=materia_id, nombre=nombre, huella=huella, paginas=paginas, tamano=len(contenido), texto=texto))
+        nuevos.append(nombre)
+    return nuevos, repetidos, errores
+
+
+def documentos_de_materia(session, materia_id):
+    # Sin el texto (puede ser enorme): solo lo necesario para listarlos
+    return session.query(DocumentoMateria.id, DocumentoMateria.nombre, DocumentoMateria.paginas, DocumentoMateria.tamano) \
+        .filter_by(materia_id=materia_id).order_by(DocumentoMateria.fecha).all()
+
+
+def textos_de_documentos(session, materia_id):
+    for nombre, texto in session.query(DocumentoMateria.nombre, DocumentoMateria.texto).filter_by(materia_id=materia_id).order_by(DocumentoMateria.fecha).yield_per(10):
+        yield f"--- DOC: {nombre} ---\n{texto or ''}"
+
+
+# --- VISTA PREVIA PAGINADA (se pide a la base solo el pedazo que se muestra) ---
+def contar_paginas(session, columna, condicion, tamano=TAMANO_PAGINA_VISTA):
+    largo = session.query(func.coalesce(func.length(columna), 0)).filter(condicion).scalar() or 0
+    return max(1, -(-largo // tamano))
+
+
+def leer_pagina(session, columna, condicion, pagina, tamano=TAMANO_PAGINA_VISTA):
+    inicio = (pagina - 1) * tamano
+    return session.query(func.substr(columna, inicio + 1, tamano)).filter(condicion).scalar() or ""
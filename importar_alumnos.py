@@ -0,0 +1,117 @@
+import pandas as pd
+from sqlalchemy import insert
+
+from crear_base_datos import Alumno
+
+# --- IMPORTACIÓN MASIVA DE ALUMNOS ---
+# El archivo se lee por bloques y cada bloque se compara contra la base con UNA
+# consulta por nombre y otra por DNI (no una por fila). Los nuevos se insertan
+# todos juntos con un solo INSERT.
+
+TAMANO_BLOQUE = 2000
+COLUMNAS_OPCIONALES = {"DNI": "dni", "Email": "email", "Tel": "telefono", "Teléfono": "telefono"}
+
+
+def leer_en_bloques(archivo, nombre_archivo, tamano=TAMANO_BLOQUE):
+    if nombre_archivo.endswith("csv"):
+        # dtype=str: que el DNI "01234" no se convierta en el número 1234
+        yield from pd.read_csv(archivo, chunksize=tamano, dtype=str)
+        return
+    # Excel en modo solo lectura: openpyxl va leyendo filas sin cargar la hoja entera
+    from openpyxl import load_workbook
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else "" for c in next(filas, [])]
+        bloque = []
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) >= tamano:
+                yield pd.DataFrame(bloque, columns=encabezado, dtype=object); bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=encabezado, dtype=object)
+    finally:
+        libro.close()
+
+
+def _texto(valor):
+    if valor is None or (isinstance(valor, float) and valor != valor):
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)  # Excel guarda el DNI 30111222 como 30111222.0
+    valor = str(valor).strip()
+    return valor or None
+
+
+def _limpiar_bloque(df):
+    # Devuelve (filas válidas, cantidad de inválidas). Una fila es válida si tiene Nombre y Año numérico.
+    df.columns = [str(c).strip() for c in df.columns]
+    if "Nombre" not in df.columns or "Año" not in df.columns:
+        raise ValueError("El archivo tiene que tener las columnas 'Nombre' y 'Año'.")
+    opcionales = {col: campo for col, campo in COLUMNAS_OPCIONALES.items() if col in df.columns}
+
+    validas, invalidas = [], 0
+    for registro in df.to_dict("records"):
+        nombre = _texto(registro["Nombre"])
+        try:
+            año = int(float(registro["Año"]))
+        except (TypeError, ValueError):
+            año = None
+        if not nombre or año is None:
+            invalidas += 1
+            continue
+        fila = {"nombre_completo": nombre, "año_escolar": año}
+        for col, campo in opcionales.items():
+            fila[campo] = _texto(registro[col])
+        validas.append(fila)
+    return validas, invalidas
+
+
+def _insertar(session, filas):
+    # Si otro proceso insertó el mismo DNI en el medio, se ignora en vez de cortar la importación.
+    # Devuelve cuántas filas se insertaron de verdad (RETURNING: las salteadas no devuelven id)
+    dialecto = session.get_bind().dialect.name
+    if dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+    elif dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+    else:
+        session.execute(insert(Alumno), filas)
+        return len(filas)
+    # Todas las filas con las mismas columnas, así se mandan en un solo executemany
+    campos = {k for f in filas for k in f}
+    filas = [{k: f.get(k) for k in campos} for f in filas]
+    return len(session.execute(insert_dialecto(Alumno).on_conflict_do_nothing(index_elements=["dni"]).returning(Alumno.id), filas).all())
+
+
+def importar_alumnos(session, archivo, nombre_archivo, tamano_bloque=TAMANO_BLOQUE, al_avanzar=None):
+    resultado = {"insertados": 0, "omitidos": 0, "invalidos": 0}
+    vistos_nombres, vistos_dnis = set(), set()  # Repetidos dentro del mismo archivo
+
+    for df in leer_en_bloques(archivo, nombre_archivo, tamano_bloque):
+        validas, invalidas = _limpiar_bloque(df)
+        resultado["invalidos"] += invalidas
+
+        # Una consulta por bloque para cada criterio de duplicado
+        nombres = {f["nombre_completo"] for f in validas}
+        dnis = {f["dni"] for f in validas if f.get("dni")}
+        existentes_nombres = {n for (n,) in session.query(Alumno.nombre_completo).filter(Alumno.nombre_completo.in_(nombres))} if nombres else set()
+        existentes_dnis = {d for (d,) in session.query(Alumno.dni).filter(Alumno.dni.in_(dnis))} if dnis else set()
+
+        nuevas = []
+        for f in validas:
+            dni = f.get("dni")
+            if f["nombre_completo"] in existentes_nombres or f["nombre_completo"] in vistos_nombres or (dni and (dni in existentes_dnis or dni in vistos_dnis)):
+                resultado["omitidos"] += 1
+                continue
+            vistos_nombres.add(f["nombre_completo"])
+            if dni: vistos_dnis.add(dni)
+            nuevas.append(f)
+
+        insertadas = _insertar(session, nuevas) if nuevas else 0
+        session.commit()
+        resultado["insertados"] += insertadas
+        resultado["omitidos"] += len(nuevas) - insertadas  # DNI que otro proceso cargó mientras tanto
+        if al_avanzar:
+            al_avanzar(resultado)
+    return resultado
@@ -0,0 +1,113 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from sqlalchemy import func, insert
+
+from crear_base_datos import FragmentoPrograma, TerminoIndice
+from documentos import textos_de_documentos
+
+# --- CONFIGURACIÓN DEL ÍNDICE ---
+TAMANO_FRAGMENTO = 800   # caracteres aprox. por fragmento
+SOLAPE = 150             # caracteres que se repiten entre fragmentos seguidos
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Palabras que aparecen en todos lados y no ayudan a encontrar el tema
+STOPWORDS = set("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante
+e el ella ellas ellos en entre era eran es esa esas ese eso esos esta estas este esto estos
+fue fueron ha han hasta hay la las le les lo los mas me mi mis muy no nos o otra otras otro
+otros para pero por porque que quien se sea ser si sin sobre son su sus tambien te tiene
+tienen todo todos tu un una unas uno unos y ya pregunta respuesta alumno
+""".split())
+
+
+def normalizar(texto):
+    # Minúsculas y sin tildes: "Revolución" y "revolucion" cuentan como lo mismo
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokenizar(texto):
+    return [t for t in re.findall(r"\w+", normalizar(texto)) if len(t) > 2 and t not in STOPWORDS and not t.isdigit()]
+
+
+def partir_en_fragmentos(texto, tamano=TAMANO_FRAGMENTO, solape=SOLAPE):
+    # Corta por párrafos y junta hasta llegar al tamaño; los párrafos enormes se cortan a mano.
+    parrafos = [p.strip() for p in re.split(r"\n\s*\n", texto or "") if p.strip()]
+    fragmentos, actual = [], ""
+    for p in parrafos:
+        while len(p) > tamano:
+            if actual:
+                fragmentos.append(actual); actual = ""
+            fragmentos.append(p[:tamano])
+            p = p[tamano - solape:]
+        if actual and len(actual) + len(p) + 1 > tamano:
+            fragmentos.append(actual)
+            actual = actual[-solape:] + "\n" + p
+        else:
+            actual = f"{actual}\n{p}" if actual else p
+    if actual:
+        fragmentos.append(actual)
+    return fragmentos
+
+
+# --- PASO 1: CONSTRUIR EL ÍNDICE (al guardar la materia) ---
+def indexar_materia(session, materia):
+    # Reemplaza el índice de la materia (programa + PDFs del almacén de documentos).
+    # No hace commit: se guarda junto con la materia.
+    session.flush()
+    session.query(TerminoIndice).filter_by(materia_id=materia.id).delete(synchronize_session=False)
+    session.query(FragmentoPrograma).filter_by(materia_id=materia.id).delete(synchronize_session=False)
+
+    fragmentos = []
+    textos = [t for fuente in [materia.programa or ""] + list(textos_de_documentos(session, materia.id)) for t in partir_en_fragmentos(fuente)]
+    for orden, texto in enumerate(textos):
+        tokens = tokenizar(texto)
+        if tokens:
+            fragmentos.append((FragmentoPrograma(materia_id=materia.id, orden=orden, texto=texto, longitud=len(tokens)), Counter(tokens)))
+    session.add_all([f for f, _ in fragmentos])
+    session.flush()  # Para tener los id de los fragmentos
+
+    filas = [{"materia_id": materia.id, "termino": termino, "fragmento_id": frag.id, "frecuencia": n}
+             for frag, conteo in fragmentos for termino, n in conteo.items()]
+    if filas:
+        session.execute(insert(TerminoIndice), filas)
+    return len(fragmentos)
+
+
+# --- PASO 2: BUSCAR LOS FRAGMENTOS MÁS RELEVANTES (BM25) ---
+def buscar_fragmentos(session, materia_id, consulta, k=4):
+    terminos = set(tokenizar(consulta))
+    total, promedio = session.query(func.count(FragmentoPrograma.id), func.avg(FragmentoPrograma.longitud)).filter_by(materia_id=materia_id).one()
+    if not terminos or not total:
+        return []
+
+    postings = session.query(TerminoIndice.termino, TerminoIndice.fragmento_id, TerminoIndice.frecuencia, FragmentoPrograma.longitud) \
+        .join(FragmentoPrograma, FragmentoPrograma.id == TerminoIndice.fragmento_id) \
+        .filter(TerminoIndice.materia_id == materia_id, TerminoIndice.termino.in_(terminos)).all()
+
+    df = Counter(p.termino for p in postings)
+    puntajes = Counter()
+    for p in postings:
+        idf = math.log(1 + (total - df[p.termino] + 0.5) / (df[p.termino] + 0.5))
+        tf = p.frecuencia * (BM25_K1 + 1) / (p.frecuencia + BM25_K1 * (1 - BM25_B + BM25_B * p.longitud / float(promedio)))
+        puntajes[p.fragmento_id] += idf * tf
+
+    mejores = [fid for fid, _ in puntajes.most_common(k)]
+    if not mejores:
+        return []
+    # Se devuelven en el orden del programa para que el texto se lea con sentido
+    return [f.texto for f in session.query(FragmentoPrograma).filter(FragmentoPrograma.id.in_(mejores)).order_by(FragmentoPrograma.orden)]
+
+
+def contexto_relevante(session, materia, consulta, k=4, sin_resultados="Sin bibliografía relevante."):
+    # Arma el bloque de contexto para el prompt. Si la materia tiene programa pero
+    # todavía no fue indexada (datos viejos), se indexa en el momento.
+    # (Se mira primero el índice para no traer el programa completo si no hace falta)
+    if not session.query(FragmentoPrograma.id).filter_by(materia_id=materia.id).first() and materia.programa:
+        indexar_materia(session, materia); session.commit()
+    fragmentos = buscar_fragmentos(session, materia.id, consulta, k)
+    return "\n[...]\n".join(fragmentos) if fragmentos else sin_resultados
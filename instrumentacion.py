@@ -0,0 +1,258 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import event
+
+# --- INSTRUMENTACIÓN ---
+# Contadores y tiempos del proceso (dashboard o worker), todo en memoria:
+#   - SQL: cantidad y tiempo por rerun de Streamlit (eventos de SQLAlchemy)
+#   - IA: latencia, tokens y errores de cada llamada al modelo
+#   - Secciones de pantalla y filas de la Corrección Masiva
+# Se ve en la pestaña "📈 Rendimiento" y se exporta en formato texto de Prometheus
+# (texto_prometheus(), escribir_archivo() o iniciar_servidor_metricas()).
+
+MUESTRAS = 500              # Últimas observaciones que se guardan por serie (para percentiles)
+MAX_SENTENCIAS = 300        # Sentencias SQL distintas que se siguen
+CUANTILES = (0.5, 0.9, 0.99)
+
+_lock = threading.Lock()
+_contadores = {}            # (nombre, etiquetas) -> valor
+_tiempos = {}               # (nombre, etiquetas) -> {"cantidad", "suma", "max", "muestras"}
+_sentencias = {}            # texto -> [cantidad, segundos, max]
+_rerun = threading.local()  # Streamlit corre cada rerun en el hilo del script
+_arranque = set()           # Etapas del arranque ya medidas (una vez por proceso)
+_ayuda = {
+    "sql_consultas_total": ("counter", "Sentencias SQL ejecutadas"),
+    "sql_segundos": ("summary", "Duración de cada sentencia SQL"),
+    "rerun_segundos": ("summary", "Duración de un rerun completo de Streamlit"),
+    "rerun_consultas_sql": ("summary", "Sentencias SQL por rerun"),
+    "rerun_sql_segundos": ("summary", "Tiempo en SQL por rerun"),
+    "seccion_segundos": ("summary", "Tiempo de dibujado de cada sección"),
+    "arranque_segundos": ("summary", "Arranque del proceso por etapa: importaciones, conexión (y migraciones) y primer rerun"),
+    "llm_solicitudes_total": ("counter", "Llamadas al modelo por resultado"),
+    "llm_segundos": ("summary", "Latencia total de las llamadas al modelo"),
+    "llm_primer_token_segundos": ("summary", "Tiempo hasta el primer pedazo en modo stream"),
+    "llm_tokens_total": ("counter", "Tokens de prompt y de respuesta"),
+    "llm_reintentos_total": ("counter", "Reintentos de llamadas al modelo por motivo (ver cliente_ia.py)"),
+    "llm_rechazadas_total": ("counter", "Llamadas que no salieron: límite de tasa o disyuntor abierto"),
+    "llm_disyuntor_aperturas_total": ("counter", "Veces que se abrió el disyuntor de la IA"),
+    "correccion_fila_segundos": ("summary", "Tiempo de la IA por fila de la Corrección Masiva"),
+    "correccion_prompt_segundos": ("summary", "Armado del prompt (búsqueda RAG) por fila de la Corrección Masiva"),
+    "correccion_grupo_segundos": ("summary", "Tiempo de la IA por llamada agrupada (varios alumnos)"),
+    "correccion_llamadas_total": ("counter", "Llamadas a la IA de la Corrección Masiva por modo"),
+    "correccion_json_total": ("counter", "Respuestas agrupadas según si trajeron todas las devoluciones"),
+    "correccion_respuestas_total": ("counter", "Respuestas de la Corrección Masiva: total y las que quedan para la IA después de agrupar"),
+    "correccion_filas_total": ("counter", "Filas de la Corrección Masiva por resultado"),
+}
+
+
+def _clave(nombre, etiquetas):
+    return nombre, tuple(sorted((etiquetas or {}).items()))
+
+
+def contar(nombre, etiquetas=None, n=1):
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        _contadores[clave] = _contadores.get(clave, 0) + n
+
+
+def observar(nombre, valor, etiquetas=None):
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        serie = _tiempos.get(clave)
+        if serie is None:
+            serie = _tiempos[clave] = {"cantidad": 0, "suma": 0.0, "max": 0.0, "muestras": deque(maxlen=MUESTRAS)}
+        serie["cantidad"] += 1; serie["suma"] += valor; serie["max"] = max(serie["max"], valor)
+        serie["muestras"].append(valor)
+
+
+@contextmanager
+def cronometro(nombre, etiquetas=None):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(nombre, time.perf_counter() - t0, etiquetas)
+
+
+def seccion(nombre):
+    # with tab1, seccion("materias"): ...
+    return cronometro("seccion_segundos", {"seccion": nombre})
+
+
+def reiniciar():
+    with _lock:
+        _contadores.clear(); _tiempos.clear(); _sentencias.clear()
+
+
+def registrar_arranque(etapa, segundos):
+    # Solo la primera vez por proceso: en los reruns siguientes los módulos ya están importados
+    with _lock:
+        if etapa in _arranque:
+            return
+        _arranque.add(etapa)
+    observar("arranque_segundos", segundos, {"etapa": etapa})
+
+
+# --- SQL ---
+def _antes(conn, cursor, sentencia, parametros, contexto, executemany):
+    conn.info.setdefault("_inicio_sql", []).append(time.perf_counter())
+
+
+def _despues(conn, cursor, sentencia, parametros, contexto, executemany):
+    pila = conn.info.get("_inicio_sql")
+    if not pila:
+        return
+    duracion = time.perf_counter() - pila.pop()
+    contar("sql_consultas_total"); observar("sql_segundos", duracion)
+    if getattr(_rerun, "activo", False):
+        _rerun.consultas += 1; _rerun.segundos_sql += duracion
+    texto = " ".join(sentencia.split())[:200]
+    with _lock:
+        datos = _sentencias.get(texto)
+        if datos is None and len(_sentencias) < MAX_SENTENCIAS:
+            datos = _sentencias[texto] = [0, 0.0, 0.0]
+        if datos is not None:
+            datos[0] += 1; datos[1] += duracion; datos[2] = max(datos[2], duracion)
+
+
+def instrumentar_engine(engine):
+    if not event.contains(engine, "before_cursor_execute", _antes):
+        event.listen(engine, "before_cursor_execute", _antes)
+        event.listen(engine, "after_cursor_execute", _despues)
+    return engine
+
+
+# --- RERUNS DE STREAMLIT ---
+def iniciar_rerun():
+    _rerun.activo = True; _rerun.inicio = time.perf_counter(); _rerun.consultas = 0; _rerun.segundos_sql = 0.0
+
+
+def terminar_rerun(pantalla):
+    if not getattr(_rerun, "activo", False):
+        return
+    _rerun.activo = False
+    etiquetas = {"pantalla": pantalla}
+    duracion = time.perf_counter() - _rerun.inicio
+    observar("rerun_segundos", duracion, etiquetas)
+    registrar_arranque("primer_rerun", duracion)
+    observar("rerun_consultas_sql", _rerun.consultas, etiquetas)
+    observar("rerun_sql_segundos", _rerun.segundos_sql, etiquetas)
+
+
+# --- IA ---
+def registrar_llm(modelo, segundos, modo="completo", tokens_prompt=None, tokens_respuesta=None, error=None, primer_token=None):
+    etiquetas = {"modelo": modelo, "modo": modo}
+    contar("llm_solicitudes_total", dict(etiquetas, resultado="error" if error else "ok"))
+    observar("llm_segundos", segundos, etiquetas)
+    if primer_token is not None:
+        observar("llm_primer_token_segundos", primer_token, {"modelo": modelo})
+    if tokens_prompt:
+        contar("llm_tokens_total", {"modelo": modelo, "tipo": "prompt"}, tokens_prompt)
+    if tokens_respuesta:
+        contar("llm_tokens_total", {"modelo": modelo, "tipo": "respuesta"}, tokens_respuesta)
+
+
+# --- LECTURA (pestaña Rendimiento) ---
+def _percentil(muestras, q):
+    if not muestras:
+        return 0.0
+    orden = sorted(muestras)
+    return orden[min(len(orden) - 1, int(q * (len(orden) - 1) + 0.5))]
+
+
+def resumen_tiempos(nombre):
+    # [{etiquetas..., cantidad, media, p50, p95, max}] de una serie
+    with _lock:
+        series = [(dict(k[1]), dict(v, muestras=list(v["muestras"]))) for k, v in _tiempos.items() if k[0] == nombre]
+    filas = []
+    for etiquetas, s in series:
+        filas.append(dict(etiquetas, cantidad=s["cantidad"], media=s["suma"] / s["cantidad"], p50=_percentil(s["muestras"], 0.5),
+                          p95=_percentil(s["muestras"], 0.95), max=s["max"]))
+    return filas
+
+
+def resumen_contadores(nombre):
+    with _lock:
+        return [dict(dict(k[1]), valor=v) for k, v in _contadores.items() if k[0] == nombre]
+
+
+def sentencias_lentas(n=10):
+    with _lock:
+        filas = [{"sentencia": t, "veces": d[0], "total_s": d[1], "media_ms": d[1] / d[0] * 1000, "max_ms": d[2] * 1000} for t, d in _sentencias.items()]
+    return sorted(filas, key=lambda f: f["total_s"], reverse=True)[:n]
+
+
+# --- EXPORTACIÓN (formato texto de Prometheus) ---
+def _etiquetas_texto(etiquetas):
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in etiquetas) + "}"
+
+
+def texto_prometheus(extras=None):
+    # extras: {nombre: valor} que se agregan como gauges (ej: estadísticas de la caché de IA)
+    lineas, vistos = [], set()
+    with _lock:
+        contadores = sorted(_contadores.items())
+        tiempos = sorted((k, dict(v, muestras=list(v["muestras"]))) for k, v in _tiempos.items())
+
+    def cabecera(nombre, tipo_por_defecto):
+        if nombre not in vistos:
+            vistos.add(nombre)
+            tipo, ayuda = _ayuda.get(nombre, (tipo_por_defecto, nombre))
+            lineas.append(f"# HELP asistente_{nombre} {ayuda}"); lineas.append(f"# TYPE asistente_{nombre} {tipo}")
+
+    for (nombre, etiquetas), valor in contadores:
+        cabecera(nombre, "counter")
+        lineas.append(f"asistente_{nombre}{_etiquetas_texto(etiquetas)} {valor}")
+    for (nombre, etiquetas), s in tiempos:
+        cabecera(nombre, "summary")
+        for q in CUANTILES:
+            lineas.append(f"asistente_{nombre}{_etiquetas_texto(etiquetas + (('quantile', q),))} {_percentil(s['muestras'], q):.6f}")
+        lineas.append(f"asistente_{nombre}_sum{_etiquetas_texto(etiquetas)} {s['suma']:.6f}")
+        lineas.append(f"asistente_{nombre}_count{_etiquetas_texto(etiquetas)} {s['cantidad']}")
+    for nombre, valor in sorted((extras or {}).items()):
+        cabecera(nombre, "gauge")
+        lineas.append(f"asistente_{nombre} {valor}")
+    return "\n".join(lineas) + "\n"
+
+
+def escribir_archivo(ruta, extras=None):
+    # Escritura atómica (para el textfile collector de node_exporter)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(texto_prometheus(extras))
+    os.replace(temporal, ruta)
+
+
+_servidor = {"instancia": None}
+
+
+def iniciar_servidor_metricas(puerto, host="0.0.0.0", extras=None):
+    # GET /metrics en un hilo aparte. extras: función sin argumentos que devuelve los gauges extra.
+    if _servidor["instancia"] is not None:
+        return _servidor["instancia"]
+
+    class Manejador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_response(404); self.end_headers(); return
+            datos = texto_prometheus(extras() if extras else None).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers(); self.wfile.write(datos)
+
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    _servidor["instancia"] = servidor
+    return servidor
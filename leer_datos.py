@@ -1,12 +1,11 @@
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, selectinload
 # Importamos las clases para saber qué estamos buscando
 from crear_base_datos import Alumno, Materia, Evaluacion
+from config_db import crear_engine
+from busqueda_alumnos import buscar_alumnos
 
-# --- CONFIGURACIÓN (La misma ruta absoluta) ---
-ruta_db = r'C:\Users\Silicon40\Documents\ProyectosPython\seguimiento_alumnos\sistema_escolar.db'
-engine = create_engine(f'sqlite:///{ruta_db}')
+# --- CONFIGURACIÓN (la misma base que el resto, ver config_db.py) ---
+engine = crear_engine()
 
 Session = sessionmaker(bind=engine)
 session = Session()
@@ -15,20 +14,25 @@ def mostrar_dashboard_alumno(nombre_busqueda):
     print(f"\n🔎 Buscando información para: '{nombre_busqueda}'...")
     print("-" * 50)
     
-    # 1. Buscamos al alumno en la tabla 'alumnos'
-    #    filter(Alumno.nombre_completo.like(...)) permite buscar aunque no escribas el nombre exacto
-    alumno = session.query(Alumno).filter(Alumno.nombre_completo.like(f"%{nombre_busqueda}%")).first()
-    
-    if not alumno:
+    # 1. Buscamos al alumno en el índice de nombres (sin tildes ni mayúsculas, el más parecido primero)
+    #    y después lo traemos por id: el nombre puede repetirse, el id no.
+    #    selectinload trae de una vez las evaluaciones con su materia (sin una consulta extra por nota)
+    encontrados, hay_mas = buscar_alumnos(session, nombre_busqueda, limite=5)
+    if not encontrados:
         print("❌ Alumno no encontrado.")
         return
+    if len(encontrados) > 1:
+        print("   Coinciden también: " + ", ".join(f[1] for f in encontrados[1:]) + (" ..." if hay_mas else ""))
+    alumno = session.query(Alumno).options(
+        selectinload(Alumno.evaluaciones).joinedload(Evaluacion.materia).load_only(Materia.id, Materia.nombre)
+    ).filter(Alumno.id == encontrados[0][0]).first()
 
     # 2. Si existe, mostramos sus datos básicos
     print(f"🎓 ALUMNO: {alumno.nombre_completo} (Año: {alumno.año_escolar})")
     
     # 3. Accedemos a sus evaluaciones
-    #    Gracias a la relación que definimos (back_populates), no hace falta hacer otra consulta SQL.
-    #    Python ya trajo las evaluaciones vinculadas.
+    #    Gracias a la relación que definimos (back_populates) y al selectinload de arriba,
+    #    no hace falta hacer otra consulta SQL. Python ya trajo las evaluaciones vinculadas.
     evaluaciones = alumno.evaluaciones
     
     if not evaluaciones:
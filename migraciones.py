@@ -0,0 +1,128 @@
+import argparse
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import select, func, insert, inspect, text
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import Session
+
+from crear_base_datos import Base, VersionEsquema
+from busqueda_alumnos import asegurar_indice_busqueda
+from busqueda_comentarios import asegurar_indice_comentarios
+from agregados import asegurar_agregados
+
+# --- MIGRACIONES DEL ESQUEMA (una vez por base, no en cada arranque) ---
+# Cada paso tiene un número y, cuando termina, queda anotado en la tabla schema_version.
+# migrar() aplica en orden los que faltan; si ya está todo, es UNA consulta. El deploy corre
+# "python migraciones.py" antes de levantar la app; el dashboard y el worker solo miran la
+# versión al arrancar (y migran ellos si alguien se lo salteó).
+# Cambiar un modelo = agregar un paso al final de MIGRACIONES (nunca renumerar ni cambiar
+# uno ya aplicado). Para columnas e índices nuevos alcanza con repetir _esquema_base: los
+# pasos se pueden correr dos veces sin romper nada (si dos procesos migran a la vez en SQLite).
+
+CLAVE_BLOQUEO = 74_201_501   # pg_advisory_lock: en Postgres migra un solo proceso a la vez
+
+
+# --- PASOS ---
+def _agregar_columnas(engine):
+    # create_all no toca tablas que ya existen: las columnas nuevas se agregan acá (ej: alumnos.nombre_busqueda)
+    with engine.begin() as conn:
+        existentes = inspect(conn)
+        for tabla in Base.metadata.sorted_tables:
+            columnas = {c["name"] for c in existentes.get_columns(tabla.name)}
+            for col in tabla.columns:
+                if col.name not in columnas:
+                    # Con server_default las filas viejas quedan con ese valor (ej: evaluaciones.version = 1)
+                    defecto = f" DEFAULT {col.server_default.arg}" if col.server_default is not None else ""
+                    conn.execute(text(f'ALTER TABLE {tabla.name} ADD COLUMN "{col.name}" {col.type.compile(engine.dialect)}{defecto}'))
+
+
+def _esquema_base(engine):
+    # Tablas que faltan, columnas nuevas de tablas existentes y los índices de los modelos
+    Base.metadata.create_all(engine)
+    _agregar_columnas(engine)
+    for tabla in Base.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(engine, checkfirst=True)
+
+
+def _agregados(engine):
+    with Session(engine) as session:
+        asegurar_agregados(session)
+
+
+MIGRACIONES = [
+    (1, "Tablas, columnas e índices de los modelos", _esquema_base),
+    (2, "Índice de búsqueda de alumnos (FTS5 / trigramas)", asegurar_indice_busqueda),
+    (3, "Índice de texto de los comentarios (FTS5 / tsvector)", asegurar_indice_comentarios),
+    (4, "Agregados de notas de las bases que ya tenían notas", _agregados),
+    (5, "recomendaciones.version_intento", _esquema_base),
+]
+ULTIMA = MIGRACIONES[-1][0]
+
+
+# --- ESTADO ---
+def version_actual(engine):
+    try:
+        with engine.connect() as conn:
+            return conn.scalar(select(func.max(VersionEsquema.version))) or 0
+    except DBAPIError:
+        return 0   # Base nueva o de antes de que existiera schema_version
+
+
+def esquema_al_dia(engine):
+    return version_actual(engine) >= ULTIMA
+
+
+@contextmanager
+def _bloqueo(engine):
+    if engine.dialect.name != "postgresql":
+        yield; return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:clave)"), {"clave": CLAVE_BLOQUEO}); conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": CLAVE_BLOQUEO}); conn.commit()
+
+
+# --- APLICAR ---
+def migrar(engine, al_avanzar=None):
+    # Devuelve los números de los pasos aplicados ([] si ya estaba al día).
+    # al_avanzar(version, descripcion, segundos) después de cada paso.
+    VersionEsquema.__table__.create(engine, checkfirst=True)
+    aplicados = []
+    with _bloqueo(engine):
+        hecha = version_actual(engine)   # Se lee con el bloqueo tomado: otro proceso pudo migrar mientras esperábamos
+        for version, descripcion, paso in MIGRACIONES:
+            if version <= hecha:
+                continue
+            t0 = time.perf_counter()
+            paso(engine)
+            segundos = round(time.perf_counter() - t0, 3)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(VersionEsquema).values(version=version, descripcion=descripcion, aplicada=datetime.now(), segundos=segundos))
+            except IntegrityError:
+                pass   # Otro proceso (SQLite, sin bloqueo) lo anotó primero
+            aplicados.append(version)
+            if al_avanzar: al_avanzar(version, descripcion, segundos)
+    return aplicados
+
+
+if __name__ == "__main__":
+    from config_db import crear_engine
+
+    parser = argparse.ArgumentParser(description="Aplica las migraciones pendientes del esquema (correr en cada deploy)")
+    parser.add_argument("--estado", action="store_true", help="Solo mostrar qué está aplicado y qué falta")
+    args = parser.parse_args()
+
+    engine = crear_engine()
+    if args.estado:
+        hecha = version_actual(engine)
+        for version, descripcion, _ in MIGRACIONES:
+            print(f"{'✅' if version <= hecha else '⏳'} {version:>3}  {descripcion}")
+    else:
+        aplicados = migrar(engine, al_avanzar=lambda v, d, s: print(f"   -> {v}: {d} ({s} s)"))
+        print(f"✅ Esquema en la versión {ULTIMA}" + ("" if aplicados else " (ya estaba al día)"))
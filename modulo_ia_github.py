@@ -1,33 +1,26 @@
-import os
-import streamlit as st  # <--- NUEVO: Necesario para leer los secretos de la nube
-from openai import OpenAI # <--- MANTENER: Necesario para hablar con la IA
+import time
+import cache_llm
+import instrumentacion
+import cliente_ia
+from cliente_ia import ErrorIA  # Lo que lanzan las funciones de abajo cuando la IA no responde
 
 # --- CONFIGURACIÓN DE SEGURIDAD ---
-# Intentamos leer el token desde Streamlit Cloud
-try:
-    GITHUB_TOKEN = st.secrets["GITHUB_TOKEN"]
-except:
-    # Si falla (por ejemplo, si lo pruebas en tu PC sin configurar secrets.toml),
-    # usa este token de respaldo (Pega tu ghp_... aquí solo si vas a probar localmente)
-    GITHUB_TOKEN = ""
-
-# Configuración del cliente (esto no cambia)
-client = OpenAI(
-    base_url="https://models.inference.ai.azure.com",
-    api_key=GITHUB_TOKEN,
-)
+# El token (GITHUB_TOKEN) y el servidor (IA_BASE_URL, por defecto GitHub Models) se leen de
+# st.secrets o de variables de entorno en cliente_ia.py, que también maneja el cliente compartido,
+# los reintentos y el límite de solicitudes por minuto.
+# (ej: IA_BASE_URL=http://127.0.0.1:8765/v1 con python servidor_mock_ia.py para pruebas de carga)
 
 # --- FUNCIONES DE IA (Mantenemos la lógica que ya funcionaba) ---
 
-def generar_recomendacion_ia(materia, nota, comentario_profesor):
+def generar_recomendacion_ia(materia, nota, comentario_profesor, usar_cache=True):
     prompt = f"""
     Actúa como pedagogo. Da una recomendación breve (máx 20 palabras) para:
     Materia: {materia}, Nota: {nota}, Feedback: "{comentario_profesor}"
     """
-    return consultar_llama(prompt)
+    return consultar_llama(prompt, usar_cache)
 
-def responder_chat_educativo(nombre_alumno, historial_texto, pregunta_usuario):
-    prompt = f"""
+def _prompt_chat(nombre_alumno, historial_texto, pregunta_usuario):
+    return f"""
     Eres un asistente escolar inteligente. Estás analizando al alumno: {nombre_alumno}.
     
     Tienes el siguiente historial de calificaciones:
@@ -37,19 +30,79 @@ def responder_chat_educativo(nombre_alumno, historial_texto, pregunta_usuario):
     
     Responde basándote SOLO en los datos provistos. Sé breve, profesional y directo.
     """
-    return consultar_llama(prompt)
 
-def consultar_llama(prompt):
+def responder_chat_educativo(nombre_alumno, historial_texto, pregunta_usuario, usar_cache=True):
+    return consultar_llama(_prompt_chat(nombre_alumno, historial_texto, pregunta_usuario), usar_cache)
+
+def responder_chat_educativo_stream(nombre_alumno, historial_texto, pregunta_usuario, usar_cache=True):
+    # Igual que responder_chat_educativo pero va entregando el texto a medida que llega
+    return consultar_llama_stream(_prompt_chat(nombre_alumno, historial_texto, pregunta_usuario), usar_cache)
+
+MODELO = "meta-llama-3.1-8b-instruct"
+TEMPERATURA = 0.7
+MAX_TOKENS = 200
+
+def _mensajes(prompt):
+    return [
+        {"role": "system", "content": "Eres un asistente útil y preciso."},
+        {"role": "user", "content": prompt}
+    ]
+
+def consultar_llama(prompt, usar_cache=True, max_tokens=MAX_TOKENS):
+    # max_tokens: la corrección agrupada pide más lugar (una devolución por alumno)
+    mensajes = _mensajes(prompt)
+    # Si ya hicimos exactamente esta consulta, devolvemos la respuesta guardada (usar_cache=False la ignora)
+    clave = cache_llm.clave_cache(MODELO, TEMPERATURA, mensajes, max_tokens=max_tokens)
+    if usar_cache:
+        guardada = cache_llm.leer(clave)
+        if guardada is not None:
+            return guardada
+    inicio = time.perf_counter()
+    try:
+        # Si no hay respuesta después de los reintentos se lanza ErrorIA: nunca se devuelve (ni se guarda) un texto de error
+        response = cliente_ia.completar(
+            messages=mensajes,
+            model=MODELO,
+            temperature=TEMPERATURA,
+            max_tokens=max_tokens
+        )
+    except ErrorIA as e:
+        instrumentacion.registrar_llm(MODELO, time.perf_counter() - inicio, error=e)
+        raise
+    texto = response.choices[0].message.content
+    uso = getattr(response, "usage", None)
+    instrumentacion.registrar_llm(MODELO, time.perf_counter() - inicio, tokens_prompt=getattr(uso, "prompt_tokens", None),
+                                  tokens_respuesta=getattr(uso, "completion_tokens", None))
+    cache_llm.guardar(clave, MODELO, TEMPERATURA, texto)
+    return texto
+
+def consultar_llama_stream(prompt, usar_cache=True):
+    # Generador: devuelve los pedazos de texto (tokens) apenas los manda el modelo.
+    # Al terminar guarda la respuesta completa en la caché, así la próxima vez sale entera de una.
+    mensajes = _mensajes(prompt)
+    clave = cache_llm.clave_cache(MODELO, TEMPERATURA, mensajes, max_tokens=MAX_TOKENS)
+    if usar_cache:
+        guardada = cache_llm.leer(clave)
+        if guardada is not None:
+            yield guardada
+            return
+    inicio = time.perf_counter(); primer_token = None
     try:
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "Eres un asistente útil y preciso."},
-                {"role": "user", "content": prompt}
-            ],
-            model="meta-llama-3.1-8b-instruct",
-            temperature=0.7,
-            max_tokens=200
+        stream = cliente_ia.completar_stream(
+            messages=mensajes,
+            model=MODELO,
+            temperature=TEMPERATURA,
+            max_tokens=MAX_TOKENS
         )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"❌ Error de conexión: {str(e)}"
\ No newline at end of file
+        partes = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if primer_token is None: primer_token = time.perf_counter() - inicio
+                partes.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        # En stream la API no siempre manda "usage": cada pedazo es más o menos un token
+        instrumentacion.registrar_llm(MODELO, time.perf_counter() - inicio, modo="stream", tokens_respuesta=len(partes), primer_token=primer_token)
+        cache_llm.guardar(clave, MODELO, TEMPERATURA, "".join(partes))
+    except ErrorIA as e:
+        instrumentacion.registrar_llm(MODELO, time.perf_counter() - inicio, modo="stream", error=e, primer_token=primer_token)
+        raise
@@ -0,0 +1,53 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# --- VALORES POR DEFECTO ---
+# GitHub Models (nivel gratuito) permite ~15 solicitudes por minuto y 5 en paralelo
+# para los modelos "low" como llama-3.1-8b. Se pueden cambiar desde st.secrets.
+MAX_CONCURRENCIA = 5
+SOLICITUDES_POR_MINUTO = 15
+TAMANO_LOTE_GUARDADO = 20
+
+
+class LimitadorTasa:
+    # Reparte los "turnos" de forma pareja: como máximo `rpm` llamadas por minuto,
+    # compartido entre todos los hilos de UNA pasada del motor. rpm=None o 0 desactiva el límite.
+    # El límite que cuida la cuota de la API es la cubeta de cliente_ia (IA_RPM, para todo el proceso);
+    # este es solo un tope extra y opcional por pasada (ej: que un trabajo deje lugar al chat).
+    def __init__(self, rpm):
+        self.intervalo = 60.0 / rpm if rpm else 0.0
+        self._proximo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(self._proximo, ahora)
+            self._proximo = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+def ejecutar_concurrente(tareas, funcion, max_concurrencia=MAX_CONCURRENCIA, rpm=0):
+    # Ejecuta funcion(tarea) para cada tarea en un pool de hilos. rpm: tope extra (ver LimitadorTasa);
+    # por defecto ninguno, las llamadas ya esperan su turno en cliente_ia.
+    # Devuelve (tarea, resultado, error) a medida que van terminando, así quien llama
+    # (el hilo de Streamlit) puede actualizar la barra y guardar en la BD sin tocar los hilos.
+    limitador = LimitadorTasa(rpm)
+
+    def _trabajo(tarea):
+        limitador.esperar()
+        return funcion(tarea)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_concurrencia))) as pool:
+        futuros = {pool.submit(_trabajo, t): t for t in tareas}
+        for fut in as_completed(futuros):
+            tarea = futuros[fut]
+            try:
+                yield tarea, fut.result(), None
+            except Exception as e:
+                yield tarea, None, e
+
@@ -0,0 +1,79 @@
+import math
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import select, insert, update, func, bindparam
+
+from crear_base_datos import Alumno, Evaluacion
+from agregados import recalcular
+
+# --- CARGA DE NOTAS EN PLANILLA ---
+# Una materia + instancia para todo un curso (año): se arma la planilla con la lista de
+# alumnos y la nota que ya tengan en esa instancia, el profesor la completa en pantalla
+# y al guardar se compara contra lo que había y se escribe todo en UNA transacción:
+# un INSERT masivo para las notas nuevas, un UPDATE masivo para las cambiadas y los
+# agregados recalculados una sola vez para los alumnos tocados.
+
+COLUMNAS = ["alumno_id", "evaluacion_id", "Alumno", "Nota", "Comentario"]
+
+
+def planilla(session, materia_id, instancia, año):
+    # Si un alumno tiene varias notas con la misma instancia se toma la última cargada
+    ultimas = select(func.max(Evaluacion.id).label("id")).where(Evaluacion.materia_id == materia_id, Evaluacion.instancia == instancia) \
+        .group_by(Evaluacion.alumno_id).subquery()
+    filas = session.execute(
+        select(Alumno.id, Evaluacion.id, Alumno.nombre_completo, Evaluacion.nota, Evaluacion.comentario)
+        .outerjoin(Evaluacion, (Evaluacion.alumno_id == Alumno.id) & Evaluacion.id.in_(select(ultimas.c.id)))
+        .where(Alumno.año_escolar == año).order_by(Alumno.nombre_busqueda, Alumno.id)
+    ).all()
+    df = pd.DataFrame(filas, columns=COLUMNAS)
+    df["Nota"] = df["Nota"].astype(float)
+    df["Comentario"] = df["Comentario"].fillna("")
+    return df
+
+
+def _nota(valor):
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return None
+    return float(valor)
+
+
+def _comentario(valor):
+    return "" if valor is None or (isinstance(valor, float) and math.isnan(valor)) else str(valor).strip()
+
+
+def cambios(original, editada):
+    # Compara fila por fila (mismo orden, la planilla no deja agregar ni borrar filas).
+    # Devuelve (nuevas, modificadas): alumno_id/nota/comentario y evaluacion_id/nota/comentario.
+    # Borrar la nota de una fila que ya tenía no borra la evaluación: se ignora.
+    nuevas, modificadas = [], []
+    for antes, despues in zip(original.itertuples(index=False), editada.itertuples(index=False)):
+        nota, comentario = _nota(despues.Nota), _comentario(despues.Comentario)
+        if pd.isna(antes.evaluacion_id):
+            if nota is not None:
+                nuevas.append({"alumno_id": int(antes.alumno_id), "nota": nota, "comentario": comentario})
+        elif nota is not None and (nota != _nota(antes.Nota) or comentario != _comentario(antes.Comentario)):
+            modificadas.append({"id": int(antes.evaluacion_id), "alumno_id": int(antes.alumno_id), "nota": nota, "comentario": comentario})
+    return nuevas, modificadas
+
+
+def guardar_planilla(session, materia_id, instancia, original, editada, fecha=None):
+    nuevas, modificadas = cambios(original, editada)
+    if not nuevas and not modificadas:
+        return {"nuevas": 0, "modificadas": 0}
+    fecha = fecha or date.today()
+    try:
+        if nuevas:
+            session.execute(insert(Evaluacion), [dict(f, materia_id=materia_id, instancia=instancia, fecha=fecha) for f in nuevas])
+        if modificadas:
+            # UPDATE masivo por clave primaria (un executemany); no pasa por los eventos de agregados ni de
+            # recomendaciones, así que la versión se sube acá (la recomendación de esa nota se rehace)
+            E = Evaluacion.__table__
+            stmt = update(E).where(E.c.id == bindparam("_id")).values(nota=bindparam("_nota"), comentario=bindparam("_comentario"), version=E.c.version + 1)
+            session.execute(stmt, [{"_id": f["id"], "_nota": f["nota"], "_comentario": f["comentario"]} for f in modificadas])
+        recalcular(session.connection(), [(f["alumno_id"], materia_id) for f in nuevas + modificadas])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return {"nuevas": len(nuevas), "modificadas": len(modificadas)}
@@ -0,0 +1,188 @@
+import argparse
+from datetime import date
+from functools import partial
+
+from sqlalchemy import event, inspect, select, update, insert, and_, or_, case, func
+from sqlalchemy.orm import sessionmaker
+
+from crear_base_datos import Materia, Evaluacion, Recomendacion
+from modulo_ia_github import generar_recomendacion_ia
+from cliente_ia import sin_gastar_intento
+from motor_correccion import ejecutar_concurrente, MAX_CONCURRENCIA, TAMANO_LOTE_GUARDADO
+
+# --- RECOMENDACIONES POR EVALUACIÓN (en lote, una vez cada una) ---
+# Cada evaluación con nota tiene a lo sumo una fila en recomendaciones (evaluacion_id único).
+# La "marca de agua" es evaluaciones.version: sube cada vez que cambia la nota o el comentario,
+# y la recomendación guarda la versión con la que se generó. Quedan pendientes:
+#   - las evaluaciones sin recomendación
+#   - las que cambiaron después de generarla (recomendaciones.version < evaluaciones.version)
+#   - las que dieron error, hasta MAX_INTENTOS veces por versión (un 429 o el disyuntor abierto no
+#     cuentan: se deja todo como estaba y la pasada termina, ver cliente_ia.py)
+# Un error no toca version ni contenido: el texto viejo queda marcado como desactualizado
+# (al_día = False) y no sale en el PDF. version_intento lleva la versión del último intento.
+# generar_pendientes() las toma de a tandas, llama a la IA en paralelo (ejecutar_concurrente)
+# y guarda con un upsert. El dashboard y el PDF leen la tabla: mirar una ficha no llama a la IA.
+# Se corre desde el worker (python worker_correccion.py --recomendaciones), desde el dashboard
+# o a mano: python recomendaciones.py
+
+ESTADO_LISTA = "Pendiente"    # Generada; falta que el alumno la trabaje (después pasa a "Completada")
+ESTADO_ERROR = "Error"        # La IA falló: se reintenta en la próxima pasada
+MAX_INTENTOS = 3
+TAMANO_TANDA = 200            # Evaluaciones que se leen de la base por vuelta
+
+
+# Cambiar nota o comentario desde el ORM sube la versión (los UPDATE masivos la suben a mano, ver notas_masivas.py)
+@event.listens_for(Evaluacion, "before_update")
+def _al_cambiar(mapper, connection, ev):
+    estado = inspect(ev).attrs
+    if estado.nota.history.has_changes() or estado.comentario.history.has_changes():
+        ev.version = Evaluacion.version + 1
+
+
+# --- PASO 1: QUÉ FALTA GENERAR ---
+def _pendientes(columnas, alumno_id=None):
+    E, R = Evaluacion.__table__, Recomendacion.__table__
+    es_error = R.c.estado == ESTADO_ERROR
+    q = select(*columnas).select_from(E).outerjoin(R, R.c.evaluacion_id == E.c.id).where(
+        E.c.nota.isnot(None), E.c.materia_id.isnot(None),
+        or_(R.c.id.is_(None),
+            and_(~es_error, R.c.version < E.c.version),
+            # Con error: hasta MAX_INTENTOS, y de nuevo desde cero si la evaluación cambió después del último intento
+            and_(es_error, or_(R.c.intentos < MAX_INTENTOS, func.coalesce(R.c.version_intento, R.c.version) < E.c.version))))
+    return q.where(E.c.alumno_id == alumno_id) if alumno_id is not None else q
+
+
+def pendientes(session, limite=TAMANO_TANDA, alumno_id=None, antes_de=None):
+    # [{"evaluacion_id", "version", "alumno_id", "materia_id", "materia", "nota", "comentario"}, ...], las más nuevas primero.
+    # antes_de: seguir desde ahí (por id), así una pasada no vuelve a tomar lo que acaba de fallar
+    E = Evaluacion.__table__
+    q = _pendientes([E.c.id, E.c.version, E.c.alumno_id, E.c.materia_id, Materia.nombre, E.c.nota, E.c.comentario], alumno_id) \
+        .join(Materia, Materia.id == E.c.materia_id)
+    if antes_de is not None:
+        q = q.where(E.c.id < antes_de)
+    claves = ["evaluacion_id", "version", "alumno_id", "materia_id", "materia", "nota", "comentario"]
+    return [dict(zip(claves, f)) for f in session.execute(q.order_by(E.c.id.desc()).limit(limite))]
+
+
+def contar_pendientes(session, alumno_id=None):
+    return session.scalar(select(func.count()).select_from(_pendientes([Evaluacion.__table__.c.id], alumno_id).subquery()))
+
+
+# --- PASO 2: GENERAR Y GUARDAR ---
+def _generar(tarea, usar_cache=True):
+    # Corre en los hilos de ejecutar_concurrente: solo llama a la IA (que lanza ErrorIA si falla), no toca la base
+    texto = generar_recomendacion_ia(tarea["materia"], tarea["nota"], tarea["comentario"] or "", usar_cache=usar_cache)
+    if not texto or not texto.strip():
+        raise ValueError("Respuesta vacía")
+    return texto.strip()
+
+
+def _fila(tarea, texto, error):
+    return {"evaluacion_id": tarea["evaluacion_id"], "alumno_id": tarea["alumno_id"], "materia_id": tarea["materia_id"],
+            "version": tarea["version"], "version_intento": tarea["version"], "contenido": texto, "estado": ESTADO_ERROR if error else ESTADO_LISTA,
+            "error": str(error)[:500] if error else None, "intentos": 1 if error else 0, "fecha_generacion": date.today()}
+
+
+def _guardar(conn, filas):
+    # Upsert por evaluacion_id. Un error no pisa el texto ni la versión de una recomendación anterior,
+    # y una generación vieja (si dos procesos tomaron la misma evaluación) no pisa una más nueva.
+    dialecto = conn.dialect.name
+    if dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+    elif dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+    else:
+        return _guardar_sin_upsert(conn, filas)
+    R = Recomendacion.__table__
+    stmt = insert_dialecto(R)
+    nueva = stmt.excluded
+    es_error = nueva.estado == ESTADO_ERROR
+    ultimo_intento = func.coalesce(R.c.version_intento, R.c.version)
+    conn.execute(stmt.on_conflict_do_update(index_elements=["evaluacion_id"], where=or_(ultimo_intento.is_(None), ultimo_intento <= nueva.version), set_={
+        "alumno_id": nueva.alumno_id, "materia_id": nueva.materia_id, "version_intento": nueva.version,
+        "estado": nueva.estado, "error": nueva.error,
+        "version": case((es_error, R.c.version), else_=nueva.version),
+        "contenido": case((es_error, R.c.contenido), else_=nueva.contenido),
+        "fecha_generacion": case((es_error, R.c.fecha_generacion), else_=nueva.fecha_generacion),
+        "intentos": case((es_error, _intentos_tras_error(R, nueva.version)), else_=0),
+    }), filas)
+
+
+def _intentos_tras_error(R, version):
+    # Los errores se cuentan por versión: si la evaluación cambió desde el último intento, se empieza de nuevo
+    return case((func.coalesce(R.c.version_intento, R.c.version) == version, func.coalesce(R.c.intentos, 0) + 1), else_=1)
+
+
+def _guardar_sin_upsert(conn, filas):
+    R = Recomendacion.__table__
+    for f in filas:
+        valores = {k: v for k, v in f.items() if not (f["estado"] == ESTADO_ERROR and k in ("contenido", "fecha_generacion", "intentos", "version"))}
+        if f["estado"] == ESTADO_ERROR:
+            valores["intentos"] = _intentos_tras_error(R, f["version"])
+        if not conn.execute(update(R).where(R.c.evaluacion_id == f["evaluacion_id"]).values(**valores)).rowcount:
+            conn.execute(insert(R).values(**f))
+
+
+def generar_pendientes(session, limite=None, alumno_id=None, max_concurrencia=MAX_CONCURRENCIA, rpm=0,
+                       al_avanzar=None, usar_cache=True, tamano_lote=TAMANO_LOTE_GUARDADO):
+    # Genera hasta `limite` recomendaciones (None = todas las pendientes). Devuelve {"generadas", "errores", "postergadas"}.
+    # al_avanzar(tarea, error) se llama en este hilo después de cada respuesta (barra de progreso).
+    cuenta = {"generadas": 0, "errores": 0, "postergadas": 0}
+    antes_de = None
+    while not cuenta["postergadas"] and (limite is None or sum(cuenta.values()) < limite):
+        cantidad = TAMANO_TANDA if limite is None else min(TAMANO_TANDA, limite - sum(cuenta.values()))
+        tanda = pendientes(session, cantidad, alumno_id, antes_de)
+        if not tanda:
+            break
+        antes_de = tanda[-1]["evaluacion_id"]
+        lote = []
+        try:
+            for tarea, texto, error in ejecutar_concurrente(tanda, partial(_generar, usar_cache=usar_cache), max_concurrencia, rpm):
+                if error is not None and sin_gastar_intento(error):
+                    # La API pidió esperar: queda pendiente sin gastar un intento y no se piden más tandas
+                    cuenta["postergadas"] += 1
+                else:
+                    lote.append(_fila(tarea, texto, error))
+                    cuenta["errores" if error else "generadas"] += 1
+                if al_avanzar: al_avanzar(tarea, error)
+                if len(lote) >= tamano_lote:
+                    _guardar(session.connection(), lote); session.commit(); lote = []
+            if lote:
+                _guardar(session.connection(), lote); session.commit()
+        except Exception:
+            session.rollback()
+            raise
+    return cuenta
+
+
+# --- PASO 3: LEER (lo que usan el dashboard y los informes) ---
+def recomendaciones_de_alumno(session, alumno_id):
+    # [(materia, instancia, nota, recomendación, estado, fecha_generacion, al_día)], en el orden del historial.
+    # al_día = False si la nota o el comentario cambiaron después de generarla (se rehace en la próxima pasada)
+    E, R = Evaluacion.__table__, Recomendacion.__table__
+    q = select(Materia.nombre, E.c.instancia, E.c.nota, R.c.contenido, R.c.estado, R.c.fecha_generacion, R.c.version >= E.c.version) \
+        .select_from(R).join(E, E.c.id == R.c.evaluacion_id).outerjoin(Materia, Materia.id == E.c.materia_id) \
+        .where(R.c.alumno_id == alumno_id, R.c.contenido.isnot(None)).order_by(E.c.fecha, E.c.id)
+    return [tuple(f) for f in session.execute(q)]
+
+
+if __name__ == "__main__":
+    from config_db import crear_engine
+    from crear_base_datos import asegurar_esquema
+    from cache_llm import configurar_cache
+
+    parser = argparse.ArgumentParser(description="Genera las recomendaciones que faltan (o quedaron viejas)")
+    parser.add_argument("--limite", type=int, help="Máximo de recomendaciones a generar")
+    parser.add_argument("--alumno", type=int, help="Solo las de este alumno (id)")
+    parser.add_argument("--concurrencia", type=int, default=MAX_CONCURRENCIA)
+    parser.add_argument("--rpm", type=int, default=0, help="Tope extra de solicitudes por minuto para esta pasada (0 = solo IA_RPM del proceso)")
+    parser.add_argument("--contar", action="store_true", help="Solo mostrar cuántas hay pendientes")
+    args = parser.parse_args()
+
+    engine = crear_engine()
+    asegurar_esquema(engine)
+    configurar_cache(engine)
+    with sessionmaker(bind=engine)() as session:
+        print(f"📋 Pendientes: {contar_pendientes(session, args.alumno)}")
+        if not args.contar:
+            print(f"✅ {generar_pendientes(session, args.limite, args.alumno, args.concurrencia, args.rpm)}")
@@ -0,0 +1,159 @@
+import atexit
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from fpdf import FPDF
+from sqlalchemy import and_
+
+from crear_base_datos import Alumno, Materia, Evaluacion, Recomendacion
+from agregados import NOTA_BAJA
+
+# --- INFORMES EN PDF ---
+# La fuente (fuente.ttf, ~470 KB) se recorta una sola vez por proceso a los caracteres
+# que usamos (latín + puntuación) y todos los informes usan esa versión chica:
+# se lee mucho más rápido y el PDF sale más liviano.
+
+RUTA_FUENTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fuente.ttf")
+CARACTERES_FUENTE = [*range(0x20, 0x250), *range(0x2010, 0x2050), 0x20AC, 0x2122]
+
+_fuente_reducida = {"ruta": None, "probada": False}
+
+
+def _ruta_fuente():
+    # Devuelve la ruta de la fuente recortada (o None si no se puede usar)
+    if not _fuente_reducida["probada"]:
+        _fuente_reducida["probada"] = True
+        try:
+            from fontTools import subset
+            from fontTools.ttLib import TTFont
+            fuente = TTFont(RUTA_FUENTE)
+            opciones = subset.Options(); opciones.notdef_outline = True
+            recorte = subset.Subsetter(opciones); recorte.populate(unicodes=CARACTERES_FUENTE); recorte.subset(fuente)
+            archivo = tempfile.NamedTemporaryFile(prefix="fuente_", suffix=".ttf", delete=False)
+            fuente.save(archivo); archivo.close()
+            atexit.register(os.remove, archivo.name)
+            _fuente_reducida["ruta"] = archivo.name
+        except Exception:
+            _fuente_reducida["ruta"] = RUTA_FUENTE if os.path.exists(RUTA_FUENTE) else None
+    return _fuente_reducida["ruta"]
+
+
+class PDF(FPDF):
+    fuente = "Helvetica"
+
+    def header(self):
+        if self.fuente == "MiFuente": self.set_font("MiFuente", "", 18)
+        else: self.set_font("Helvetica", "B", 15)
+        self.cell(0, 10, "Informe Académico", new_x="LMARGIN", new_y="NEXT", align='C'); self.ln(10)
+
+    def footer(self):
+        self.set_y(-15); self.set_font("Helvetica", "I", 8); self.cell(0, 10, f'Pag {self.page_no()}', align='C')
+
+
+def _nuevo_pdf():
+    pdf = PDF()
+    ruta = _ruta_fuente()
+    try:
+        pdf.add_font("MiFuente", "", ruta); pdf.fuente = "MiFuente"
+    except Exception: pass
+    return pdf
+
+
+def pdf_desde_datos(nombre, año, filas, recomendaciones_ia_texto):
+    # filas: [(materia, instancia, nota, comentario)]. Solo datos simples, así se puede mandar a otro proceso.
+    pdf = _nuevo_pdf(); pdf.add_page()
+    pdf.set_font(pdf.fuente, "", 12)
+    pdf.set_font(size=14, style=""); pdf.cell(0, 10, f"Alumno: {nombre}", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font(size=12); pdf.cell(0, 10, f"Año: {año}º", new_x="LMARGIN", new_y="NEXT"); pdf.ln(5)
+    pdf.cell(0, 10, "Historial:", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_fill_color(240, 240, 240); pdf.set_font(size=10)
+    pdf.cell(40, 10, "Materia", 1, 0, 'C', 1); pdf.cell(40, 10, "Instancia", 1, 0, 'C', 1); pdf.cell(20, 10, "Nota", 1, 0, 'C', 1); pdf.cell(90, 10, "Comentario", 1, 1, 'C', 1)
+    if filas:
+        for materia, instancia, nota, comentario in filas:
+            pdf.cell(40, 10, str(materia)[:20], 1); pdf.cell(40, 10, str(instancia)[:20], 1)
+            pdf.cell(20, 10, str(nota), 1, 0, 'C'); pdf.cell(90, 10, (comentario or "").replace("\n"," ")[:50], 1, 1)
+    else: pdf.cell(0, 10, "Sin datos.", 1, 1)
+    pdf.ln(10); pdf.set_font(size=12); pdf.cell(0, 10, "Análisis IA:", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font(size=11); pdf.multi_cell(0, 8, recomendaciones_ia_texto)
+    return bytes(pdf.output())
+
+
+def con_recomendaciones(texto, recomendaciones):
+    # recomendaciones: [(materia, instancia, recomendación)] ya guardadas en la tabla (ver recomendaciones.py)
+    if not recomendaciones:
+        return texto
+    return texto + "\n\nRecomendaciones:\n" + "\n".join(f"- {m} ({i}): {r}" for m, i, r in recomendaciones)
+
+
+def crear_reporte_pdf(alumno, recomendaciones_ia_texto=None, recomendaciones=()):
+    # Versión de a un alumno (botón "📄 PDF" del dashboard): recibe el Alumno con sus evaluaciones cargadas.
+    # Sin texto se usa el resumen básico; las recomendaciones salen de la tabla, no de una llamada a la IA
+    filas = [(ev.materia.nombre, ev.instancia, ev.nota, ev.comentario) for ev in alumno.evaluaciones]
+    texto = con_recomendaciones(recomendaciones_ia_texto or resumen_basico(filas), recomendaciones)
+    return pdf_desde_datos(alumno.nombre_completo, alumno.año_escolar, filas, texto)
+
+
+# --- INFORMES DE TODO UN CURSO O MATERIA ---
+def datos_para_informes(session, año=None, materia_id=None):
+    # Una sola consulta para todos los alumnos (con la recomendación ya generada de cada nota); se agrupa en Python
+    q = session.query(Alumno.id, Alumno.nombre_completo, Alumno.año_escolar, Materia.nombre, Evaluacion.instancia, Evaluacion.nota, Evaluacion.comentario, Recomendacion.contenido)
+    if materia_id is not None:
+        q = q.join(Evaluacion, Evaluacion.alumno_id == Alumno.id).join(Materia, and_(Materia.id == Evaluacion.materia_id, Materia.id == materia_id))
+    else:
+        # outerjoin: también sale el informe de quien todavía no tiene notas
+        q = q.outerjoin(Evaluacion, Evaluacion.alumno_id == Alumno.id).outerjoin(Materia, Materia.id == Evaluacion.materia_id)
+    if año is not None:
+        q = q.filter(Alumno.año_escolar == año)
+    # Solo las recomendaciones al día: si la nota cambió y todavía no se rehízo, el texto viejo no sale
+    q = q.outerjoin(Recomendacion, and_(Recomendacion.evaluacion_id == Evaluacion.id, Recomendacion.version >= Evaluacion.version))
+    alumnos = {}
+    for a_id, nombre, a_año, materia, instancia, nota, comentario, recomendacion in q.order_by(Alumno.nombre_completo, Alumno.id, Evaluacion.fecha, Evaluacion.id):
+        datos = alumnos.setdefault(a_id, {"id": a_id, "nombre": nombre, "año": a_año, "filas": [], "recomendaciones": []})
+        if materia is not None:
+            datos["filas"].append((materia, instancia, nota, comentario))
+            if recomendacion: datos["recomendaciones"].append((materia, instancia, recomendacion))
+    return list(alumnos.values())
+
+
+def resumen_basico(filas):
+    # Resumen sin IA para los informes en lote (no se hace una llamada a la API por alumno)
+    notas = [f[2] for f in filas if f[2] is not None]
+    if not notas:
+        return "Sin calificaciones registradas."
+    bajas = sorted({f[0] for f in filas if f[2] is not None and f[2] < NOTA_BAJA})
+    texto = f"Promedio general: {sum(notas) / len(notas):.2f} en {len(notas)} evaluaciones."
+    if bajas:
+        texto += f" Requiere seguimiento en: {', '.join(bajas)}."
+    else:
+        texto += " Sin evaluaciones por debajo de 6."
+    return texto
+
+
+def _informe_de_alumno(datos):
+    texto = con_recomendaciones(datos.get("resumen") or resumen_basico(datos["filas"]), datos.get("recomendaciones"))
+    nombre_archivo = f"R_{datos['nombre']}_{datos['id']}.pdf".replace("/", "-").replace("\\", "-")
+    return nombre_archivo, pdf_desde_datos(datos["nombre"], datos["año"], datos["filas"], texto)
+
+
+def generar_informes_zip(alumnos, procesos=None, al_avanzar=None):
+    # Devuelve los bytes de un ZIP con un PDF por alumno (lo que recibe st.download_button).
+    # Se arma en un archivo temporal para no tener cada PDF dos veces en memoria mientras se comprime.
+    # Los PDF se arman en varios procesos; cada uno recorta la fuente una sola vez.
+    salida = tempfile.TemporaryFile(suffix=".zip")
+    procesos = procesos or min(os.cpu_count() or 2, max(1, len(alumnos) // 20), 8)
+    # spawn: procesos limpios (sin copiar los hilos de Streamlit), igual en Windows y Linux
+    pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn")) if procesos > 1 else None
+    try:
+        resultados = pool.map(_informe_de_alumno, alumnos, chunksize=10) if pool else map(_informe_de_alumno, alumnos)
+        with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zf:
+            for hechos, (nombre, contenido) in enumerate(resultados, 1):
+                zf.writestr(nombre, contenido)  # Se van escribiendo a medida que llegan
+                if al_avanzar: al_avanzar(hechos, len(alumnos))
+        salida.seek(0)
+        return salida.read()
+    finally:
+        if pool: pool.shutdown()
+        salida.close()
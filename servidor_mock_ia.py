@@ -0,0 +1,225 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- SERVIDOR FALSO DE LA API DE CHAT (compatible con OpenAI) ---
+# Para medir y ajustar la Corrección Masiva y el chat sin gastar la cuota real.
+# Responde /chat/completions (con y sin stream) con texto inventado, imitando la
+# latencia, la velocidad de tokens, los límites de concurrencia y los errores 429/5xx.
+#     python servidor_mock_ia.py --latencia lognormal:-1.2,0.5 --tokens-por-segundo 40 --tasa-429 0.05
+# y en la app: IA_BASE_URL=http://127.0.0.1:8765/v1 (en secrets o como variable de entorno).
+# GET /estadisticas devuelve los contadores en JSON.
+# Si el prompt es de corrección agrupada ([ALUMNO n] + arreglo JSON) responde un arreglo JSON
+# válido, salvo la fracción --tasa-json-invalido (para probar la vuelta a llamadas individuales).
+
+PALABRAS = ["el", "alumno", "muestra", "buen", "manejo", "del", "tema", "pero", "debe", "repasar", "los", "conceptos",
+            "de", "la", "unidad", "y", "justificar", "mejor", "sus", "respuestas", "con", "ejemplos", "concretos", "."]
+
+
+class Configuracion:
+    def __init__(self, latencia="fija:0.2", tokens_por_segundo=50.0, tokens_respuesta=60, tasa_429=0.0, tasa_5xx=0.0,
+                 retry_after=1, max_concurrencia=0, semilla=None, tasa_json_invalido=0.0):
+        self.muestrear_latencia = _distribucion(latencia)
+        self.descripcion_latencia = latencia
+        self.tokens_por_segundo = tokens_por_segundo  # 0 = sin espera entre tokens
+        self.tokens_respuesta = tokens_respuesta
+        self.tasa_429 = tasa_429
+        self.tasa_5xx = tasa_5xx
+        self.retry_after = retry_after
+        self.max_concurrencia = max_concurrencia      # 0 = sin límite; si se pasa, 429
+        self.tasa_json_invalido = tasa_json_invalido
+        self.azar = random.Random(semilla)
+        self.lock = threading.Lock()
+        self.en_curso = 0
+        self.contadores = {"solicitudes": 0, "ok": 0, "stream": 0, "429": 0, "5xx": 0, "rechazadas_concurrencia": 0, "max_en_curso": 0, "tokens": 0, "tokens_prompt": 0}
+
+    def sumar(self, clave, cantidad=1):
+        with self.lock:
+            self.contadores[clave] += cantidad
+
+    def aleatorio(self):
+        with self.lock:
+            return self.azar.random()
+
+
+def _distribucion(texto):
+    # "fija:0.2" | "uniforme:0.1,0.5" | "normal:0.3,0.1" | "lognormal:mu,sigma" (segundos, nunca negativos)
+    tipo, _, valores = texto.partition(":")
+    nums = [float(v) for v in valores.split(",") if v.strip()] if valores else []
+    azar = random.Random()
+    if tipo == "fija":
+        return lambda: nums[0] if nums else 0.0
+    if tipo == "uniforme":
+        return lambda: azar.uniform(nums[0], nums[1])
+    if tipo == "normal":
+        return lambda: max(0.0, azar.gauss(nums[0], nums[1]))
+    if tipo == "lognormal":
+        return lambda: azar.lognormvariate(nums[0], nums[1])
+    raise ValueError(f"Distribución de latencia desconocida: {texto}")
+
+
+class ManejadorIA(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None  # Lo completa crear_servidor()
+
+    def log_message(self, *args):
+        pass  # Sin una línea por solicitud en la consola
+
+    def _json(self, estado, cuerpo, encabezados=None):
+        datos = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        for k, v in (encabezados or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _error(self, estado, mensaje, tipo, reintentar=False):
+        self._json(estado, {"error": {"message": mensaje, "type": tipo, "code": str(estado)}},
+                   {"Retry-After": str(self.config.retry_after)} if reintentar else None)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/estadisticas"):
+            with self.config.lock:
+                self._json(200, dict(self.config.contadores, en_curso=self.config.en_curso))
+        elif self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "local"}]})
+        else:
+            self._error(404, "Ruta inexistente", "not_found")
+
+    def do_POST(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        try:
+            pedido = json.loads(self.rfile.read(largo) or b"{}")
+        except ValueError:
+            return self._error(400, "JSON inválido", "invalid_request_error")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._error(404, "Ruta inexistente", "not_found")
+
+        c = self.config
+        c.sumar("solicitudes")
+        with c.lock:
+            if c.max_concurrencia and c.en_curso >= c.max_concurrencia:
+                c.contadores["rechazadas_concurrencia"] += 1; c.contadores["429"] += 1
+                rechazar = True
+            else:
+                c.en_curso += 1; c.contadores["max_en_curso"] = max(c.contadores["max_en_curso"], c.en_curso)
+                rechazar = False
+        if rechazar:
+            return self._error(429, "Demasiadas solicitudes simultáneas", "rate_limit_exceeded", reintentar=True)
+        try:
+            sorteo = c.aleatorio()
+            if sorteo < c.tasa_429:
+                c.sumar("429")
+                return self._error(429, "Rate limit simulado", "rate_limit_exceeded", reintentar=True)
+            if sorteo < c.tasa_429 + c.tasa_5xx:
+                c.sumar("5xx")
+                estado = random.choice([500, 502, 503])
+                return self._error(estado, "Falla simulada del servidor", "server_error", reintentar=estado == 503)
+            self._responder(pedido)
+        finally:
+            with c.lock:
+                c.en_curso -= 1
+
+    def _responder(self, pedido):
+        c = self.config
+        cantidad = max(1, min(int(pedido.get("max_tokens") or c.tokens_respuesta), c.tokens_respuesta))
+        tokens = [(" " if i else "") + PALABRAS[i % len(PALABRAS)] for i in range(cantidad)]
+        prompt = str((pedido.get("messages") or [{}])[-1].get("content", ""))
+        alumnos = re.findall(r"\[ALUMNO (\d+)\]", prompt)
+        if alumnos and "JSON" in prompt:
+            devolucion = "".join(tokens)
+            texto = json.dumps([{"alumno": int(n), "devolucion": devolucion} for n in alumnos], ensure_ascii=False)
+            if c.aleatorio() < c.tasa_json_invalido:
+                texto = texto[:len(texto) // 2]  # Cortado a la mitad, como cuando se acaban los tokens
+            tokens = [texto[i:i + 4] for i in range(0, len(texto), 4)]
+            cantidad = len(tokens)
+        modelo = pedido.get("model", "mock")
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": modelo}
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in pedido.get("messages", [])) // 4
+        pausa = 1 / c.tokens_por_segundo if c.tokens_por_segundo else 0
+        time.sleep(c.muestrear_latencia())  # Tiempo hasta el primer token
+        c.sumar("tokens", cantidad); c.sumar("tokens_prompt", prompt_tokens)
+
+        if not pedido.get("stream"):
+            time.sleep(pausa * cantidad)
+            c.sumar("ok")
+            return self._json(200, dict(base, object="chat.completion",
+                                        choices=[{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                                        usage={"prompt_tokens": prompt_tokens, "completion_tokens": cantidad, "total_tokens": prompt_tokens + cantidad}))
+
+        # Stream (SSE): una línea "data:" por token y al final [DONE]. Se cierra la conexión al terminar.
+        c.sumar("stream")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def enviar(choice):
+            self.wfile.write(f"data: {json.dumps(dict(base, object='chat.completion.chunk', choices=[choice]), ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        try:
+            enviar({"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None})
+            for token in tokens:
+                enviar({"index": 0, "delta": {"content": token}, "finish_reason": None})
+                if pausa: time.sleep(pausa)
+            enviar({"index": 0, "delta": {}, "finish_reason": "stop"})
+            self.wfile.write(b"data: [DONE]\n\n"); self.wfile.flush()
+            c.sumar("ok")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # El cliente cortó el stream
+
+
+def crear_servidor(config=None, host="127.0.0.1", puerto=8765):
+    manejador = type("Manejador", (ManejadorIA,), {"config": config or Configuracion()})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def iniciar_en_hilo(config=None, host="127.0.0.1", puerto=0):
+    # Para benchmarks: levanta el servidor en segundo plano (puerto=0 elige uno libre).
+    # Devuelve (servidor, base_url); servidor.shutdown() lo detiene.
+    servidor = crear_servidor(config, host, puerto)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://{host}:{servidor.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor falso compatible con la API de chat de OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", default="fija:0.2", help="fija:S | uniforme:A,B | normal:MEDIA,DESVIO | lognormal:MU,SIGMA")
+    parser.add_argument("--tokens-por-segundo", type=float, default=50.0)
+    parser.add_argument("--tokens-respuesta", type=int, default=60)
+    parser.add_argument("--tasa-429", type=float, default=0.0, help="Fracción de solicitudes que reciben 429")
+    parser.add_argument("--tasa-5xx", type=float, default=0.0, help="Fracción de solicitudes que reciben 500/502/503")
+    parser.add_argument("--retry-after", type=int, default=1, help="Segundos del encabezado Retry-After")
+    parser.add_argument("--max-concurrencia", type=int, default=0, help="Solicitudes simultáneas permitidas (0 = sin límite)")
+    parser.add_argument("--tasa-json-invalido", type=float, default=0.0, help="Fracción de respuestas agrupadas con JSON roto")
+    parser.add_argument("--semilla", type=int)
+    args = parser.parse_args()
+
+    config = Configuracion(args.latencia, args.tokens_por_segundo, args.tokens_respuesta, args.tasa_429, args.tasa_5xx,
+                           args.retry_after, args.max_concurrencia, args.semilla, args.tasa_json_invalido)
+    servidor = crear_servidor(config, args.host, args.puerto)
+    print(f"🧪 Servidor falso de IA en http://{args.host}:{args.puerto}/v1 (latencia {args.latencia}, {args.tokens_por_segundo} tokens/s)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        print(json.dumps(config.contadores, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import io
+import os
+import sys
+import zipfile
+
+from streamlit.testing.v1 import AppTest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportes import generar_informes_zip
+
+ALUMNOS = [
+    {"id": 1, "nombre": "Carlos Ruiz", "año": 2, "filas": [("Historia", "P1", 4.0, "Confunde causas.")],
+     "recomendaciones": [("Historia", "P1", "Repasar las causas de la Revolución Industrial.")]},
+    {"id": 2, "nombre": "Ana Li", "año": 2, "filas": [], "recomendaciones": []},
+]
+
+
+def test_zip_de_informes():
+    contenido = generar_informes_zip(ALUMNOS, procesos=1)
+    assert isinstance(contenido, bytes)
+    with zipfile.ZipFile(io.BytesIO(contenido)) as zf:
+        assert sorted(zf.namelist()) == ["R_Ana Li_2.pdf", "R_Carlos Ruiz_1.pdf"]
+        assert all(zf.read(n).startswith(b"%PDF") for n in zf.namelist())
+
+
+def _pantalla(contenido):
+    import streamlit as st
+    st.download_button("⬇️ Descargar ZIP", contenido, "informes.zip", "application/zip")
+
+
+def test_zip_en_download_button():
+    at = AppTest.from_function(_pantalla, args=(generar_informes_zip(ALUMNOS, procesos=1),))
+    at.run()
+    assert not at.exception
+    assert len(at.get("download_button")) == 1
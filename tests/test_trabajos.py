@@ -0,0 +1,55 @@
+import os
+import sys
+import uuid
+
+import pandas as pd
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_TOKEN", "test")  # modulo_ia_github necesita un token para importarse
+
+import cache_llm
+import cliente_ia
+import trabajos
+from config_db import crear_engine
+from crear_base_datos import Alumno, Materia, asegurar_esquema
+from servidor_mock_ia import Configuracion, iniciar_en_hilo
+
+FILAS = 30
+
+
+def test_correccion_masiva_con_cache(tmp_path, monkeypatch):
+    # SQLite con WAL (como la app): mientras los hilos esperan a la IA el guardado de la corrección
+    # no puede tener tomada la escritura, o las respuestas no entran en la caché
+    engine = crear_engine(f"sqlite:///{tmp_path / 'escuela.db'}")
+    asegurar_esquema(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        materia = Materia(nombre="Biología", profesor_titular="Prof. Test")
+        session.add(materia)
+        session.add_all([Alumno(nombre_completo=f"Alumno {n}", dni=str(40_000_000 + n), año_escolar=2) for n in range(FILAS)])
+        session.commit()
+        materia_id = materia.id
+
+    servidor, base_url = iniciar_en_hilo(Configuracion(latencia="fija:0.05", tokens_por_segundo=0))
+    monkeypatch.setattr(cliente_ia, "_config", {}); monkeypatch.setattr(cliente_ia, "_estado", dict(cliente_ia._estado))
+    cliente_ia.configurar(base_url=base_url, api_key="test", rpm=0)
+    monkeypatch.setitem(cache_llm._config, "Session", None)
+    cache_llm.configurar_cache(engine)
+    antes = cache_llm.estadisticas()
+
+    df = pd.DataFrame({"Nombre": [f"Alumno {n}" for n in range(FILAS)], "Nota": [7] * FILAS,
+                       "Pregunta 1": [f"Respuesta {n} sobre la célula" for n in range(FILAS)]})
+    try:
+        with Session() as session:
+            trabajo, _ = trabajos.crear_trabajo(session, df, session.get(Materia, materia_id), "Parcial 1", "Nombre", "Nota", ["Pregunta 1"],
+                                                huella=uuid.uuid4().hex)
+            trabajos.procesar_trabajo(session, trabajo.id)
+            assert trabajos.progreso(session, trabajo.id) == {"hecho": FILAS}
+    finally:
+        servidor.shutdown()
+
+    despues = cache_llm.estadisticas()
+    assert despues["errores"] == antes["errores"]
+    with Session() as session:
+        assert session.query(cache_llm.RespuestaCacheada).count() == FILAS
@@ -0,0 +1,346 @@
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, update
+
+from crear_base_datos import Alumno, Materia, Evaluacion, Trabajo, ItemTrabajo, RespuestaAgrupada
+import instrumentacion
+import agregados  # noqa: F401 - las notas que se guardan acá actualizan los agregados
+from indice_rag import contexto_relevante
+from modulo_ia_github import responder_chat_educativo, consultar_llama
+from cliente_ia import ErrorPermanente, sin_gastar_intento
+from correccion_agrupada import texto_examen, armar_grupos, prompt_grupo, max_tokens_grupo, leer_devoluciones, FRAGMENTOS_CONTEXTO
+from agrupar_respuestas import agrupar_examen
+from motor_correccion import ejecutar_concurrente, MAX_CONCURRENCIA, TAMANO_LOTE_GUARDADO
+
+# --- CONFIGURACIÓN ---
+MAX_INTENTOS = 3                  # Después de esto la fila queda en "error" para revisar a mano
+DURACION_BLOQUEO = timedelta(minutes=10)
+ESPERA_MINIMA = timedelta(seconds=5)  # Fila postergada por límite de la API sin Retry-After
+ESPERA_EN_LINEA = timedelta(seconds=60)  # Postergaciones más cortas se esperan acá; más largas quedan para el worker
+ESPERA_EN_LINEA_TOTAL = timedelta(minutes=3)  # Tope de todas esas esperas en una llamada (un 429 que no se va no la deja colgada)
+TAMANO_TANDA = 50                 # Filas que toma un worker por vez
+
+ESTADOS_FINALES = ("terminado", "con_errores")
+DEVOLUCION_EN_BLANCO = "Sin respuesta: repasar el tema y volver a intentarlo."
+
+
+def huella_trabajo(contenido, materia_id, instancia, col_nombre, col_nota, cols_preguntas, alumnos_por_llamada=1, agrupar_respuestas=False):
+    # Incluye las opciones que cambian las devoluciones: el mismo archivo corregido de otra forma es otro trabajo
+    # (la concurrencia y el tope por minuto solo cambian la velocidad y no cuentan)
+    h = hashlib.sha256(contenido)
+    h.update(json.dumps([materia_id, instancia, col_nombre, col_nota, list(cols_preguntas), int(alumnos_por_llamada), bool(agrupar_respuestas)],
+                        ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+# --- PASO 1: CREAR EL TRABAJO (una fila de la cola por alumno) ---
+def crear_trabajo(session, df, materia, instancia, col_nombre, col_nota, cols_preguntas, huella,
+                  max_concurrencia=MAX_CONCURRENCIA, rpm=0, alumnos_por_llamada=1, agrupar_respuestas=False):
+    # Si ya existe un trabajo con la misma huella se devuelve ese (no se duplican evaluaciones)
+    existente = session.query(Trabajo).filter_by(huella=huella).first()
+    if existente:
+        return existente, False
+
+    nombres = df[col_nombre].astype(str).unique().tolist()
+    ids_alumnos = dict(session.query(Alumno.nombre_completo, Alumno.id).filter(Alumno.nombre_completo.in_(nombres)).all())
+
+    params = {"cols_preguntas": list(cols_preguntas), "max_concurrencia": int(max_concurrencia), "rpm": int(rpm),
+              "alumnos_por_llamada": int(alumnos_por_llamada), "agrupar_respuestas": bool(agrupar_respuestas)}
+    trabajo = Trabajo(huella=huella, materia_id=materia.id, instancia=instancia, total=len(df))
+    session.add(trabajo); session.flush()
+
+    filas, todos_datos = [], []
+    for n, (_, row) in enumerate(df.iterrows()):
+        nombre = str(row[col_nombre])
+        nota = float(row[col_nota]) if col_nota != "(Sin Nota)" and _es_numero(row[col_nota]) else 0.0
+        datos = {"nombre": nombre, "nota": nota, "respuestas": {str(p): ("" if row[p] != row[p] else str(row[p])) for p in cols_preguntas}}
+        item = {"trabajo_id": trabajo.id, "fila": n, "alumno_id": ids_alumnos.get(nombre), "estado": "pendiente", "intentos": 0}
+        if item["alumno_id"] is None:
+            item["estado"] = "omitido"; item["error"] = "No registrado en sistema"
+        filas.append(item); todos_datos.append(datos)
+
+    if agrupar_respuestas:
+        # Se agrupa una sola vez con todas las filas del archivo; cada fila guarda la clave de su grupo por pregunta
+        a_corregir = [n for n, f in enumerate(filas) if f["estado"] == "pendiente"]
+        claves, grupos, params["deduplicacion"] = agrupar_examen([str(p) for p in cols_preguntas], [todos_datos[n]["respuestas"] for n in a_corregir])
+        for n, claves_fila in zip(a_corregir, claves):
+            todos_datos[n]["claves"] = claves_fila
+        if grupos:
+            session.bulk_insert_mappings(RespuestaAgrupada, [{"trabajo_id": trabajo.id, "clave": clave, "pregunta": g["pregunta"], "texto": g["texto"],
+                                                              "miembros": g["miembros"], "devolucion": DEVOLUCION_EN_BLANCO if g["vacia"] else None}
+                                                             for clave, g in grupos.items()])
+        instrumentacion.contar("correccion_respuestas_total", {"tipo": "total"}, params["deduplicacion"]["respuestas"])
+        instrumentacion.contar("correccion_respuestas_total", {"tipo": "a_corregir"}, params["deduplicacion"]["a_corregir"])
+
+    for item, datos in zip(filas, todos_datos):
+        item["datos"] = json.dumps(datos, ensure_ascii=False)
+    trabajo.parametros = json.dumps(params, ensure_ascii=False)
+    if filas:
+        session.bulk_insert_mappings(ItemTrabajo, filas)
+    session.commit()
+    return trabajo, True
+
+
+def _es_numero(valor):
+    try:
+        float(valor); return valor == valor  # NaN != NaN
+    except (TypeError, ValueError):
+        return False
+
+
+def armar_prompt(session, materia, respuestas):
+    # Solo los fragmentos de la bibliografía que tienen que ver con estas respuestas
+    examen = texto_examen(respuestas)
+    return prompt_con_contexto(contexto_relevante(session, materia, examen, k=FRAGMENTOS_CONTEXTO, sin_resultados="Sin bibliografía."), examen)
+
+
+def prompt_con_contexto(contexto_rag, examen):
+    return f"""
+    Actúa como profesor experto. Tienes este contexto bibliográfico de la materia:
+    {contexto_rag}
+
+    Evalúa las respuestas de este alumno:
+    {examen}
+
+    TAREA:
+    Identifica errores conceptuales basándote en la bibliografía.
+    Si está bien, felicita brevemente.
+    Si está mal, explica por qué citando el tema.
+    Sé directo y constructivo. Máximo 1 párrafo.
+    """
+
+
+# --- PASO 2: TOMAR FILAS (con bloqueo temporal, así dos workers no corrigen lo mismo) ---
+def _tomar_tanda(session, trabajo_id, worker, cantidad):
+    ahora = datetime.now()
+    disponible = or_(ItemTrabajo.estado == "pendiente",
+                     (ItemTrabajo.estado == "en_proceso") & (ItemTrabajo.bloqueado_hasta < ahora))
+    ids = session.query(ItemTrabajo.id).filter(ItemTrabajo.trabajo_id == trabajo_id, disponible).order_by(ItemTrabajo.fila).limit(cantidad).subquery()
+    session.execute(
+        update(ItemTrabajo)
+        .where(ItemTrabajo.id.in_(ids.select()), disponible)
+        .values(estado="en_proceso", worker=worker, bloqueado_hasta=ahora + DURACION_BLOQUEO)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return session.query(ItemTrabajo).filter_by(trabajo_id=trabajo_id, worker=worker, estado="en_proceso").order_by(ItemTrabajo.fila).all()
+
+
+def _marcar(session, item, dueno, **valores):
+    # UPDATE solo si la fila sigue siendo de este worker y el bloqueo no venció: si una tanda tardó más
+    # que DURACION_BLOQUEO otro worker pudo tomarla, y entonces el resultado de este se descarta.
+    # Devuelve True si se escribió (en Postgres la fila queda bloqueada hasta el commit).
+    mia = (ItemTrabajo.id == item.id) & (ItemTrabajo.worker == dueno) & (ItemTrabajo.estado == "en_proceso") & (ItemTrabajo.bloqueado_hasta > datetime.now())
+    return session.execute(update(ItemTrabajo).where(mia).values(**valores).execution_options(synchronize_session=False)).rowcount == 1
+
+
+def _guardar_resultado(session, trabajo, worker, item, nota, devolucion, error):
+    if error is not None and sin_gastar_intento(error):
+        # La API pidió esperar (429) o el disyuntor está abierto: la fila queda tomada hasta
+        # entonces y después se retoma sola, sin gastar un intento
+        return _marcar(session, item, worker, error=str(error), worker=None,  # Sin worker: la próxima tanda de este no la vuelve a traer
+                       bloqueado_hasta=datetime.now() + max(ESPERA_MINIMA, timedelta(seconds=error.espera or 0)))
+    if error is not None:
+        # No se guarda la falla como devolución: la fila vuelve a la cola hasta MAX_INTENTOS
+        # (un error permanente, ej. token inválido, no se reintenta: queda para "Reintentar" a mano)
+        intentos = MAX_INTENTOS if isinstance(error, ErrorPermanente) else (item.intentos or 0) + 1
+        return _marcar(session, item, worker, intentos=intentos, error=str(error), bloqueado_hasta=None,
+                       estado="error" if intentos >= MAX_INTENTOS else "pendiente")
+    # La evaluación y la marca de "hecho" van en la misma transacción, y la evaluación solo se crea
+    # si la marca ganó: nunca se duplica aunque otro worker haya tomado la fila
+    if not _marcar(session, item, worker, estado="hecho", error=None, bloqueado_hasta=None):
+        return False
+    ev = Evaluacion(alumno_id=item.alumno_id, materia_id=trabajo.materia_id, instancia=trabajo.instancia,
+                    nota=nota, comentario=f"[IA FEEDBACK]: {devolucion}", fecha=datetime.now())
+    session.add(ev); session.flush()
+    session.execute(update(ItemTrabajo).where(ItemTrabajo.id == item.id).values(evaluacion_id=ev.id).execution_options(synchronize_session=False))
+    return True
+
+
+def _guardar_lote(session, trabajo, worker, lote):
+    # [(item, nota, devolución, error)] en una sola transacción (igual que recomendaciones.generar_pendientes)
+    try:
+        for item, nota, devolucion, error in lote:
+            gano = _guardar_resultado(session, trabajo, worker, item, nota, devolucion, error)
+            instrumentacion.contar("correccion_filas_total", {"resultado": "perdida" if not gano else "error" if error is not None else "ok"})
+        trabajo.actualizado = datetime.now(); session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+
+def _espera_postergadas(session, trabajo_id):
+    # Segundos hasta que se libere la primera fila postergada por la API (sin worker), o None si no hay
+    # o si falta más que ESPERA_EN_LINEA (la retoma el worker en otra vuelta)
+    hasta = session.query(func.min(ItemTrabajo.bloqueado_hasta)).filter(ItemTrabajo.trabajo_id == trabajo_id, ItemTrabajo.estado == "en_proceso",
+                                                                       ItemTrabajo.worker.is_(None)).scalar()
+    if hasta is None or hasta - datetime.now() > ESPERA_EN_LINEA:
+        return None
+    return max(0.0, (hasta - datetime.now()).total_seconds())
+
+
+def _cerrar_si_termino(session, trabajo):
+    cuenta = progreso(session, trabajo.id)
+    if cuenta.get("pendiente", 0) or cuenta.get("en_proceso", 0):
+        trabajo.estado = "en_proceso"
+    else:
+        trabajo.estado = "con_errores" if cuenta.get("error", 0) else "terminado"
+    trabajo.actualizado = datetime.now()
+    session.commit()
+
+
+def _corregir_fila(tarea):
+    # Corre en los hilos de ejecutar_concurrente; se mide cada fila (con espera de la API incluida)
+    instrumentacion.contar("correccion_llamadas_total", {"modo": "individual"})
+    with instrumentacion.cronometro("correccion_fila_segundos"):
+        return responder_chat_educativo(tarea["nombre"], "Examen", tarea["prompt"])
+
+
+def _corregir_grupo(tarea):
+    instrumentacion.contar("correccion_llamadas_total", {"modo": "agrupada"})
+    with instrumentacion.cronometro("correccion_grupo_segundos"):
+        return consultar_llama(tarea["prompt"], max_tokens=max_tokens_grupo(tarea["grupo"]))
+
+
+def _corregir(session, materia, entradas, params):
+    # entradas: [(clave, datos)] con datos = {"nombre", "respuestas"}. Genera (clave, devolución, error).
+    # La clave es el ItemTrabajo (un alumno) o la RespuestaAgrupada (un grupo de respuestas).
+    if params.get("alumnos_por_llamada", 1) > 1:
+        return _corregir_agrupado(session, materia, entradas, params)
+    return _corregir_de_a_uno(session, materia, entradas, params)
+
+
+def _corregir_de_a_uno(session, materia, filas, params):
+    # Una llamada por entrada
+    tareas = []
+    for clave, datos in filas:
+        with instrumentacion.cronometro("correccion_prompt_segundos"):  # Búsqueda RAG de la fila
+            prompt = armar_prompt(session, materia, datos["respuestas"])
+        tareas.append({"clave": clave, "nombre": datos["nombre"], "prompt": prompt})
+    yield from _resultados_individuales(tareas, params)
+
+
+def _resultados_individuales(tareas, params):
+    for tarea, devolucion, error in ejecutar_concurrente(tareas, _corregir_fila,
+                                                         params.get("max_concurrencia", MAX_CONCURRENCIA), params.get("rpm", 0)):
+        yield tarea["clave"], devolucion, error
+
+
+def _corregir_agrupado(session, materia, filas, params):
+    # Una llamada por grupo de alumnos con el contexto compartido (buscado con las respuestas de todo el grupo).
+    # Las devoluciones que no vengan o no se puedan leer se piden de a una, con el mismo contexto.
+    tareas = []
+    for grupo in armar_grupos(filas, params["alumnos_por_llamada"]):
+        with instrumentacion.cronometro("correccion_prompt_segundos"):
+            examenes = [texto_examen(datos["respuestas"]) for _, datos in grupo]
+            contexto = contexto_relevante(session, materia, "\n".join(examenes), k=FRAGMENTOS_CONTEXTO, sin_resultados="Sin bibliografía.")
+        tareas.append({"grupo": grupo, "examenes": examenes, "contexto": contexto, "prompt": prompt_grupo(contexto, grupo)})
+
+    sueltas = []
+    for tarea, respuesta, error in ejecutar_concurrente(tareas, _corregir_grupo,
+                                                        params.get("max_concurrencia", MAX_CONCURRENCIA), params.get("rpm", 0)):
+        if error is not None:
+            # Falla de la API (no de formato): todo el grupo vuelve a la cola como siempre
+            for clave, _ in tarea["grupo"]:
+                yield clave, None, error
+            continue
+        devoluciones = leer_devoluciones(respuesta, len(tarea["grupo"]))
+        instrumentacion.contar("correccion_json_total", {"resultado": "completo" if len(devoluciones) == len(tarea["grupo"]) else "incompleto"})
+        for n, ((clave, datos), examen) in enumerate(zip(tarea["grupo"], tarea["examenes"]), 1):
+            if n in devoluciones:
+                yield clave, devoluciones[n], None
+            else:
+                sueltas.append({"clave": clave, "nombre": datos["nombre"], "prompt": prompt_con_contexto(tarea["contexto"], examen)})
+    yield from _resultados_individuales(sueltas, params)
+
+
+def _corregir_alumnos(session, materia, filas, params):
+    # Genera (item, nota, devolución, error): una corrección por alumno
+    notas = {item.id: datos["nota"] for item, datos in filas}
+    for item, devolucion, error in _corregir(session, materia, filas, params):
+        yield item, notas[item.id], devolucion, error
+
+
+def _corregir_por_respuestas(session, trabajo, materia, filas, params):
+    # Genera (item, nota, devolución, error). Primero se corrigen los grupos de respuestas de esta
+    # tanda que todavía no tienen devolución (una vez por grupo, aunque tenga 200 alumnos) y
+    # después cada alumno recibe la devolución de cada uno de sus grupos.
+    claves = {c for _, datos in filas for c in datos.get("claves", {}).values()}
+    grupos = {g.clave: g for g in session.query(RespuestaAgrupada).filter(RespuestaAgrupada.trabajo_id == trabajo.id, RespuestaAgrupada.clave.in_(claves))} if claves else {}
+    entradas = [(g, {"nombre": "varios alumnos", "respuestas": {g.pregunta: g.texto}}) for g in grupos.values() if g.devolucion is None]
+    errores = {}
+    for grupo, devolucion, error in _corregir(session, materia, entradas, params):
+        if error is not None: errores[grupo.clave] = error  # Sin devolución: se vuelve a pedir en el próximo intento
+        else: grupo.devolucion = devolucion
+    session.commit()
+
+    for item, datos in filas:
+        claves_fila = datos.get("claves", {})
+        faltan = [c for c in claves_fila.values() if c not in grupos or grupos[c].devolucion is None]
+        if faltan:
+            yield item, datos["nota"], None, errores.get(faltan[0], "Grupo de respuestas sin corregir")
+        else:
+            yield item, datos["nota"], "\n".join(f"• {preg}: {grupos[c].devolucion}" for preg, c in claves_fila.items()), None
+
+
+# --- PASO 3: PROCESAR (lo usa el worker y también el botón "Procesar aquí") ---
+def procesar_trabajo(session, trabajo_id, al_avanzar=None, worker=None, tamano_lote=TAMANO_LOTE_GUARDADO, espera_maxima=ESPERA_EN_LINEA_TOTAL):
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    trabajo = session.get(Trabajo, trabajo_id)
+    if trabajo is None or trabajo.estado in ESTADOS_FINALES:
+        return
+    materia = session.get(Materia, trabajo.materia_id)
+    params = json.loads(trabajo.parametros or "{}")
+    trabajo.estado = "en_proceso"; session.commit()
+
+    esperado = 0.0
+    while True:
+        items = _tomar_tanda(session, trabajo_id, worker, TAMANO_TANDA)
+        if not items:
+            # Solo quedan filas postergadas por la API: se espera acá hasta espera_maxima en total y
+            # después se devuelve el control (quedan en la cola para el worker o el próximo "Procesar")
+            espera = _espera_postergadas(session, trabajo_id)
+            if espera is None or esperado + espera > espera_maxima.total_seconds():
+                break
+            time.sleep(espera + 0.05); esperado += espera + 0.05
+            continue
+        filas = [(item, json.loads(item.datos)) for item in items]
+        if params.get("agrupar_respuestas"):
+            resultados = _corregir_por_respuestas(session, trabajo, materia, filas, params)
+        else:
+            resultados = _corregir_alumnos(session, materia, filas, params)
+
+        # Los resultados quedan en memoria y se escriben de a tamano_lote en una transacción corta: mientras
+        # los hilos esperan a la IA no hay una escritura abierta (en SQLite trabaría a la caché de IA)
+        lote = []
+        for resultado in resultados:
+            lote.append(resultado)
+            if len(lote) >= tamano_lote:
+                _guardar_lote(session, trabajo, worker, lote); lote = []
+            if al_avanzar:
+                al_avanzar(resultado[0])
+        _guardar_lote(session, trabajo, worker, lote)
+
+    _cerrar_si_termino(session, trabajo)
+
+
+# --- CONSULTAS PARA LA PANTALLA ---
+def progreso(session, trabajo_id):
+    return dict(session.query(ItemTrabajo.estado, func.count(ItemTrabajo.id)).filter_by(trabajo_id=trabajo_id).group_by(ItemTrabajo.estado).all())
+
+
+def trabajos_abiertos(session):
+    return session.query(Trabajo).filter(Trabajo.estado.notin_(ESTADOS_FINALES)).order_by(Trabajo.creado).all()
+
+
+def reintentar_errores(session, trabajo_id):
+    # Devuelve a la cola las filas que agotaron sus intentos (ej: después de un corte largo de la API)
+    session.query(ItemTrabajo).filter_by(trabajo_id=trabajo_id, estado="error").update({"estado": "pendiente", "intentos": 0}, synchronize_session=False)
+    session.query(Trabajo).filter_by(id=trabajo_id).update({"estado": "pendiente"}, synchronize_session=False)
+    session.commit()
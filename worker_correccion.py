@@ -0,0 +1,72 @@
+import argparse
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from config_db import crear_engine, sesion
+from crear_base_datos import asegurar_esquema
+from cache_llm import configurar_cache, estadisticas as estadisticas_cache
+from cliente_ia import metricas as metricas_ia
+import instrumentacion
+from trabajos import procesar_trabajo, trabajos_abiertos, progreso
+from recomendaciones import generar_pendientes
+
+# --- WORKER DE CORRECCIÓN MASIVA ---
+# Proceso aparte que va vaciando la cola de trabajos, así la pestaña de Streamlit
+# se puede cerrar sin perder nada. Se corre con:
+#     python worker_correccion.py            (queda esperando trabajos nuevos)
+#     python worker_correccion.py --una-vez  (procesa lo que haya y termina)
+#     python worker_correccion.py --recomendaciones  (además genera las recomendaciones que falten)
+# Usa la misma base que el dashboard: DATABASE_URL (Postgres) o sistema_escolar.db (ver config_db.py).
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Procesa la cola de Corrección Masiva")
+    parser.add_argument("--una-vez", action="store_true", help="Procesar lo pendiente y salir")
+    parser.add_argument("--espera", type=float, default=5.0, help="Segundos entre revisiones de la cola")
+    parser.add_argument("--metricas-puerto", type=int, help="Servir /metrics (Prometheus) en este puerto")
+    parser.add_argument("--metricas-archivo", help="Escribir las métricas en este archivo después de cada vuelta")
+    parser.add_argument("--recomendaciones", action="store_true", help="Generar también las recomendaciones pendientes (ver recomendaciones.py)")
+    parser.add_argument("--recomendaciones-por-vuelta", type=int, default=200, help="Máximo de recomendaciones por vuelta (la corrección no espera tanto)")
+    args = parser.parse_args()
+
+    engine = crear_engine()
+    asegurar_esquema(engine)  # Migraciones pendientes (si el deploy no las corrió); si no, una consulta
+    configurar_cache(engine)
+    instrumentacion.instrumentar_engine(engine)
+    extras = lambda: {**{f"cache_ia_{k}": v for k, v in estadisticas_cache().items()}, **metricas_ia()}
+    if args.metricas_puerto:
+        instrumentacion.iniciar_servidor_metricas(args.metricas_puerto, extras=extras)
+    Session = sessionmaker(bind=engine)
+
+    print("👷 Worker de corrección iniciado.")
+    while True:
+        with sesion(Session) as session:
+            abiertos = [t.id for t in trabajos_abiertos(session)]
+            for trabajo_id in abiertos:
+                print(f"   -> Procesando trabajo #{trabajo_id}...")
+                try:
+                    procesar_trabajo(session, trabajo_id)
+                except Exception as e:
+                    # Las filas tomadas quedan bloqueadas un rato y después se retoman solas
+                    session.rollback()
+                    print(f"   ❌ Trabajo #{trabajo_id} interrumpido: {e}")
+                    continue
+                print(f"   ✅ Trabajo #{trabajo_id}: {progreso(session, trabajo_id)}")
+            if args.recomendaciones:
+                # Después de la corrección (que es lo que el profesor está esperando) y de a una tanda por vuelta
+                try:
+                    cuenta = generar_pendientes(session, args.recomendaciones_por_vuelta)
+                    if any(cuenta.values()): print(f"   💡 Recomendaciones: {cuenta}")
+                except Exception as e:
+                    session.rollback()
+                    print(f"   ❌ Recomendaciones interrumpidas: {e}")
+        if args.metricas_archivo:
+            instrumentacion.escribir_archivo(args.metricas_archivo, extras())
+        if args.una_vez:
+            break
+        time.sleep(args.espera)
+
+
+if __name__ == "__main__":
+    main()